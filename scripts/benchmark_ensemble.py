@@ -0,0 +1,67 @@
+"""
+Compares a committee of TensorChem models evaluated one at a time, each with its own featurization, against a
+TensorChemEnsemble which featurizes once and evaluates every member in one batched pass, for energies and forces.
+
+    python scripts/benchmark_ensemble.py --members 1 4 8 --batch-sizes 32
+"""
+
+import argparse
+
+import torch
+
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+from tensorchem.networks.ensemble import TensorChemEnsemble, evaluate_committee
+from tensorchem.networks.tensormol import TensorChem
+from tensorchem.util.benchmark import random_molecules, time_function, save_results
+
+ELEMENTS = [1, 6, 7, 8]
+
+
+def evaluate_independent(models, sym_func_params, at_nums, coords, forces):
+    for model in models:
+        with torch.set_grad_enabled(forces):
+            positions = coords.detach().requires_grad_(forces)
+            features = get_sym_funcs(sym_func_params, at_nums, positions, model.elements)
+            energies = model(at_nums, features.reshape(at_nums.shape + (-1,)))
+            if forces:
+                torch.autograd.grad(energies.sum(), positions)
+
+
+def run_benchmarks(member_counts, batch_sizes, n_atoms, layers, n_radial, n_repeats=5):
+    sym_func_params = {"r_nought": torch.linspace(0.5, 5.0, n_radial), "eta": torch.tensor(4.0),
+                       "rad_cut": torch.tensor(5.0)}
+    generator = torch.Generator().manual_seed(0)
+    results = []
+    for n_members in member_counts:
+        models = [TensorChem(ELEMENTS, layers, len(ELEMENTS) * n_radial, stacked=True) for _ in range(n_members)]
+        ensemble = TensorChemEnsemble.from_models(models)
+        for batch_size in batch_sizes:
+            at_nums, coords = random_molecules(n_atoms, batch_size, torch.tensor(ELEMENTS), generator=generator)
+            for forces in [False, True]:
+                cases = {"independent": lambda: evaluate_independent(models, sym_func_params, at_nums, coords, forces),
+                         "ensemble": lambda: evaluate_committee(ensemble, sym_func_params, at_nums, coords, forces)}
+                for name, fn in cases.items():
+                    seconds = time_function(fn, n_repeats=n_repeats)
+                    result = {"case": f"{name}_{'forces' if forces else 'energy'}", "n_members": n_members,
+                              "n_atoms": n_atoms, "batch_size": batch_size, "seconds": seconds,
+                              "geometries_per_sec": batch_size / seconds}
+                    print(f"{result['case']:>20} members {n_members:3d} batch {batch_size:5d} "
+                          f"{result['geometries_per_sec']:10.1f} geoms/s {seconds * 1000:9.3f} ms")
+                    results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--n-atoms", type=int, default=30)
+    parser.add_argument("--layers", type=int, nargs="+", default=[256, 128, 64])
+    parser.add_argument("--n-radial", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=None, help="JSON file to save the results to")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.members, args.batch_sizes, args.n_atoms, args.layers, args.n_radial, args.repeats)
+    if args.output is not None:
+        save_results(results, args.output)
@@ -0,0 +1,83 @@
+"""
+Compares the per-molecule latency of the eager featurization plus TensorChem model against the exported TorchScript
+pipeline and the torch.compile pipeline on CPU, for small batches where Python overhead dominates.
+
+    python scripts/benchmark_export.py --batch-sizes 1 8 --n-atoms 3 12
+"""
+
+import argparse
+
+import torch
+
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+from tensorchem.networks.export import TensorChemPipeline, export_pipeline, load_pipeline, compile_pipeline
+from tensorchem.networks.tensormol import TensorChem
+from tensorchem.util.benchmark import random_molecules, time_function, save_results
+
+ELEMENTS = [1, 6, 7, 8]
+
+
+def eager_pipeline(model, sym_func_params, compute_forces):
+    """
+    The unfused path as the InferenceEngine runs it, with separate featurizer and model calls
+    """
+    def evaluate(at_nums, coords):
+        coords = coords.detach().requires_grad_(compute_forces)
+        features = get_sym_funcs(sym_func_params, at_nums, coords, model.elements)
+        energies = model(at_nums, features.reshape(at_nums.shape + (-1,)))
+        if not compute_forces:
+            return energies, None
+        return energies.detach(), -torch.autograd.grad(energies.sum(), coords)[0]
+    return evaluate
+
+
+def run_benchmarks(batch_sizes, atom_counts, layers, n_radial, filename, use_compile=True, n_repeats=20):
+    sym_func_params = {"r_nought": torch.linspace(0.5, 5.0, n_radial), "eta": torch.tensor(4.0),
+                       "rad_cut": torch.tensor(5.0)}
+    model = TensorChem(ELEMENTS, layers, len(ELEMENTS) * n_radial).eval()
+    generator = torch.Generator().manual_seed(0)
+    results = []
+    for compute_forces in [False, True]:
+        export_pipeline(model, sym_func_params, filename, compute_forces)
+        pipelines = {"eager": eager_pipeline(model, sym_func_params, compute_forces),
+                     "eager_fused": TensorChemPipeline(model, sym_func_params, compute_forces),
+                     "scripted": load_pipeline(filename)}
+        if use_compile:
+            pipelines["compiled"] = compile_pipeline(model, sym_func_params, compute_forces)
+        for n_atoms in atom_counts:
+            for batch_size in batch_sizes:
+                at_nums, coords = random_molecules(n_atoms, batch_size, torch.tensor(ELEMENTS), generator=generator)
+                for name, pipeline in pipelines.items():
+                    if compute_forces:
+                        seconds = time_function(lambda: pipeline(at_nums, coords), n_repeats=n_repeats)
+                    else:
+                        with torch.no_grad():
+                            seconds = time_function(lambda: pipeline(at_nums, coords), n_repeats=n_repeats)
+                    result = {"case": f"{name}_{'forces' if compute_forces else 'energy'}", "n_atoms": n_atoms,
+                              "batch_size": batch_size, "seconds": seconds,
+                              "latency_per_molecule_ms": 1000.0 * seconds / batch_size,
+                              "geometries_per_sec": batch_size / seconds}
+                    print(f"{result['case']:>20} atoms {n_atoms:4d} batch {batch_size:4d} "
+                          f"{result['latency_per_molecule_ms']:9.4f} ms/molecule")
+                    results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--n-atoms", type=int, nargs="+", default=[3, 12, 30])
+    parser.add_argument("--layers", type=int, nargs="+", default=[128, 64])
+    parser.add_argument("--n-radial", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--no-compile", action="store_true", help="skip the torch.compile pipeline")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--model-file", default="tensorchem_pipeline.pt", help="file to export the pipeline to")
+    parser.add_argument("--output", default=None, help="JSON file to save the results to")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    results = run_benchmarks(args.batch_sizes, args.n_atoms, args.layers, args.n_radial, args.model_file,
+                             not args.no_compile, args.repeats)
+    if args.output is not None:
+        save_results(results, args.output)
@@ -0,0 +1,103 @@
+"""
+Benchmarks the featurization hot path over synthetic molecules of several sizes, batch sizes and thread counts.
+Records throughput and peak RSS for each case and optionally flags regressions against a stored baseline JSON.
+
+    python scripts/benchmark_featurizers.py --output bench.json
+    python scripts/benchmark_featurizers.py --baseline bench.json --tolerance 0.1
+"""
+
+import sys
+import argparse
+
+import torch
+
+from tensorchem.featurizers.util import dist_matrix_dense, cos_cutoff, gaussian_embed
+from tensorchem.featurizers.neighbors import neighbor_list
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs, get_sym_funcs_pbc
+from tensorchem.util.benchmark import random_molecules, reset_peak_rss, peak_rss_mb, time_function, \
+    save_results, load_results, compare_to_baseline
+
+ELEMENTS = torch.tensor([1, 6, 7, 8, 9, 14, 15, 16, 17, 35, 53, 5, 34])
+SYM_FUNC_PARAMS = {'r_nought': torch.linspace(0.5, 5.0, 32), 'eta': torch.tensor(8.0), 'rad_cut': 5.0}
+
+
+def featurizer_cases(at_nums, coords, precision, dense=True):
+    """
+    Functions to benchmark, each taking no arguments and featurizing the whole batch. The cases built on dense
+    Na x Na pair tensors are left out unless dense is set.
+    """
+    params = SYM_FUNC_PARAMS
+    cases = {
+        "neighbor_list": lambda: [neighbor_list(xyz, params['rad_cut']) for xyz in coords],
+        "get_sym_funcs_pbc": lambda: [get_sym_funcs_pbc(params, z, xyz, ELEMENTS, precision=precision)
+                                      for z, xyz in zip(at_nums, coords)],
+    }
+    if dense:
+        dist = dist_matrix_dense(coords)
+        cases.update({
+            "dist_matrix_dense": lambda: dist_matrix_dense(coords),
+            "cos_cutoff": lambda: cos_cutoff(dist, params['rad_cut']),
+            "gaussian_embed": lambda: gaussian_embed(dist, params['r_nought'], params['eta']),
+            "get_sym_funcs": lambda: get_sym_funcs(params, at_nums, coords, ELEMENTS, precision=precision),
+        })
+    return cases
+
+
+def run_benchmarks(sizes, batch_sizes, thread_counts, cases=None, precision=None, max_pair_elements=2 ** 28,
+                   n_repeats=5):
+    generator = torch.Generator().manual_seed(0)
+    n_gauss = SYM_FUNC_PARAMS['r_nought'].shape[0]
+    results = []
+    for n_atoms in sizes:
+        for batch_size in batch_sizes:
+            # Skip dense cases which would not fit in memory, the pair embedding is the largest tensor. The neighbor
+            # list cases are meant for these sizes and still run
+            dense = batch_size * n_atoms * n_atoms * n_gauss <= max_pair_elements
+            if not dense:
+                print(f"Skipping dense cases for {n_atoms} atoms x {batch_size} batch, pair tensors are too large")
+            at_nums, coords = random_molecules(n_atoms, batch_size, ELEMENTS, generator=generator)
+            for name, fn in featurizer_cases(at_nums, coords, precision, dense).items():
+                if cases is not None and name not in cases:
+                    continue
+                for threads in thread_counts:
+                    torch.set_num_threads(threads)
+                    reset_peak_rss()
+                    seconds = time_function(fn, n_repeats=n_repeats, n_warmup=1)
+                    result = {"case": name, "n_atoms": n_atoms, "batch_size": batch_size, "threads": threads,
+                              "precision": precision, "seconds": seconds,
+                              "geometries_per_sec": batch_size / seconds,
+                              "atoms_per_sec": batch_size * n_atoms / seconds, "peak_rss_mb": peak_rss_mb()}
+                    print(f"{name:>18} atoms {n_atoms:5d} batch {batch_size:4d} threads {threads:3d} "
+                          f"{result['geometries_per_sec']:12.1f} geoms/s {result['atoms_per_sec']:12.1f} atoms/s "
+                          f"{result['peak_rss_mb']:9.1f} MB")
+                    results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 10, 30, 100, 300, 1000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 512])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, torch.get_num_threads()])
+    parser.add_argument("--cases", nargs="+", default=None, help="only run these featurizers")
+    parser.add_argument("--precision", default=None, help="featurization precision policy")
+    parser.add_argument("--max-pair-elements", type=int, default=2 ** 28)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=None, help="JSON file to save the results to, e.g. as a new baseline")
+    parser.add_argument("--baseline", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="fractional slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.batch_sizes, sorted(set(args.threads)), args.cases, args.precision,
+                             args.max_pair_elements, args.repeats)
+    if args.output is not None:
+        save_results(results, args.output)
+    if args.baseline is not None:
+        comparisons = compare_to_baseline(results, load_results(args.baseline), tolerance=args.tolerance)
+        regressions = [c for c in comparisons if c["regression"]]
+        for c in comparisons:
+            flag = "REGRESSION" if c["regression"] else ""
+            print(f"{c['key']:>40} {c['baseline']:12.1f} -> {c['value']:12.1f} ({c['ratio']:5.2f}x) {flag}")
+        print(f"{len(regressions)} regressions in {len(comparisons)} cases compared to {args.baseline}")
+        if regressions:
+            sys.exit(1)
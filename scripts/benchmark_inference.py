@@ -0,0 +1,53 @@
+"""
+Reports per batch size latency and throughput of the InferenceEngine on synthetic geometries of mixed sizes, for a
+trained checkpoint or a freshly initialized model.
+
+    python scripts/benchmark_inference.py --checkpoint model.pt --batch-sizes 1 8 32 128
+"""
+
+import argparse
+
+import torch
+
+from tensorchem.molecules import Geometry
+from tensorchem.networks.inference import InferenceEngine
+from tensorchem.networks.tensormol import TensorChem
+from tensorchem.util.benchmark import random_molecules
+
+ELEMENTS = [1, 6, 7, 8]
+SYM_FUNC_PARAMS = {'r_nought': torch.linspace(0.5, 5.0, 32), 'eta': 8.0, 'rad_cut': 5.0}
+
+
+def synthetic_geometries(n_geometries, sizes, elements, generator):
+    geometries = []
+    for i in range(n_geometries):
+        at_nums, coords = random_molecules(sizes[i % len(sizes)], 1, elements, generator=generator)
+        geometries.append(Geometry(at_nums[0].to(torch.uint8), coords[0]))
+    return geometries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 30, 50])
+    parser.add_argument("--n-geometries", type=int, default=256)
+    parser.add_argument("--energies-only", action="store_true")
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    if args.checkpoint is None:
+        model = TensorChem(ELEMENTS, [256, 128, 64], len(ELEMENTS) * SYM_FUNC_PARAMS['r_nought'].shape[0])
+    for batch_size in args.batch_sizes:
+        if args.checkpoint is None:
+            engine = InferenceEngine(model, SYM_FUNC_PARAMS, batch_size=batch_size, max_batch_atoms=2 ** 20)
+        else:
+            engine = InferenceEngine.from_checkpoint(args.checkpoint, batch_size=batch_size, max_batch_atoms=2 ** 20)
+        elements = engine.elements.cpu()
+        geometries = synthetic_geometries(args.n_geometries, args.sizes, elements, generator)
+        engine.evaluate(geometries[:batch_size], forces=not args.energies_only)  # warmup
+        engine.stats.clear()
+        engine.evaluate(geometries, forces=not args.energies_only)
+        for size, r in engine.report().items():
+            print(f"batch {size:5d} x {r['batches']:4d} latency {r['latency_ms']:9.3f} ms "
+                  f"{r['geometries_per_sec']:10.1f} geoms/s {r['atoms_per_sec']:12.1f} atoms/s")
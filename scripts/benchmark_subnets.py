@@ -0,0 +1,67 @@
+"""
+Compares the per-element grouped SubNet loop against the StackedSubNet batched matmul on CPU for different numbers
+of elements, batch sizes and thread counts, for the forward pass alone and forward plus backward.
+
+    python scripts/benchmark_subnets.py --elements 4 13 --batch-sizes 32 256
+"""
+
+import argparse
+
+import torch
+
+from tensorchem.networks.tensormol import TensorChem
+from tensorchem.util.benchmark import random_molecules, time_function, reset_peak_rss, peak_rss_mb, save_results
+
+ALL_ELEMENTS = [1, 6, 7, 8, 9, 14, 15, 16, 17, 35, 53, 5, 34]
+
+
+def run_benchmarks(element_counts, batch_sizes, thread_counts, n_atoms, layers, input_size, n_repeats=10):
+    generator = torch.Generator().manual_seed(0)
+    results = []
+    for n_elements in element_counts:
+        elements = ALL_ELEMENTS[:n_elements]
+        grouped = TensorChem(elements, layers, input_size)
+        models = {"grouped": grouped, "stacked": grouped.to_stacked()}
+        for batch_size in batch_sizes:
+            at_nums, _ = random_molecules(n_atoms, batch_size, torch.tensor(elements), generator=generator)
+            features = torch.rand(batch_size, n_atoms, input_size, generator=generator)
+            for name, model in models.items():
+                def forward():
+                    with torch.no_grad():
+                        model(at_nums, features)
+
+                def backward():
+                    model.zero_grad()
+                    model(at_nums, features).sum().backward()
+
+                for mode, fn in [("forward", forward), ("backward", backward)]:
+                    for threads in thread_counts:
+                        torch.set_num_threads(threads)
+                        reset_peak_rss()
+                        seconds = time_function(fn, n_repeats=n_repeats)
+                        result = {"case": f"{name}_{mode}", "n_elements": n_elements, "n_atoms": n_atoms,
+                                  "batch_size": batch_size, "threads": threads, "seconds": seconds,
+                                  "geometries_per_sec": batch_size / seconds,
+                                  "atoms_per_sec": batch_size * n_atoms / seconds, "peak_rss_mb": peak_rss_mb()}
+                        print(f"{result['case']:>16} elements {n_elements:3d} batch {batch_size:5d} threads "
+                              f"{threads:3d} {result['atoms_per_sec']:12.1f} atoms/s {seconds * 1000:9.3f} ms")
+                        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, nargs="+", default=[2, 4, 8, 13])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 256])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, torch.get_num_threads()])
+    parser.add_argument("--n-atoms", type=int, default=30)
+    parser.add_argument("--layers", type=int, nargs="+", default=[256, 128, 64])
+    parser.add_argument("--input-size", type=int, default=13 * 32)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default=None, help="JSON file to save the results to")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.elements, args.batch_sizes, sorted(set(args.threads)), args.n_atoms, args.layers,
+                             args.input_size, args.repeats)
+    if args.output is not None:
+        save_results(results, args.output)
@@ -0,0 +1,83 @@
+"""
+Compares the accuracy and throughput of the featurization precision policies against the float64 reference on the
+test molecules. Water clusters built from the tests/data/h2o.mset geometry stand in for larger molecules.
+"""
+
+import argparse
+import json
+import time
+
+import torch
+
+from tensorchem.molecules import Molecule
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+from tensorchem.featurizers.util import PRECISION_POLICIES
+
+
+def water_cluster(water, n_waters, spacing=3.0):
+    """
+    Places randomly rotated copies of a water geometry on a cubic grid
+    """
+    grid = int(round(n_waters ** (1.0 / 3.0) + 0.5))
+    at_nums, coords = [], []
+    for n in range(n_waters):
+        rotation, _ = torch.linalg.qr(torch.randn(3, 3, dtype=torch.float64))
+        offset = torch.tensor([n // grid ** 2, (n // grid) % grid, n % grid], dtype=torch.float64) * spacing
+        at_nums.append(water.atoms.long())
+        coords.append(water.xyz.double() @ rotation + offset)
+    return torch.cat(at_nums), torch.cat(coords)
+
+
+def precision_report(molecules, params, elements, batch_size=32, n_repeats=5):
+    report = {}
+    for name, (at_nums, coords) in molecules.items():
+        batch_at_nums = at_nums.expand(batch_size, -1)
+        batch_coords = coords.expand(batch_size, -1, -1)
+        reference = get_sym_funcs(params, batch_at_nums, batch_coords, elements, precision="float64")
+        scale = reference.abs().max()
+        report[name] = {}
+        for precision in PRECISION_POLICIES.keys():
+            features = get_sym_funcs(params, batch_at_nums, batch_coords, elements, precision=precision)
+            start = time.perf_counter()
+            for _ in range(n_repeats):
+                get_sym_funcs(params, batch_at_nums, batch_coords, elements, precision=precision)
+            elapsed = (time.perf_counter() - start) / n_repeats
+            error = (features.double() - reference).abs()
+            report[name][precision] = {
+                "max_abs_error": error.max().item(),
+                "mean_abs_error": error.mean().item(),
+                "max_rel_error": (error.max() / scale).item(),
+                "geometries_per_sec": batch_size / elapsed,
+                "feature_bytes": features.element_size() * features.nelement()
+            }
+    return report
+
+
+def print_report(report):
+    print(f"{'molecule':>12} {'precision':>10} {'max abs err':>12} {'mean abs err':>12} {'max rel err':>12} "
+          f"{'geoms/s':>10} {'MB':>8}")
+    for name, results in report.items():
+        for precision, r in results.items():
+            print(f"{name:>12} {precision:>10} {r['max_abs_error']:12.3e} {r['mean_abs_error']:12.3e} "
+                  f"{r['max_rel_error']:12.3e} {r['geometries_per_sec']:10.1f} {r['feature_bytes'] / 2 ** 20:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mset", default="tests/data/h2o.mset")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", default=None, help="optional JSON file to write the report to")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    with open(args.mset) as f:
+        water = Molecule.from_json(json.load(f)).geometries[0]
+    molecules = {"h2o": (water.atoms.long(), water.xyz.double())}
+    for n_waters in [8, 27, 64]:
+        molecules[f"(h2o){n_waters}"] = water_cluster(water, n_waters)
+    sym_func_params = {'r_nought': torch.linspace(0.5, 5.0, 32), 'eta': torch.tensor(8.0), 'rad_cut': 5.0}
+    report = precision_report(molecules, sym_func_params, torch.tensor([1, 8]), args.batch_size)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
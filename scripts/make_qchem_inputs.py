@@ -0,0 +1,47 @@
+"""
+Writes Q-Chem single point inputs for every geometry of a directory of msets, optionally packing many jobs into each
+multi-job input file so that each cluster job runs a batch of single points.
+
+    python scripts/make_qchem_inputs.py sampled/ qchem/ --jobs-per-file 50 --read-guess
+"""
+
+import argparse
+import glob
+import os
+
+from tensorchem.molecules import Molecule
+from tensorchem.util.qchem import DEFAULT_REM, write_molecule_inputs
+
+
+def main(args):
+    rem = dict(DEFAULT_REM, jobtype=args.jobtype, method=args.method, basis=args.basis)
+    template = None
+    if args.template is not None:
+        with open(args.template) as f:
+            template = f.read()
+    n_geometries = n_files = 0
+    for filename in sorted(glob.glob(os.path.join(args.mset_path, "*.mset"))):
+        molecule = Molecule()
+        molecule.load(os.path.basename(filename), args.mset_path)
+        out_path = os.path.join(args.out_path, os.path.splitext(os.path.basename(filename))[0])
+        n_files += len(write_molecule_inputs(molecule, out_path, multiplicity=args.multiplicity, rem=rem,
+                                             jobs_per_file=args.jobs_per_file, template=template,
+                                             read_guess=args.read_guess))
+        n_geometries += len(molecule.geometries)
+    print(f"Wrote {n_geometries} jobs to {n_files} inputs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mset_path", help="directory of msets")
+    parser.add_argument("out_path", help="directory to write the inputs to, with a subdirectory per mset")
+    parser.add_argument("--jobs-per-file", type=int, default=1, help="single points packed into each input")
+    parser.add_argument("--read-guess", action="store_true",
+                        help="start each packed job from the orbitals of the job before")
+    parser.add_argument("--template", default=None,
+                        help="file with a string.Template input using $molecule, $rem, $name and $coordinates")
+    parser.add_argument("--multiplicity", type=int, default=1)
+    parser.add_argument("--jobtype", default=DEFAULT_REM["jobtype"])
+    parser.add_argument("--method", default=DEFAULT_REM["method"])
+    parser.add_argument("--basis", default=DEFAULT_REM["basis"])
+    main(parser.parse_args())
@@ -0,0 +1,62 @@
+"""
+Quantizes the subnets of a TensorChem checkpoint to int8 and reports the energy and force differences against the
+float32 model on the validation split of its training data, along with the energy throughput of both models. The
+quantized model can be exported as an energy only TorchScript pipeline.
+
+    python scripts/quantize_tensorchem.py model.pt data.pt --mode static --export model_int8.pt
+"""
+
+import argparse
+
+import torch
+from torch.utils.data import random_split
+
+from tensorchem.dataset.dataset import MixedDataset
+from tensorchem.molecules import Geometry
+from tensorchem.networks.export import export_pipeline
+from tensorchem.networks.inference import InferenceEngine
+from tensorchem.networks.quantization import QUANTIZATION_MODES, quantize_model, calibration_batches, \
+    quantization_report
+from tensorchem.networks.tensormol import DEFAULT_HYPER_PARAMS
+
+
+def to_geometries(samples, hyper_params):
+    geometries = []
+    for sample in samples:
+        at_nums = sample[hyper_params['atomic_num_key']]
+        n_atoms = int(torch.count_nonzero(at_nums))
+        geometries.append(Geometry(at_nums[:n_atoms].to(torch.uint8), sample[hyper_params['coords_key']][:n_atoms]))
+    return geometries
+
+
+def main(args):
+    engine = InferenceEngine.from_checkpoint(args.checkpoint, batch_size=args.batch_size)
+    hyper_params = dict(DEFAULT_HYPER_PARAMS, **torch.load(args.checkpoint, map_location="cpu")["hyper_params"])
+    dataset = MixedDataset()
+    dataset.load(args.dataset)
+    # The same split as TensorChemTrainer, so the report is on data the model was not trained on
+    n_valid = int(round(len(dataset) * hyper_params['validation_split']))
+    train_data, valid_data = random_split(dataset, [len(dataset) - n_valid, n_valid],
+                                          generator=torch.Generator().manual_seed(hyper_params['seed']))
+    calibration = to_geometries([train_data[i] for i in range(min(args.n_calibration, len(train_data)))],
+                                hyper_params)
+    quantized = quantize_model(engine.model, args.mode, calibration_batches(engine, calibration))
+    geometries = to_geometries(valid_data, hyper_params)
+    energies = torch.tensor([float(sample[hyper_params['energy_key']]) for sample in valid_data])
+    report = quantization_report(engine.model, quantized, hyper_params['sym_func_params'], geometries, energies,
+                                 batch_size=args.batch_size)
+    for key, value in report.items():
+        print(f"{key:>36} {value:.6g}")
+    if args.export is not None:
+        export_pipeline(quantized, hyper_params['sym_func_params'], args.export, compute_forces=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checkpoint", help="checkpoint saved by TensorChemTrainer")
+    parser.add_argument("dataset", help="MixedDataset file the model was trained on")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default="dynamic")
+    parser.add_argument("--n-calibration", type=int, default=512, help="training geometries to calibrate on")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--export", default=None, help="file to export the quantized energy pipeline to")
+    main(parser.parse_args())
@@ -0,0 +1,52 @@
+"""
+Relaxes the last geometry of every mset in a directory on a trained TensorChem model, optimizing all molecules
+together in batches, and writes the msets with the OptTrajectory of their relaxation added.
+
+    python scripts/relax_msets.py model.pt msets/ relaxed/ --algorithm lbfgs --fmax 1e-3 --batch-size 512
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from tensorchem.molecules import Molecule
+from tensorchem.molecules.optimization import OPTIMIZERS, optimize_geometries
+from tensorchem.networks.inference import InferenceEngine
+
+
+def main(args):
+    engine = InferenceEngine.from_checkpoint(args.checkpoint, device=args.device)
+    names = [os.path.basename(filename) for filename in sorted(glob.glob(os.path.join(args.mset_path, "*.mset")))]
+    os.makedirs(args.out_path, exist_ok=True)
+    start = time.perf_counter()
+    n_converged = 0
+    for batch_start in range(0, len(names), args.batch_size):
+        molecules = []
+        for name in names[batch_start:batch_start + args.batch_size]:
+            molecule = Molecule()
+            molecule.load(name, args.mset_path)
+            molecules.append(molecule)
+        trajectories, converged = optimize_geometries(engine.evaluate_batch, [mol.geometries[-1] for mol in molecules],
+                                                      args.algorithm, max_steps=args.max_steps,
+                                                      record_every=args.record_every, fmax=args.fmax,
+                                                      device=args.device)
+        n_converged += int(converged.sum())
+        for name, molecule, trajectory in zip(names[batch_start:], molecules, trajectories):
+            molecule.trajectories.append(trajectory)
+            molecule.save(name, args.out_path)
+    print(f"Relaxed {len(names)} molecules in {time.perf_counter() - start:.1f} s, {n_converged} converged")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checkpoint", help="checkpoint saved by TensorChemTrainer")
+    parser.add_argument("mset_path", help="directory of msets to relax")
+    parser.add_argument("out_path", help="directory to write the msets with their optimizations to")
+    parser.add_argument("--algorithm", choices=list(OPTIMIZERS.keys()), default="lbfgs")
+    parser.add_argument("--fmax", type=float, default=1e-3, help="largest atomic force at convergence, Hartree/A")
+    parser.add_argument("--max-steps", type=int, default=500)
+    parser.add_argument("--record-every", type=int, default=10, help="steps between recorded geometries")
+    parser.add_argument("--batch-size", type=int, default=512, help="molecules optimized together")
+    parser.add_argument("--device", default="cpu")
+    main(parser.parse_args())
@@ -0,0 +1,60 @@
+"""
+Runs Langevin dynamics with a trained TensorChem model from the first geometry of every mset in a directory, with
+several replicas per molecule integrated together as one batch, and writes the msets with an MDTrajectory for each
+replica added.
+
+    python scripts/run_dynamics.py model.pt msets/ md/ --replicas 16 --steps 2000 --stride 20 --temperature 500
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import torch
+
+from tensorchem.molecules import Molecule
+from tensorchem.molecules.dynamics import MolecularDynamics
+from tensorchem.networks.inference import InferenceEngine
+
+
+def main(args):
+    torch.manual_seed(args.seed)
+    engine = InferenceEngine.from_checkpoint(args.checkpoint, device=args.device)
+    names = [os.path.basename(filename) for filename in sorted(glob.glob(os.path.join(args.mset_path, "*.mset")))]
+    molecules = []
+    for name in names:
+        molecule = Molecule()
+        molecule.load(name, args.mset_path)
+        molecules.append(molecule)
+    starts = [molecule.geometries[0] for molecule in molecules for _ in range(args.replicas)]
+    at_nums, coords = engine.collate(starts)
+    md = MolecularDynamics(engine.evaluate_batch, at_nums, coords, timestep=args.timestep,
+                           temperature=args.temperature, friction=args.friction,
+                           generator=torch.Generator().manual_seed(args.seed), device=args.device)
+    start = time.perf_counter()
+    trajectories = md.run(args.steps, stride=args.stride, buffer_size=args.buffer_size)
+    seconds = time.perf_counter() - start
+    print(f"{len(starts)} replicas, {args.steps} steps in {seconds:.1f} s "
+          f"({args.steps / seconds:.1f} steps/sec, {len(starts) * args.steps / seconds:.0f} replica steps/sec)")
+    os.makedirs(args.out_path, exist_ok=True)
+    for i, (name, molecule) in enumerate(zip(names, molecules)):
+        molecule.trajectories.extend(trajectories[i * args.replicas:(i + 1) * args.replicas])
+        molecule.save(name, args.out_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checkpoint", help="checkpoint saved by TensorChemTrainer")
+    parser.add_argument("mset_path", help="directory of msets to start from")
+    parser.add_argument("out_path", help="directory to write the msets with their MD trajectories to")
+    parser.add_argument("--replicas", type=int, default=8, help="replicas per molecule")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--stride", type=int, default=10, help="steps between recorded frames")
+    parser.add_argument("--buffer-size", type=int, default=100, help="frames buffered before writing")
+    parser.add_argument("--timestep", type=float, default=0.5, help="time step in fs")
+    parser.add_argument("--temperature", type=float, default=300.0, help="temperature in K")
+    parser.add_argument("--friction", type=float, default=0.01, help="Langevin friction in 1/fs, 0 for NVE")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    main(parser.parse_args())
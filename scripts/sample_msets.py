@@ -0,0 +1,55 @@
+"""
+Normal Mode Sampling of the conformers in a directory of msets over a pool of worker processes. The sampled msets are
+written to the output directory as each one finishes, and are the same for any number of workers. With --filter,
+samples with atoms too close together or with bonds formed or broken are oversampled and dropped.
+
+    python scripts/sample_msets.py msets/ sampled/ --n-samples 1000 --temperature 300 --workers 8 --filter
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from tensorchem.molecules.sampling import sample_msets
+
+
+def main(args):
+    filenames = sorted(glob.glob(os.path.join(args.mset_path, "*.mset")))
+    start = time.perf_counter()
+    filter_kwargs = None
+    if args.filter:
+        filter_kwargs = {"oversample": args.oversample, "max_draw": args.max_draw, "min_scale": args.min_scale,
+                         "bond_scale": args.bond_scale}
+    total, total_rejected = 0, 0
+    for i, (name, n_conformers, n_geometries, n_rejected) in enumerate(
+            sample_msets(filenames, args.out_path, args.n_samples, args.temperature, seed=args.seed,
+                         filter_kwargs=filter_kwargs, n_workers=args.workers, chunksize=args.chunksize)):
+        total += n_geometries
+        total_rejected += n_rejected
+        print(f"[{i + 1}/{len(filenames)}] {name}: {n_conformers} conformers, {n_geometries} geometries, "
+              f"{n_rejected} rejected")
+    seconds = time.perf_counter() - start
+    print(f"Sampled {total} geometries in {seconds:.1f} s ({total / max(seconds, 1e-9):.0f} geometries/sec)")
+    if args.filter:
+        print(f"Rejected {total_rejected} of {total + total_rejected} samples "
+              f"({100.0 * total_rejected / max(total + total_rejected, 1):.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mset_path", help="directory of msets with normal modes and force constants labels")
+    parser.add_argument("out_path", help="directory to write the sampled msets to")
+    parser.add_argument("--n-samples", type=int, default=1000, help="geometries sampled per conformer")
+    parser.add_argument("--temperature", type=float, default=300.0, help="sampling temperature in K")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filter", action="store_true", help="drop implausible samples")
+    parser.add_argument("--oversample", type=float, default=1.2, help="samples drawn per sample needed when filtering")
+    parser.add_argument("--max-draw", type=int, default=10000, help="samples drawn per round at most when filtering")
+    parser.add_argument("--min-scale", type=float, default=0.6,
+                        help="fraction of the summed covalent radii below which atoms are too close")
+    parser.add_argument("--bond-scale", type=float, default=1.2,
+                        help="multiple of the summed covalent radii below which atoms are bonded")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, defaults to the CPU count")
+    parser.add_argument("--chunksize", type=int, default=1, help="msets sent to a worker at once")
+    main(parser.parse_args())
@@ -0,0 +1,49 @@
+"""
+Scores the geometries of a directory of msets by the disagreement of an ensemble of TensorChem models on a process
+pool, and writes Q-Chem inputs for the most uncertain diverse geometries to label next.
+
+    python scripts/select_active_learning.py sampled/ qchem/ --checkpoints model_0.pt model_1.pt model_2.pt -k 1000
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from tensorchem.networks.active_learning import DISAGREEMENT_METRICS, mset_candidates, select_candidates, \
+    write_selection
+from tensorchem.util.qchem import DEFAULT_REM
+
+
+def main(args):
+    filenames = sorted(glob.glob(os.path.join(args.mset_path, "*.mset")))
+    start = time.perf_counter()
+    selected, n_scored = select_candidates(args.checkpoints, mset_candidates(filenames), args.k, metric=args.metric,
+                                           min_rmsd=args.min_rmsd, pool_factor=args.pool_factor,
+                                           chunk_size=args.chunk_size, batch_size=args.batch_size,
+                                           n_workers=args.workers, n_threads=args.threads)
+    seconds = time.perf_counter() - start
+    print(f"Scored {n_scored} candidates in {seconds:.1f} s ({n_scored / max(seconds, 1e-9):.0f} candidates/sec)")
+    if selected:
+        print(f"Selected {len(selected)} with disagreement {selected[-1][0]:.4g} to {selected[0][0]:.4g}")
+    rem = dict(DEFAULT_REM, method=args.method, basis=args.basis)
+    write_selection(selected, args.out_path, rem)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mset_path", help="directory of msets with candidate geometries")
+    parser.add_argument("out_path", help="directory to write the Q-Chem inputs to")
+    parser.add_argument("--checkpoints", nargs="+", required=True, help="checkpoints of the ensemble members")
+    parser.add_argument("-k", type=int, default=1000, help="number of geometries to select")
+    parser.add_argument("--metric", choices=DISAGREEMENT_METRICS, default="force")
+    parser.add_argument("--min-rmsd", type=float, default=0.1,
+                        help="smallest aligned RMSD between selected geometries of a molecule, in angstrom")
+    parser.add_argument("--pool-factor", type=int, default=4, help="multiple of k kept for the diversity selection")
+    parser.add_argument("--chunk-size", type=int, default=256, help="candidates sent to a worker at once")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, defaults to the CPU count")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--method", default=DEFAULT_REM["method"])
+    parser.add_argument("--basis", default=DEFAULT_REM["basis"])
+    main(parser.parse_args())
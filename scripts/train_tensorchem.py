@@ -0,0 +1,45 @@
+"""
+Trains a TensorChem model on a MixedDataset file from a JSON config with the dataset filename and hyper_params.
+
+Single process:
+    python scripts/train_tensorchem.py config.json
+
+Data parallel on one CPU node with 8 ranks, or on 2 nodes (run on each with its node rank):
+    torchrun --nproc_per_node=8 scripts/train_tensorchem.py config.json
+    torchrun --nnodes=2 --node_rank=0 --nproc_per_node=8 --rdzv_backend=c10d --rdzv_endpoint=host0:29500 \
+        scripts/train_tensorchem.py config.json
+
+With "resume": true and a checkpoint_path in hyper_params, rerunning the same command after a preemption continues
+from the last checkpoint. Set checkpoint_every to also checkpoint every that many batches within an epoch.
+"""
+
+import os
+import sys
+import json
+
+import torch
+
+from tensorchem.dataset.dataset import MixedDataset
+from tensorchem.networks.tensormol import TensorChemTrainer
+
+
+def main(config_file):
+    with open(config_file) as f:
+        config = json.load(f)
+    hyper_params = config["hyper_params"]
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size > 1:
+        hyper_params["distributed"] = True
+        # Split the cores of each node between its ranks rather than letting every rank claim all of them
+        local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+        torch.set_num_threads(max(1, os.cpu_count() // local_world_size))
+    dataset = MixedDataset()
+    dataset.load(config["dataset"])
+    trainer = TensorChemTrainer(dataset, hyper_params)
+    trainer.fit()
+    if trainer.world_size > 1:
+        torch.distributed.destroy_process_group()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
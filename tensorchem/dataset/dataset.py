@@ -8,15 +8,18 @@ import json
 import numpy as np
 import torch
 
-from torch.utils.data import Dataset as TorchDataset
+from torch.utils.data import Dataset as TorchDataset, Sampler
 from tensorchem.molecules import Molecule
+from tensorchem.molecules.selection import subsample as select_frames
 
 
 class Dataset(TorchDataset):
-    def __init__(self):
+    def __init__(self, transform=None):
         super(Dataset, self).__init__()
         self.unique_atoms = []
         self.filename = None
+        # Optional callable applied to each item, e.g. a RandomRigidTransform for data augmentation
+        self.transform = transform
 
     def _init_dataset(self):
         return
@@ -37,8 +40,8 @@ class Dataset(TorchDataset):
 
 
 class MolDataset(Dataset):
-    def __init__(self):
-        super(MolDataset, self).__init__()
+    def __init__(self, transform=None):
+        super(MolDataset, self).__init__(transform)
         self.samples = []  # Immutable type so order of molecules cannot change during training
         self.idx_map = {}  # Maps an overall sample index to the molecule and geometry indices
 
@@ -54,6 +57,8 @@ class MolDataset(Dataset):
                 item.update({key: torch.FloatTensor([value])})
             else:
                 item.update({key: torch.FloatTensor(value)})
+        if self.transform is not None:
+            item = self.transform(item)
         return item
 
     def save(self, filename=None):
@@ -84,7 +89,7 @@ class MolDataset(Dataset):
         for data in json_data:
             sample = {}
             for key, value in data.items():
-                if type(value) == list:
+                if type(value) in (list, float, int):
                     sample.update({key: value})
                 elif type(value) == dict:
                     for k, v in value.items():
@@ -112,8 +117,8 @@ class MolDataset(Dataset):
 
 
 class MixedDataset(Dataset):
-    def __init__(self):
-        super(MixedDataset, self).__init__()
+    def __init__(self, transform=None):
+        super(MixedDataset, self).__init__(transform)
         self.samples = []
         self.filename = None
 
@@ -129,6 +134,8 @@ class MixedDataset(Dataset):
                 item.update({key: torch.FloatTensor([value])})
             else:
                 item.update({key: torch.FloatTensor(value)})
+        if self.transform is not None:
+            item = self.transform(item)
         return item
 
     def save(self, filename=None):
@@ -159,7 +166,7 @@ class MixedDataset(Dataset):
         for data in json_data:
             sample = {}
             for key, value in data.items():
-                if type(value) == list:
+                if type(value) in (list, float, int):
                     sample.update({key: value})
                 elif type(value) == dict:
                     for k, v in value.items():
@@ -167,17 +174,28 @@ class MixedDataset(Dataset):
             self.samples.append(sample)
 
     @classmethod
-    def from_mset(cls, msets):
+    def from_mset(cls, msets, atomic_num_key="atomic_numbers", coords_key="coordinates", subsample=None,
+                  energy_key=None, **subsample_kwargs):
+        """
+        Builds a dataset with one sample per geometry of the msets, holding its atomic numbers, coordinates and labels.
+        Setting subsample to a method of tensorchem.molecules.selection.subsample keeps only a subset of the geometries
+        of each molecule, e.g. subsample="farthest_point", fraction=0.1 or subsample="energy", n_select=100 with the
+        energy_key label.
+        """
         if type(msets) is Molecule:
             msets = [msets]
         mixed_data = cls()
         for mset in msets:
-            for geom in mset.geometries:
-                atoms = {"atomic_num": [atom.at_num for atom in geom.atoms],
-                         "xyz": [atom.xyz for atom in geom.atoms]}
-                atoms.update({key: value for atom in geom.atoms for key, value in atom.labels.items()})
-                sample = {"atoms": atoms}
-                sample.update({key: value for key, value in geom.labels.items()})
+            geometries = mset.geometries
+            if subsample is not None and geometries:
+                coords = torch.stack([geom.xyz for geom in geometries])
+                if energy_key is not None:
+                    subsample_kwargs["energies"] = torch.stack([torch.as_tensor(geom.labels[energy_key]).reshape(())
+                                                                for geom in geometries])
+                geometries = [geometries[i] for i in select_frames(coords, subsample, **subsample_kwargs)]
+            for geom in geometries:
+                sample = {atomic_num_key: geom.atoms.tolist(), coords_key: geom.xyz.tolist()}
+                sample.update({key: torch.as_tensor(value).tolist() for key, value in geom.labels.items()})
                 mixed_data.samples.append(sample)
         return mixed_data
 
@@ -194,3 +212,152 @@ class Sample:
                 self.labels.update({key: torch.FloatTensor([value])})
             else:
                 self.labels.update({key: torch.FloatTensor(value)})
+
+
+def pad_collate(samples):
+    """
+    Collates dataset items with different numbers of atoms into a batch. Each value is zero padded along its first
+    dimension to the largest size in the batch before stacking, so atomic numbers are padded with 0.
+
+    Args:
+        samples: list of dicts of tensors from a Dataset __getitem__
+
+    Returns:
+        batch: dict of stacked tensors with a leading batch dimension
+    """
+    batch = {}
+    for key in samples[0].keys():
+        values = [sample[key] for sample in samples]
+        if values[0].dim() == 0:
+            batch[key] = torch.stack(values)
+            continue
+        max_len = max(value.shape[0] for value in values)
+        padded = values[0].new_zeros((len(values), max_len) + tuple(values[0].shape[1:]))
+        for i, value in enumerate(values):
+            padded[i, :value.shape[0]] = value
+        batch[key] = padded
+    return batch
+
+
+def atom_counts(dataset, atomic_num_key="atomic_numbers"):
+    """
+    Number of atoms (non-zero atomic numbers) in each item of a dataset
+    """
+    return [int(torch.count_nonzero(dataset[i][atomic_num_key])) for i in range(len(dataset))]
+
+
+def batch_memory(n_molecules, n_atoms, bytes_per_atom, bytes_per_pair, pair_chunk=None):
+    """
+    Estimated memory of a padded batch, with a cost for each padded atom and each padded atom pair. With pair_chunk
+    only that many molecules at a time hold their pair tensors, as in checkpointed featurization.
+    """
+    pair_molecules = n_molecules if pair_chunk is None else min(n_molecules, pair_chunk)
+    return n_molecules * n_atoms * bytes_per_atom + pair_molecules * n_atoms * n_atoms * bytes_per_pair
+
+
+class MemoryBudgetBatchSampler(Sampler):
+    """
+    Batch sampler which picks the number of molecules in each batch from a memory budget instead of a fixed batch size.
+    Molecules are sorted by size, with ties in a random order, and packed greedily into batches whose estimated
+    padded memory from batch_memory fits the budget. Batches of small molecules hold many of them and batches of
+    large molecules few, with little padding in either. The order of the batches is shuffled every epoch. A molecule
+    which alone exceeds the budget gets a batch of its own.
+
+    Args:
+        atom_counts: list with the number of atoms of each item in the dataset
+        memory_budget: memory per batch in bytes
+        bytes_per_atom: estimated memory for each padded atom
+        bytes_per_pair: estimated memory for each padded atom pair
+        pair_chunk: optional number of molecules whose pair tensors are held at once
+        max_batch_size: optional maximum number of molecules per batch
+        shuffle: shuffle the batches and the order of molecules with the same size
+        seed: random seed, combined with the epoch from set_epoch
+        num_replicas: number of distributed ranks. Each takes an equal share of the batches
+        rank: rank of this process
+    """
+
+    def __init__(self, atom_counts, memory_budget, bytes_per_atom, bytes_per_pair, pair_chunk=None,
+                 max_batch_size=None, shuffle=True, seed=0, num_replicas=1, rank=0):
+        self.atom_counts = torch.as_tensor(atom_counts, dtype=torch.long)
+        self.memory_budget = memory_budget
+        self.bytes_per_atom = bytes_per_atom
+        self.bytes_per_pair = bytes_per_pair
+        self.pair_chunk = pair_chunk
+        self.max_batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def plan(self):
+        """
+        Returns:
+            batches: list of lists of dataset indices for every rank, before sharding
+        """
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        order = torch.randperm(len(self.atom_counts), generator=generator) if self.shuffle \
+            else torch.arange(len(self.atom_counts))
+        order = order[torch.argsort(self.atom_counts[order], stable=True)].tolist()
+        batches, batch = [], []
+        for idx in order:
+            n_atoms = int(self.atom_counts[idx])
+            fits = batch_memory(len(batch) + 1, n_atoms, self.bytes_per_atom, self.bytes_per_pair,
+                                self.pair_chunk) <= self.memory_budget
+            if batch and (not fits or (self.max_batch_size is not None and len(batch) >= self.max_batch_size)):
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+        return batches
+
+    def __iter__(self):
+        batches = self.plan()
+        if self.num_replicas > 1:
+            # Every rank needs the same number of batches, so some are repeated
+            n_padded = -(-len(batches) // self.num_replicas) * self.num_replicas
+            batches = (batches * self.num_replicas)[:n_padded][self.rank::self.num_replicas]
+        return iter(batches)
+
+    def __len__(self):
+        return -(-len(self.plan()) // self.num_replicas)
+
+
+class ResumableBatchSampler(Sampler):
+    """
+    Wraps a batch sampler whose order depends only on the epoch given to set_epoch, such as a BatchSampler over a
+    DistributedSampler or a MemoryBudgetBatchSampler, so an epoch can be resumed part way through. After skip(n) the
+    next pass starts after its first n batches, which are skipped as lists of indices without loading any data.
+
+    Args:
+        batch_sampler: the batch sampler to wrap
+    """
+
+    def __init__(self, batch_sampler):
+        self.batch_sampler = batch_sampler
+        self.start = 0
+
+    def set_epoch(self, epoch):
+        if hasattr(self.batch_sampler, "set_epoch"):
+            self.batch_sampler.set_epoch(epoch)
+        else:
+            self.batch_sampler.sampler.set_epoch(epoch)
+
+    def skip(self, n_batches):
+        self.start = n_batches
+
+    def __iter__(self):
+        start, self.start = self.start, 0
+        for i, batch in enumerate(self.batch_sampler):
+            if i >= start:
+                yield batch
+
+    def __len__(self):
+        # The batches of the next pass, so the length matches what iterating yields after skip
+        return max(len(self.batch_sampler) - self.start, 0)
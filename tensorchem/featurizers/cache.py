@@ -0,0 +1,151 @@
+"""
+Cache for featurizer outputs so that features for geometries which do not change between epochs are only computed once
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def geometry_hash(at_nums, coords, params, elements=None, featurizer=None):
+    """
+    Builds a key for a set of features from everything that determines them
+
+    Args:
+        at_nums: ... x Na tensor of atomic numbers
+        coords: ... x Na x 3 tensor of atomic positions
+        params: dict of featurizer parameters. Values may be tensors, arrays or plain python types
+        elements: optional tensor of the element channels being featurized
+        featurizer: optional name and version of the featurizer, e.g. "sym_funcs/2", changed whenever its output
+            changes so that features cached on disk by an older version are not served
+
+    Returns:
+        key: hex digest identifying the geometry, featurizer and its parameters
+    """
+    sha = hashlib.sha1()
+    if featurizer is not None:
+        sha.update(featurizer.encode())
+    for tensor in (at_nums, coords, elements):
+        if tensor is None:
+            continue
+        array = torch.as_tensor(tensor).detach().cpu().contiguous().numpy()
+        sha.update(str(array.dtype).encode())
+        sha.update(str(array.shape).encode())
+        sha.update(array.tobytes())
+    for key in sorted(params.keys()):
+        value = params[key]
+        sha.update(key.encode())
+        if isinstance(value, (torch.Tensor, np.ndarray)):
+            value = torch.as_tensor(value).detach().cpu().numpy()
+            sha.update(str(value.dtype).encode())
+            sha.update(value.tobytes())
+        else:
+            sha.update(repr(value).encode())
+    return sha.hexdigest()
+
+
+class FeatureCache:
+    """
+    Least recently used cache of featurizer outputs with a bound on the total size of the stored features. Entries are
+    held in memory, or when a cache_dir is given, written to .npy files and returned as memory-mapped tensors so the
+    OS page cache decides what stays resident. Existing files in cache_dir are picked up again, so the cache can be
+    shared between training runs.
+
+    Features computed from coordinates which require gradients are never cached since the autograd graph is needed for
+    forces.
+
+    Args:
+        max_bytes: maximum number of bytes of features to keep before evicting the least recently used entries
+        cache_dir: optional directory for mmap-backed storage of the features
+    """
+
+    def __init__(self, max_bytes=2 ** 30, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (tensor or filename, n_bytes)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan_cache_dir()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _scan_cache_dir(self):
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith(".npy")]
+        for filename in sorted(files, key=os.path.getmtime):
+            key = os.path.basename(filename)[:-4]
+            n_bytes = os.path.getsize(filename)
+            self._entries[key] = (filename, n_bytes)
+            self.n_bytes += n_bytes
+        self._evict()
+
+    def _evict(self):
+        while self.n_bytes > self.max_bytes and self._entries:
+            key, (value, n_bytes) = self._entries.popitem(last=False)
+            self.n_bytes -= n_bytes
+            if self.cache_dir is not None and os.path.exists(value):
+                os.remove(value)
+
+    def get(self, key):
+        """
+        Returns a copy of the cached features for key, so callers may modify it in place, or None if they are not in
+        the cache
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        value, _ = self._entries[key]
+        if self.cache_dir is not None:
+            # Copy-on-write mapping gives a writable array without reading the file into memory
+            return torch.from_numpy(np.load(value, mmap_mode="c"))
+        return value.clone()
+
+    def put(self, key, features):
+        """
+        Adds a copy of features to the cache under key, evicting the least recently used entries if needed
+        """
+        features = features.detach()
+        if self.cache_dir is not None:
+            filename = os.path.join(self.cache_dir, key + ".npy")
+            tmp_filename = filename + ".tmp"
+            with open(tmp_filename, "wb") as f:
+                np.save(f, features.cpu().numpy())
+            os.replace(tmp_filename, filename)
+            value, n_bytes = filename, os.path.getsize(filename)
+        else:
+            # A copy, so the caller may modify features in place and a view does not keep a whole batch alive
+            value = features.clone()
+            n_bytes = value.element_size() * value.nelement()
+        if key in self._entries:
+            self.n_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, n_bytes)
+        self.n_bytes += n_bytes
+        self._evict()
+
+    def get_or_compute(self, key, compute_fn):
+        """
+        Returns the features for key, calling compute_fn to build and store them on a cache miss
+        """
+        features = self.get(key)
+        if features is None:
+            features = compute_fn()
+            self.put(key, features)
+        return features
+
+    def clear(self):
+        for key in list(self._entries.keys()):
+            value, _ = self._entries.pop(key)
+            if self.cache_dir is not None and os.path.exists(value):
+                os.remove(value)
+        self.n_bytes = 0
@@ -0,0 +1,166 @@
+"""
+Distance and neighbor list routines for periodic and large systems. Cells are given as 3 x 3 tensors with the lattice
+vectors as rows, so cartesian positions are fractional positions @ cell.
+"""
+
+import itertools
+
+import torch
+
+from .util import safe_norm
+
+
+def cell_widths(cell):
+    """
+    Perpendicular widths of a cell, i.e. the distances between opposite faces
+
+    Args:
+        cell: 3 x 3 tensor of lattice vectors
+
+    Returns:
+        widths: tensor of 3 widths along each lattice vector
+    """
+    volume = torch.abs(torch.det(cell))
+    face_areas = torch.norm(torch.cross(cell[[1, 2, 0]], cell[[2, 0, 1]], dim=-1), dim=-1)
+    return volume / face_areas
+
+
+def wrap_positions(coords, cell):
+    """
+    Wraps atomic positions back into the unit cell
+
+    Args:
+        coords: ... x Na x 3 tensor of atomic positions
+        cell: 3 x 3 tensor of lattice vectors
+
+    Returns:
+        wrapped: ... x Na x 3 tensor of positions inside the cell
+    """
+    frac = coords @ torch.inverse(cell)
+    return (frac - torch.floor(frac)) @ cell
+
+
+def dist_matrix_pbc(coords, cell):
+    """
+    Calculates the minimum image distance matrix for a batch of atomic coordinates in a periodic cell. Exact for
+    orthorhombic cells, and for other cells as long as distances are only needed below half the smallest cell width.
+
+    Args:
+        coords: ... x Na x 3 torch tensor of atomic positions
+        cell: 3 x 3 tensor of lattice vectors
+
+    Returns:
+        dist: ... x Na x Na torch tensor of distances between atoms
+    """
+    frac = coords @ torch.inverse(cell)
+    d_frac = frac.unsqueeze(-2) - frac.unsqueeze(-3)
+    d_frac = d_frac - torch.round(d_frac).detach()
+    return safe_norm(d_frac @ cell)
+
+
+def neighbor_list(coords, cutoff, cell=None):
+    """
+    Finds all pairs of atoms closer than cutoff, including pairs with periodic images when a cell is given. Uses a
+    cell list so the cost grows linearly with the number of atoms. Cells with fewer than three bins of width cutoff
+    along a lattice vector are handled by checking all periodic images within the cutoff instead.
+
+    Args:
+        coords: Na x 3 tensor of atomic positions
+        cutoff: neighbor cutoff distance
+        cell: optional 3 x 3 tensor of lattice vectors. Without a cell the system is treated as isolated
+
+    Returns:
+        idx_i: tensor of center atom indices for each pair
+        idx_j: tensor of neighbor atom indices for each pair
+        shifts: P x 3 tensor of cartesian shifts such that the pair vector is coords[idx_j] - coords[idx_i] + shifts
+    """
+    with torch.no_grad():
+        if cell is None:
+            return _cell_list_pairs(coords, cutoff)
+        n_bins = torch.floor(cell_widths(cell) / cutoff).long()
+        if torch.all(n_bins >= 3):
+            return _cell_list_pairs(coords, cutoff, cell, n_bins)
+        return _image_pairs(coords, cutoff, cell)
+
+
+def pair_vectors(coords, idx_i, idx_j, shifts=None):
+    """
+    Vectors from center atoms to their neighbors for a neighbor list from neighbor_list. Gradients flow back to coords.
+    """
+    d_xyz = coords[idx_j] - coords[idx_i]
+    if shifts is not None:
+        d_xyz = d_xyz + shifts.to(d_xyz.dtype)
+    return d_xyz
+
+
+def _image_pairs(coords, cutoff, cell):
+    """
+    Brute force search over every periodic image within cutoff, for cells too small for a cell list
+    """
+    n_atoms = coords.shape[0]
+    n_images = torch.ceil(cutoff / cell_widths(cell)).long().tolist()
+    images = torch.tensor(list(itertools.product(*[range(-n, n + 1) for n in n_images])), dtype=cell.dtype,
+                          device=coords.device)
+    image_shifts = images @ cell
+    d_xyz = coords.unsqueeze(-3) - coords.unsqueeze(-2) + image_shifts.unsqueeze(-2).unsqueeze(-2)
+    dist = torch.norm(d_xyz, dim=-1)  # images x Na x Na
+    origin_image = torch.all(images == 0, dim=-1)
+    self_pair = torch.eye(n_atoms, dtype=torch.bool, device=coords.device) & origin_image[:, None, None]
+    image, idx_i, idx_j = torch.nonzero((dist < cutoff) & ~self_pair, as_tuple=True)
+    return idx_i, idx_j, image_shifts[image]
+
+
+def _cell_list_pairs(coords, cutoff, cell=None, n_bins=None):
+    """
+    Cell list search over the 27 bins surrounding each atom. Bins are at least cutoff wide, and periodic systems need
+    at least three bins per lattice vector so that no bin is visited twice.
+    """
+    n_atoms = coords.shape[0]
+    device = coords.device
+    if cell is None:
+        origin = coords.min(dim=0)[0]
+        bin_xyz = torch.floor((coords - origin) / cutoff).long()
+        n_bins = bin_xyz.max(dim=0)[0] + 1
+        wrapped, frac_shift = coords, None
+    else:
+        frac = coords @ torch.inverse(cell)
+        frac_shift = -torch.floor(frac)
+        wrapped = (frac + frac_shift) @ cell
+        bin_xyz = torch.minimum(torch.floor((frac + frac_shift) * n_bins).long(), n_bins - 1)
+    bin_strides = torch.tensor([n_bins[1] * n_bins[2], n_bins[2], 1], device=device)
+    bin_id = (bin_xyz * bin_strides).sum(-1)
+
+    # Table of atom indices in each bin, padded with -1
+    n_total_bins = int(torch.prod(n_bins))
+    order = torch.argsort(bin_id)
+    counts = torch.bincount(bin_id, minlength=n_total_bins)
+    starts = torch.cumsum(counts, 0) - counts
+    sorted_bins = bin_id[order]
+    slot = torch.arange(n_atoms, device=device) - starts[sorted_bins]
+    bin_table = torch.full((n_total_bins, int(counts.max())), -1, dtype=torch.long, device=device)
+    bin_table[sorted_bins, slot] = order
+
+    offsets = torch.tensor(list(itertools.product([-1, 0, 1], repeat=3)), device=device)
+    neighbor_bins = bin_xyz.unsqueeze(1) + offsets  # Na x 27 x 3
+    if cell is None:
+        in_range = torch.all((neighbor_bins >= 0) & (neighbor_bins < n_bins), dim=-1)
+        neighbor_bins = torch.where(in_range.unsqueeze(-1), neighbor_bins, torch.zeros_like(neighbor_bins))
+        image_shifts = torch.zeros(n_atoms, 27, 3, dtype=coords.dtype, device=device)
+    else:
+        in_range = torch.ones(n_atoms, 27, dtype=torch.bool, device=device)
+        images = torch.div(neighbor_bins, n_bins, rounding_mode="floor")
+        neighbor_bins = neighbor_bins - images * n_bins
+        image_shifts = images.to(cell.dtype) @ cell
+    candidates = bin_table[(neighbor_bins * bin_strides).sum(-1)]  # Na x 27 x max bin count
+    valid = (candidates >= 0) & in_range.unsqueeze(-1)
+    candidates = candidates.clamp(min=0)
+
+    d_xyz = wrapped[candidates] + image_shifts.unsqueeze(2) - wrapped.unsqueeze(1).unsqueeze(1)
+    self_pair = (candidates == torch.arange(n_atoms, device=device)[:, None, None]) & torch.all(
+        image_shifts == 0, dim=-1).unsqueeze(-1)
+    idx_i, offset, slot = torch.nonzero(valid & ~self_pair & (torch.norm(d_xyz, dim=-1) < cutoff), as_tuple=True)
+    idx_j = candidates[idx_i, offset, slot]
+    shifts = image_shifts[idx_i, offset]
+    if frac_shift is not None:
+        shifts = shifts + (frac_shift[idx_j] - frac_shift[idx_i]) @ cell
+    return idx_i, idx_j, shifts
@@ -3,16 +3,97 @@ Module for building features for model inputs from the molecular coordinates and
 """
 
 import torch
-from .util import dist_matrix_dense, cos_cutoff, gaussian_embed
+from .util import dist_matrix_dense, cos_cutoff, gaussian_embed, element_index, scatter_element_channels, \
+    scatter_neighbor_channels, precision_policy
+from .neighbors import neighbor_list, pair_vectors
+from .cache import geometry_hash
 
+# Identifies the layout of the features in cache keys. Bump it whenever get_sym_funcs changes its output
+SYM_FUNCS_FEATURIZER = "sym_funcs/2"
 
-def get_sym_funcs(params, at_nums, coords, elements):
+
+def get_sym_funcs(params, at_nums, coords, elements, cache=None, cell=None, precision=None):
+    """
+    Builds radial symmetry functions for each atom, summed over its neighbors into channels by the element of the
+    neighboring atom. Atoms with an atomic number not in elements (e.g. 0 for padding) are ignored.
+
+    Args:
+        params: dict with the r_nought, eta and rad_cut parameters of the radial embedding
+        at_nums: ... x Na tensor of atomic numbers
+        coords: ... x Na x 3 tensor of atomic positions
+        elements: tensor of atomic numbers for each element channel
+        cache: optional FeatureCache. Features are looked up by a hash of the inputs and only computed on a miss.
+            Ignored when coords requires gradients.
+        cell: optional 3 x 3 tensor of lattice vectors for a periodic system. Periodic systems are featurized from a
+            cell list neighbor list, so at_nums and coords must be a single Na and Na x 3 system.
+        precision: optional precision policy name from featurizers.util.PRECISION_POLICIES, e.g. "bfloat16" to
+            compute distances in float32 and return bfloat16 features. By default everything is done in the dtype of
+            coords.
+
+    Returns:
+        radial_channels: ... x Na x len(elements) x len(r_nought) tensor of radial symmetry functions
+    """
+    if cache is not None and not coords.requires_grad:
+        key = sym_funcs_key(params, at_nums, coords, elements, cell, precision)
+        return cache.get_or_compute(key, lambda: get_sym_funcs(params, at_nums, coords, elements, cell=cell,
+                                                               precision=precision))
+    if cell is not None:
+        return get_sym_funcs_pbc(params, at_nums, coords, elements, cell, precision)
+    coords, params = _apply_precision(coords, params, precision)
     dist = dist_matrix_dense(coords)
-    # padded_mol_mask = torch.ne(at_nums, 0)
+    if precision is not None:
+        dist = dist.to(params['r_nought'].dtype)
+    radial_embed = get_radial_embed(dist, params['r_nought'], params['eta'], params['rad_cut'])
+    elem_idx = element_index(at_nums, elements)
+    return scatter_element_channels(radial_embed, elem_idx, elements.shape[0])
+
+
+def sym_funcs_key(params, at_nums, coords, elements, cell=None, precision=None):
+    """
+    The FeatureCache key of the symmetry functions of get_sym_funcs for these inputs
+    """
+    return geometry_hash(at_nums, coords, dict(params, cell=cell, precision=precision), elements, SYM_FUNCS_FEATURIZER)
+
+
+def get_sym_funcs_pbc(params, at_nums, coords, elements, cell=None, precision=None):
+    """
+    Radial symmetry functions from a neighbor list, for periodic systems and large molecules where the dense distance
+    matrix is too costly. Cost scales linearly with the number of atoms.
+
+    Args:
+        params: dict with the r_nought, eta and rad_cut parameters of the radial embedding
+        at_nums: Na tensor of atomic numbers
+        coords: Na x 3 tensor of atomic positions
+        elements: tensor of atomic numbers for each element channel
+        cell: optional 3 x 3 tensor of lattice vectors. Without a cell the system is treated as isolated
+        precision: optional precision policy name, see get_sym_funcs
+
+    Returns:
+        radial_channels: Na x len(elements) x len(r_nought) tensor of radial symmetry functions
+    """
+    coords, params = _apply_precision(coords, params, precision)
+    if precision is not None and cell is not None:
+        cell = cell.to(coords.dtype)
+    idx_i, idx_j, shifts = neighbor_list(coords, params['rad_cut'], cell)
+    dist = torch.norm(pair_vectors(coords, idx_i, idx_j, shifts), dim=-1)
+    if precision is not None:
+        dist = dist.to(params['r_nought'].dtype)
     radial_embed = get_radial_embed(dist, params['r_nought'], params['eta'], params['rad_cut'])
-    scatter = torch.eq(at_nums.unsqueeze(-1), elements)
-    radial_channels = radial_embed.unsqueeze(-2) * scatter.unsqueeze(-1)
-    return radial_channels
+    elem_idx = element_index(at_nums, elements)
+    pair_elem_idx = torch.where(elem_idx[idx_i] >= 0, elem_idx[idx_j], torch.full_like(idx_j, -1))
+    return scatter_neighbor_channels(radial_embed, idx_i, pair_elem_idx, coords.shape[0], elements.shape[0])
+
+
+def _apply_precision(coords, params, precision):
+    """
+    Casts the coordinates to the distance dtype and the embedding parameters to the feature dtype of a precision policy
+    """
+    if precision is None:
+        return coords, params
+    dist_dtype, feat_dtype = precision_policy(precision)
+    params = dict(params, r_nought=torch.as_tensor(params['r_nought'], dtype=feat_dtype),
+                  eta=torch.as_tensor(params['eta'], dtype=feat_dtype))
+    return coords.to(dist_dtype), params
 
 
 def get_radial_embed(dist, r_nought, eta, rad_cut):
@@ -2,8 +2,35 @@
 Functions common to several featurizers
 """
 
+import math
+
 import torch
-from numpy import pi
+
+# Precision policies for featurization as (dtype for coordinates and distances, dtype for features)
+PRECISION_POLICIES = {
+    "float64": (torch.float64, torch.float64),
+    "float32": (torch.float32, torch.float32),
+    "float16": (torch.float32, torch.float16),
+    "bfloat16": (torch.float32, torch.bfloat16),
+}
+
+
+def precision_policy(precision):
+    """
+    Looks up a featurization precision policy. Distances are always computed in at least float32 since the low
+    precision types cannot resolve small changes in large coordinates, while the Gaussian embedding, cutoff and element
+    channel sums are done in the feature dtype to halve the memory traffic of the large pair feature tensors.
+
+    Args:
+        precision: one of "float64", "float32", "float16" or "bfloat16"
+
+    Returns:
+        dist_dtype: dtype for coordinates and distances
+        feat_dtype: dtype for the features
+    """
+    if precision not in PRECISION_POLICIES:
+        raise ValueError(f"Unknown precision policy {precision}, expected one of {list(PRECISION_POLICIES.keys())}")
+    return PRECISION_POLICIES[precision]
 
 
 def cos_cutoff(dist, cutoff):
@@ -18,7 +45,7 @@ def cos_cutoff(dist, cutoff):
     Returns:
           scaling_factor: Array with the same shape as dist. Used to scale features based on their distance
     """
-    cos_factor = 0.5 * (torch.cos(pi * dist / cutoff) + 1.0)
+    cos_factor = 0.5 * (torch.cos(math.pi * dist / cutoff) + 1.0)
     cos_factor = torch.where(dist < cutoff, cos_factor, torch.zeros_like(cos_factor))
     return cos_factor
 
@@ -70,4 +97,93 @@ def dist_matrix_dense(coords):
         dist: ... x Na x Na torch tensor of distances between atoms
     """
     d_xyz = coords.unsqueeze(-2) - coords.unsqueeze(-3)
-    return torch.norm(d_xyz, dim=-1)
+    return safe_norm(d_xyz)
+
+
+def safe_norm(d_xyz):
+    """
+    Euclidean norm over the last dimension with finite first and second derivatives for zero length vectors, such as
+    self pairs and padding atoms sitting on top of each other. torch.norm has NaN second derivatives there, which
+    poisons force training.
+
+    Args:
+        d_xyz: ... x 3 tensor of vectors
+
+    Returns:
+        norm: ... tensor of vector lengths
+    """
+    sq_norm = torch.sum(torch.square(d_xyz), dim=-1)
+    zero = sq_norm == 0
+    return torch.where(zero, torch.zeros_like(sq_norm), torch.sqrt(torch.where(zero, torch.ones_like(sq_norm),
+                                                                               sq_norm)))
+
+
+def element_index(at_nums, elements):
+    """
+    Maps atomic numbers to the index of their element channel
+
+    Args:
+        at_nums: ... x Na tensor of atomic numbers
+        elements: tensor of atomic numbers for each element channel
+
+    Returns:
+        elem_idx: ... x Na tensor of channel indices. Atoms whose element has no channel (e.g. padding) are set to -1
+    """
+    sorted_elements, order = torch.sort(elements.to(at_nums.device).long())
+    at_nums = at_nums.long()
+    pos = torch.searchsorted(sorted_elements, at_nums).clamp(max=sorted_elements.shape[0] - 1)
+    return torch.where(sorted_elements[pos] == at_nums, order[pos], torch.full_like(pos, -1))
+
+
+def scatter_element_channels(pair_embed, elem_idx, n_elements: int):
+    """
+    Sums pair features over the neighbors of each atom into channels by the element of the neighbor. The sum is an
+    index_add over neighbor channel ids, so the cost does not depend on the number of element channels. Self pairs
+    and pairs involving atoms without a channel are dropped.
+
+    Args:
+        pair_embed: ... x Na x Na x Nf tensor of features for each pair of atoms
+        elem_idx: ... x Na tensor of channel indices from element_index
+        n_elements: number of element channels
+
+    Returns:
+        channels: ... x Na x n_elements x Nf tensor of features summed over neighbors in each element channel
+    """
+    n_atoms, n_feats = pair_embed.shape[-2], pair_embed.shape[-1]
+    batch_shape = list(pair_embed.shape[:-3])
+    valid = elem_idx >= 0
+    pair_mask = valid.unsqueeze(-1) & valid.unsqueeze(-2)
+    pair_mask = pair_mask & ~torch.eye(n_atoms, dtype=torch.bool, device=pair_embed.device)
+    # Dropped pairs are accumulated into an extra channel which is sliced off at the end
+    pair_channel = torch.where(pair_mask, elem_idx.unsqueeze(-2), torch.full_like(pair_mask, n_elements,
+                                                                                    dtype=elem_idx.dtype))
+    n_centers = pair_channel.numel() // n_atoms
+    center_offset = torch.arange(n_centers, device=pair_embed.device) * (n_elements + 1)
+    index = pair_channel.reshape(n_centers, n_atoms) + center_offset.unsqueeze(-1)
+    channels = torch.zeros(n_centers * (n_elements + 1), n_feats, dtype=pair_embed.dtype, device=pair_embed.device)
+    channels = channels.index_add(0, index.reshape(-1), pair_embed.reshape(-1, n_feats))
+    channels = channels.reshape(batch_shape + [n_atoms, n_elements + 1, n_feats])
+    return channels[..., :n_elements, :]
+
+
+def scatter_neighbor_channels(pair_embed, idx_i, neighbor_elem_idx, n_atoms, n_elements):
+    """
+    Sparse version of scatter_element_channels for pairs from a neighbor list
+
+    Args:
+        pair_embed: P x Nf tensor of features for each pair
+        idx_i: P tensor of center atom indices for each pair
+        neighbor_elem_idx: P tensor of channel indices of the neighbor atoms. Pairs with -1 are dropped
+        n_atoms: number of atoms
+        n_elements: number of element channels
+
+    Returns:
+        channels: Na x n_elements x Nf tensor of features summed over neighbors in each element channel
+    """
+    n_feats = pair_embed.shape[-1]
+    pair_channel = torch.where(neighbor_elem_idx >= 0, neighbor_elem_idx,
+                               torch.full_like(neighbor_elem_idx, n_elements))
+    index = idx_i * (n_elements + 1) + pair_channel
+    channels = torch.zeros(n_atoms * (n_elements + 1), n_feats, dtype=pair_embed.dtype, device=pair_embed.device)
+    channels = channels.index_add(0, index, pair_embed)
+    return channels.reshape(n_atoms, n_elements + 1, n_feats)[:, :n_elements, :]
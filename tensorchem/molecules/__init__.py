@@ -1,3 +1,3 @@
 from .molecule import Molecule
 from .geometry import Geometry
-from .trajectory import Trajectory, OptTrajectory, NMSTrajectory
+from .trajectory import Trajectory, OptTrajectory, NMSTrajectory, MDTrajectory
@@ -0,0 +1,156 @@
+"""
+Molecular dynamics of batches of independent molecules with forces from a trained model, e.g. to generate new
+configurations for active learning. Positions are in angstrom, time in fs, masses in amu and energies in Hartree.
+"""
+
+import math
+
+import torch
+from qcelemental import constants, periodictable
+
+from tensorchem.molecules.geometry import Geometry
+from tensorchem.molecules.trajectory import MDTrajectory
+
+# Acceleration in angstrom / fs^2 of a force of 1 Hartree / angstrom on a mass of 1 amu
+ACCELERATION = constants.conversion_factor("hartree / (angstrom * amu)", "angstrom / femtosecond**2")
+# Boltzmann constant in Hartree / K
+KB = constants.kb * constants.conversion_factor("joule", "hartree")
+
+
+def atomic_masses(at_nums):
+    """
+    Masses in amu of a tensor of atomic numbers, with 0 for the padding atomic number 0
+    """
+    masses = {z: periodictable.to_mass(z) if z > 0 else 0.0 for z in set(at_nums.reshape(-1).tolist())}
+    return torch.tensor([masses[z] for z in at_nums.reshape(-1).tolist()], dtype=torch.float64).reshape(at_nums.shape)
+
+
+class MolecularDynamics:
+    """
+    Integrates a padded batch of independent molecules with the BAOAB Langevin splitting (Leimkuhler and Matthews,
+    Appl. Math. Res. Express 2013), which needs one force evaluation per step. With friction 0 the thermostat step
+    drops out and it is velocity Verlet in the NVE ensemble. All replicas advance together, so each step is a single
+    batched call of the force model, and the state is kept in float64 while forces are evaluated in float32.
+
+    Args:
+        force_fn: callable taking B x Na atomic numbers and B x Na x 3 float32 coordinates and returning B energies and
+            B x Na x 3 forces, e.g. a TensorChemPipeline or InferenceEngine.evaluate_batch
+        at_nums: B x Na tensor of atomic numbers padded with 0
+        coords: B x Na x 3 tensor of initial positions
+        timestep: time step in fs
+        temperature: thermostat and initial velocity temperature in K
+        friction: Langevin friction in 1/fs, 0 for NVE dynamics
+        velocities: optional B x Na x 3 tensor of initial velocities in angstrom/fs, drawn from the Maxwell-Boltzmann
+            distribution at temperature when not given
+        generator: optional torch.Generator for reproducible velocities and noise
+        device: device to integrate on
+    """
+
+    def __init__(self, force_fn, at_nums, coords, timestep=0.5, temperature=300.0, friction=0.0, velocities=None,
+                 generator=None, device="cpu"):
+        self.force_fn = force_fn
+        self.device = torch.device(device)
+        self.at_nums = at_nums.long().to(self.device)
+        self.mask = torch.ne(self.at_nums, 0).unsqueeze(-1).to(torch.float64)
+        masses = atomic_masses(self.at_nums).to(self.device)
+        self.masses = masses.unsqueeze(-1)
+        # Padding atoms have no mass and an inverse mass of 0, so they never move
+        self.inv_masses = torch.where(masses > 0, 1.0 / masses.clamp(min=1e-12), torch.zeros_like(masses))
+        self.inv_masses = self.inv_masses.unsqueeze(-1)
+        self.coords = coords.to(self.device, torch.float64).clone()
+        self.timestep = timestep
+        self.temperature = temperature
+        self.friction = friction
+        self.generator = generator
+        self.n_steps = 0
+        if velocities is None:
+            velocities = self.maxwell_boltzmann(temperature)
+        self.velocities = velocities.to(self.device, torch.float64) * self.mask
+        self.energies, self.forces = self.compute_forces()
+
+    def maxwell_boltzmann(self, temperature):
+        """
+        Velocities drawn at temperature with the centre of mass motion of each molecule removed
+        """
+        noise = torch.randn(self.coords.shape, generator=self.generator, dtype=torch.float64).to(self.device)
+        velocities = noise * torch.sqrt(KB * temperature * ACCELERATION * self.inv_masses) * self.mask
+        momentum = (self.masses * velocities).sum(-2, keepdim=True)
+        return (velocities - momentum / self.masses.sum(-2, keepdim=True).clamp(min=1e-12)) * self.mask
+
+    def compute_forces(self):
+        energies, forces = self.force_fn(self.at_nums, self.coords.to(torch.float32))
+        return energies.detach().to(torch.float64), forces.detach().to(torch.float64) * self.mask
+
+    def kinetic_energy(self):
+        """
+        Kinetic energy of each replica in Hartree
+        """
+        return 0.5 * (self.masses * torch.square(self.velocities)).sum((-1, -2)) / ACCELERATION
+
+    def instantaneous_temperature(self):
+        """
+        Temperature of each replica in K from its kinetic energy, with 3 Na - 3 degrees of freedom
+        """
+        n_dof = (3.0 * self.mask.sum((-1, -2)) - 3.0).clamp(min=1.0)
+        return 2.0 * self.kinetic_energy() / (n_dof * KB)
+
+    def step(self):
+        dt = self.timestep
+        self.velocities = self.velocities + 0.5 * dt * ACCELERATION * self.forces * self.inv_masses
+        self.coords = self.coords + 0.5 * dt * self.velocities
+        if self.friction > 0.0:
+            decay = math.exp(-self.friction * dt)
+            noise = torch.randn(self.coords.shape, generator=self.generator, dtype=torch.float64).to(self.device)
+            thermal = torch.sqrt((1.0 - decay ** 2) * KB * self.temperature * ACCELERATION * self.inv_masses)
+            self.velocities = decay * self.velocities + thermal * noise * self.mask
+        self.coords = self.coords + 0.5 * dt * self.velocities
+        self.energies, self.forces = self.compute_forces()
+        self.velocities = self.velocities + 0.5 * dt * ACCELERATION * self.forces * self.inv_masses
+        self.n_steps += 1
+
+    def run(self, n_steps, stride=10, buffer_size=100, trajectories=None):
+        """
+        Runs n_steps steps and records every stride-th frame of each replica, with its potential and kinetic energy
+        labels. Frames are copied into preallocated buffers of buffer_size frames, and only turned into Geometries on
+        the CPU when a buffer fills, so recording costs one tensor copy per frame for the whole batch.
+
+        Args:
+            n_steps: number of steps to run
+            stride: number of steps between recorded frames
+            buffer_size: number of frames held before they are written to the trajectories
+            trajectories: optional list of B Trajectories to append to, e.g. from a previous run
+
+        Returns:
+            trajectories: list of one MDTrajectory per replica
+        """
+        if trajectories is None:
+            trajectories = [MDTrajectory(self.timestep * stride, self.temperature, self.friction)
+                            for _ in range(self.coords.shape[0])]
+        coords_buffer = torch.zeros((buffer_size,) + self.coords.shape, dtype=torch.float32, device=self.device)
+        energy_buffer = torch.zeros(buffer_size, self.coords.shape[0], 2, dtype=torch.float64, device=self.device)
+        n_buffered = 0
+        for _ in range(n_steps):
+            self.step()
+            if self.n_steps % stride == 0:
+                coords_buffer[n_buffered] = self.coords
+                energy_buffer[n_buffered, :, 0] = self.energies
+                energy_buffer[n_buffered, :, 1] = self.kinetic_energy()
+                n_buffered += 1
+                if n_buffered == buffer_size:
+                    self._flush(trajectories, coords_buffer, energy_buffer, n_buffered)
+                    n_buffered = 0
+        self._flush(trajectories, coords_buffer, energy_buffer, n_buffered)
+        return trajectories
+
+    def _flush(self, trajectories, coords_buffer, energy_buffer, n_buffered):
+        if n_buffered == 0:
+            return
+        # On the CPU .cpu() returns the buffers themselves, which the next frames overwrite, so the labels are copies
+        coords, energies = coords_buffer[:n_buffered].cpu(), energy_buffer[:n_buffered].to("cpu", copy=True)
+        at_nums = self.at_nums.cpu()
+        for i, trajectory in enumerate(trajectories):
+            n_atoms = int(torch.count_nonzero(at_nums[i]))
+            atoms = at_nums[i, :n_atoms].to(torch.uint8)
+            for frame in range(n_buffered):
+                labels = {"potential energy": energies[frame, i, 0], "kinetic energy": energies[frame, i, 1]}
+                trajectory.geometries.append(Geometry(atoms, coords[frame, i, :n_atoms].clone(), labels))
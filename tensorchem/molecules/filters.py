@@ -0,0 +1,91 @@
+"""
+Physical plausibility filters for sampled geometries, which reject samples with atoms collapsed together or with bonds
+formed or broken relative to the conformer they were sampled from before they are sent for expensive single points.
+"""
+
+import torch
+from qcelemental import covalentradii
+
+from tensorchem.featurizers.util import dist_matrix_dense
+
+
+def covalent_radii(atoms):
+    """
+    Covalent radii in angstrom of a tensor of atomic numbers
+    """
+    radii = {z: covalentradii.get(z, units="angstrom") for z in set(atoms.tolist())}
+    return torch.tensor([radii[z] for z in atoms.tolist()], dtype=torch.float32)
+
+
+def bond_matrix(atoms, coords, bond_scale=1.2):
+    """
+    Bonding topology from covalent radii, with atoms i and j bonded when closer than bond_scale * (r_i + r_j)
+
+    Args:
+        atoms: Na tensor of atomic numbers
+        coords: ... x Na x 3 tensor of atomic positions
+        bond_scale: multiple of the summed covalent radii below which a pair is bonded
+
+    Returns:
+        bonds: ... x Na x Na bool tensor, False on the diagonal
+    """
+    return _bonds(dist_matrix_dense(coords.float()), bond_scale * _pair_radii(atoms, coords.device))
+
+
+def _pair_radii(atoms, device):
+    radii = covalent_radii(atoms).to(device)
+    return radii.unsqueeze(-1) + radii.unsqueeze(-2)
+
+
+def _bonds(dist, bond_dist):
+    return (dist < bond_dist) & ~torch.eye(dist.shape[-1], dtype=torch.bool, device=dist.device)
+
+
+def plausibility_mask(atoms, coords, reference=None, min_scale=0.6, bond_scale=1.2, chunk_size=1024):
+    """
+    Checks a batch of samples of one molecule. A sample is rejected when any pair of atoms is closer than
+    min_scale * (r_i + r_j) of their covalent radii, or, when a reference geometry is given, when its bonds differ from
+    those of the reference. The samples are checked in chunks so the pair matrices stay chunk_size x Na x Na.
+
+    Args:
+        atoms: Na tensor of atomic numbers
+        coords: n_samples x Na x 3 tensor of atomic positions
+        reference: optional Na x 3 tensor of the positions the samples were drawn around, e.g. the conformer
+        min_scale: multiple of the summed covalent radii below which a pair is too close
+        bond_scale: multiple of the summed covalent radii below which a pair is bonded
+        chunk_size: number of samples checked at once
+
+    Returns:
+        keep: n_samples bool tensor, True for plausible samples
+        report: dict of the number of samples, accepted samples, samples with atoms too close, samples with a changed
+            topology and the rejection rate
+    """
+    pair_radii = _pair_radii(atoms, coords.device)
+    min_dist = (min_scale * pair_radii).fill_diagonal_(0.0)
+    bond_dist = bond_scale * pair_radii
+    ref_bonds = _bonds(dist_matrix_dense(reference.to(coords.device).float()), bond_dist) \
+        if reference is not None else None
+    too_close, changed = [], []
+    for chunk in torch.split(coords, chunk_size):
+        dist = dist_matrix_dense(chunk.float())
+        too_close.append((dist < min_dist).flatten(1).any(-1))
+        if ref_bonds is not None:
+            changed.append((_bonds(dist, bond_dist) != ref_bonds).flatten(1).any(-1))
+    too_close = torch.cat(too_close) if too_close else torch.zeros(0, dtype=torch.bool)
+    changed = torch.cat(changed) if changed else torch.zeros_like(too_close)
+    keep = ~(too_close | changed)
+    n_samples = keep.shape[0]
+    report = {"n_samples": n_samples, "n_accepted": int(keep.sum()), "n_too_close": int(too_close.sum()),
+              "n_topology_changed": int(changed.sum()),
+              "rejection_rate": 1.0 - int(keep.sum()) / n_samples if n_samples else 0.0}
+    return keep, report
+
+
+def merge_reports(reports):
+    """
+    Sums the counts of several plausibility_mask reports and recomputes the rejection rate
+    """
+    merged = {key: sum(report[key] for report in reports)
+              for key in ("n_samples", "n_accepted", "n_too_close", "n_topology_changed")}
+    merged["rejection_rate"] = 1.0 - merged["n_accepted"] / merged["n_samples"] if merged["n_samples"] else 0.0
+    return merged
@@ -7,7 +7,7 @@ import torch
 from qcelemental import periodictable
 
 from tensorchem.molecules.geometry import Geometry
-from tensorchem.molecules.trajectory import Trajectory
+from tensorchem.molecules.trajectory import trajectory_from_json
 
 ByteTensor = torch.ByteTensor
 
@@ -93,7 +93,7 @@ class Molecule:
         new_mol.atoms = torch.tensor(json_data["atoms"], dtype=torch.uint8)
         new_mol.charge = json_data["charge"]
         new_mol.identifiers = json_data["identifiers"]
-        new_mol.trajectories = [Trajectory.from_json(traj_data) for traj_data in json_data["trajectories"]]
+        new_mol.trajectories = [trajectory_from_json(traj_data) for traj_data in json_data["trajectories"]]
         new_mol.filename = json_data["filename"]
         new_mol.filepath = json_data["filepath"]
         return new_mol
@@ -0,0 +1,251 @@
+"""
+Batched geometry optimization of many molecules at once on a model potential, e.g. to pre-relax candidates before
+they are optimized with DFT. Positions are in angstrom, energies in Hartree and forces in Hartree / angstrom.
+"""
+
+from abc import ABC, abstractmethod
+
+import torch
+
+from tensorchem.molecules.geometry import Geometry
+from tensorchem.molecules.trajectory import OptTrajectory
+
+
+class BatchOptimizer(ABC):
+    """
+    Relaxes a padded batch of molecules. Each molecule has its own convergence test on its largest atomic force, and
+    converged molecules are frozen and dropped from the force evaluations, so the batch gets cheaper as it converges.
+    Steps are scaled down so that no atom moves further than max_step. Subclasses implement the step direction in
+    _displacement.
+
+    Args:
+        force_fn: callable taking B x Na atomic numbers and B x Na x 3 float32 coordinates and returning B energies and
+            B x Na x 3 forces, e.g. a TensorChemPipeline or InferenceEngine.evaluate_batch
+        at_nums: B x Na tensor of atomic numbers padded with 0
+        coords: B x Na x 3 tensor of initial positions
+        fmax: convergence threshold on the largest atomic force norm of each molecule
+        max_step: largest displacement of any atom in one step, in angstrom
+        device: device to optimize on
+    """
+    algorithm = None
+
+    def __init__(self, force_fn, at_nums, coords, fmax=1e-3, max_step=0.2, device="cpu"):
+        self.force_fn = force_fn
+        self.device = torch.device(device)
+        self.at_nums = at_nums.long().to(self.device)
+        self.mask = torch.ne(self.at_nums, 0).unsqueeze(-1).to(torch.float64)
+        self.coords = coords.to(self.device, torch.float64).clone()
+        self.fmax = fmax
+        self.max_step = max_step
+        self.n_steps = 0
+        n_mols = self.coords.shape[0]
+        self.energies = torch.zeros(n_mols, dtype=torch.float64, device=self.device)
+        self.forces = torch.zeros_like(self.coords)
+        self.compute_forces(torch.arange(n_mols, device=self.device))
+        self.converged = self.max_forces() < fmax
+
+    def compute_forces(self, active):
+        energies, forces = self.force_fn(self.at_nums[active], self.coords[active].to(torch.float32))
+        self.energies[active] = energies.detach().to(torch.float64)
+        self.forces[active] = forces.detach().to(torch.float64) * self.mask[active]
+
+    def max_forces(self):
+        """
+        Largest atomic force norm of each molecule
+        """
+        return self.forces.norm(dim=-1).max(-1).values
+
+    def step(self):
+        """
+        Takes one step for every molecule which has not converged
+        """
+        active = torch.nonzero(~self.converged).reshape(-1)
+        if active.shape[0] == 0:
+            return
+        displacement = self._displacement(active) * self.mask[active]
+        atom_steps = displacement.norm(dim=-1).max(-1).values
+        scale = torch.clamp(self.max_step / atom_steps.clamp(min=1e-12), max=1.0)
+        displacement = displacement * scale.reshape(-1, 1, 1)
+        old_forces = self.forces[active]
+        self.coords[active] = self.coords[active] + displacement
+        self.compute_forces(active)
+        self._update(active, displacement, old_forces)
+        self.converged[active] = self.max_forces()[active] < self.fmax
+        self.n_steps += 1
+
+    def run(self, max_steps=500, record_every=1):
+        """
+        Optimizes until every molecule has converged or max_steps steps were taken. Every record_every-th step of each
+        molecule is recorded, along with its first and final geometries, with its energy and largest force as labels.
+
+        Returns:
+            trajectories: list of one OptTrajectory per molecule, ending in its optimized geometry
+        """
+        trajectories = []
+        for _ in range(self.coords.shape[0]):
+            trajectory = OptTrajectory()
+            trajectory.opt_algo = self.algorithm
+            trajectories.append(trajectory)
+        self._record(trajectories, torch.arange(self.coords.shape[0]))
+        for _ in range(max_steps):
+            if bool(self.converged.all()):
+                break
+            active = torch.nonzero(~self.converged).reshape(-1)
+            self.step()
+            if self.n_steps % record_every == 0:
+                self._record(trajectories, active)
+            else:
+                self._record(trajectories, active[self.converged[active]])
+        if self.n_steps % record_every != 0:
+            self._record(trajectories, torch.nonzero(~self.converged).reshape(-1))
+        return trajectories
+
+    def _record(self, trajectories, idx):
+        if idx.shape[0] == 0:
+            return
+        idx = idx.cpu()
+        coords, energies = self.coords[idx].float().cpu(), self.energies[idx].cpu()
+        at_nums, max_forces = self.at_nums[idx].cpu(), self.max_forces()[idx].cpu()
+        for j, i in enumerate(idx.tolist()):
+            n_atoms = int(torch.count_nonzero(at_nums[j]))
+            labels = {"potential energy": energies[j], "max force": max_forces[j]}
+            trajectories[i].geometries.append(Geometry(at_nums[j, :n_atoms].to(torch.uint8),
+                                                       coords[j, :n_atoms].clone(), labels))
+
+    @abstractmethod
+    def _displacement(self, active):
+        """
+        Displacements of the molecules in active for one step, before scaling to max_step
+        """
+
+    def _update(self, active, displacement, old_forces):
+        return
+
+
+class FIRE(BatchOptimizer):
+    """
+    Fast inertial relaxation engine (Bitzek et al., Phys. Rev. Lett. 2006), with a time step, mixing parameter and
+    count of downhill steps per molecule. Each molecule moves with damped dynamics that are steered along its forces,
+    speeding up while going downhill and stopping and restarting slowly when it goes uphill.
+
+    Args:
+        dt: initial time step
+        dt_max: largest time step
+        n_min: downhill steps before the time step grows
+        alpha: initial mixing of the velocity towards the force direction
+        further arguments as for BatchOptimizer
+    """
+    algorithm = "fire"
+
+    def __init__(self, force_fn, at_nums, coords, dt=1.0, dt_max=10.0, n_min=5, alpha=0.1, f_inc=1.1, f_dec=0.5,
+                 f_alpha=0.99, **kwargs):
+        super().__init__(force_fn, at_nums, coords, **kwargs)
+        n_mols = self.coords.shape[0]
+        self.velocities = torch.zeros_like(self.coords)
+        self.dt = torch.full((n_mols,), dt, dtype=torch.float64, device=self.device)
+        self.alpha = torch.full((n_mols,), alpha, dtype=torch.float64, device=self.device)
+        self.n_downhill = torch.zeros(n_mols, dtype=torch.long, device=self.device)
+        self.dt_max, self.n_min, self.alpha_start = dt_max, n_min, alpha
+        self.f_inc, self.f_dec, self.f_alpha = f_inc, f_dec, f_alpha
+
+    def _displacement(self, active):
+        forces, velocities = self.forces[active], self.velocities[active]
+        dt, alpha, n_downhill = self.dt[active], self.alpha[active], self.n_downhill[active]
+        power = (forces * velocities).sum((-1, -2))
+        downhill = power > 0
+        force_norms = forces.norm(dim=(-1, -2)).clamp(min=1e-12).reshape(-1, 1, 1)
+        mixed = (1.0 - alpha.reshape(-1, 1, 1)) * velocities + \
+            alpha.reshape(-1, 1, 1) * forces / force_norms * velocities.norm(dim=(-1, -2)).reshape(-1, 1, 1)
+        velocities = torch.where(downhill.reshape(-1, 1, 1), mixed, torch.zeros_like(velocities))
+        speed_up = downhill & (n_downhill > self.n_min)
+        dt = torch.where(speed_up, torch.clamp(dt * self.f_inc, max=self.dt_max),
+                         torch.where(downhill, dt, dt * self.f_dec))
+        alpha = torch.where(speed_up, alpha * self.f_alpha,
+                            torch.where(downhill, alpha, torch.full_like(alpha, self.alpha_start)))
+        self.n_downhill[active] = torch.where(downhill, n_downhill + 1, torch.zeros_like(n_downhill))
+        velocities = velocities + dt.reshape(-1, 1, 1) * forces
+        self.velocities[active], self.dt[active], self.alpha[active] = velocities, dt, alpha
+        return dt.reshape(-1, 1, 1) * velocities
+
+
+class LBFGS(BatchOptimizer):
+    """
+    Limited memory BFGS without line search, as in ASE, with the last `memory` steps and force changes of every
+    molecule stacked into B x memory x 3Na tensors, so the two loop recursion runs for the whole batch at once. Pairs
+    with negative curvature are not stored.
+
+    Args:
+        memory: number of previous steps used to approximate the inverse Hessian
+        alpha: initial Hessian guess in Hartree / angstrom^2, used until the first step is stored
+        further arguments as for BatchOptimizer
+    """
+    algorithm = "lbfgs"
+
+    def __init__(self, force_fn, at_nums, coords, memory=10, alpha=2.5, **kwargs):
+        super().__init__(force_fn, at_nums, coords, **kwargs)
+        n_mols, n_dims = self.coords.shape[0], self.coords[0].numel()
+        self.steps = torch.zeros(n_mols, memory, n_dims, dtype=torch.float64, device=self.device)
+        self.force_changes = torch.zeros_like(self.steps)
+        self.rho = torch.zeros(n_mols, memory, dtype=torch.float64, device=self.device)
+        self.alpha = alpha
+
+    def _displacement(self, active):
+        steps, changes, rho = self.steps[active], self.force_changes[active], self.rho[active]
+        q = -self.forces[active].reshape(active.shape[0], -1)
+        memory = rho.shape[1]
+        alphas = [None] * memory
+        for i in reversed(range(memory)):
+            alphas[i] = rho[:, i] * (steps[:, i] * q).sum(-1)
+            q = q - alphas[i].unsqueeze(-1) * changes[:, i]
+        # Scale by s.y / y.y of the latest pair, or 1 / alpha before any pair is stored
+        sy, yy = (steps[:, -1] * changes[:, -1]).sum(-1), torch.square(changes[:, -1]).sum(-1)
+        gamma = torch.where(rho[:, -1] > 0, sy / yy.clamp(min=1e-30), torch.full_like(sy, 1.0 / self.alpha))
+        r = gamma.unsqueeze(-1) * q
+        for i in range(memory):
+            beta = rho[:, i] * (changes[:, i] * r).sum(-1)
+            r = r + steps[:, i] * (alphas[i] - beta).unsqueeze(-1)
+        return -r.reshape(self.coords[active].shape)
+
+    def _update(self, active, displacement, old_forces):
+        step = displacement.reshape(active.shape[0], -1)
+        change = (old_forces - self.forces[active]).reshape(active.shape[0], -1)
+        curvature = (step * change).sum(-1)
+        store = curvature > 1e-12
+        rolled_steps = torch.cat([self.steps[active, 1:], step.unsqueeze(1)], 1)
+        rolled_changes = torch.cat([self.force_changes[active, 1:], change.unsqueeze(1)], 1)
+        rolled_rho = torch.cat([self.rho[active, 1:], (1.0 / curvature.clamp(min=1e-12)).unsqueeze(1)], 1)
+        self.steps[active] = torch.where(store.reshape(-1, 1, 1), rolled_steps, self.steps[active])
+        self.force_changes[active] = torch.where(store.reshape(-1, 1, 1), rolled_changes, self.force_changes[active])
+        self.rho[active] = torch.where(store.reshape(-1, 1), rolled_rho, self.rho[active])
+
+
+OPTIMIZERS = {"fire": FIRE, "lbfgs": LBFGS}
+
+
+def optimize_geometries(force_fn, geometries, algorithm="lbfgs", max_steps=500, record_every=1, **kwargs):
+    """
+    Relaxes a list of Geometries of any sizes together in one padded batch
+
+    Args:
+        force_fn: callable returning energies and forces, as for BatchOptimizer
+        geometries: list of Geometries
+        algorithm: "fire" or "lbfgs"
+        max_steps: largest number of steps
+        record_every: steps between recorded geometries
+        kwargs: further arguments for the optimizer, e.g. fmax
+
+    Returns:
+        trajectories: list of one OptTrajectory per geometry
+        converged: bool tensor of the molecules which converged
+    """
+    if algorithm not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer {algorithm}, expected one of {list(OPTIMIZERS.keys())}")
+    max_atoms = max(geom.n_atoms for geom in geometries)
+    at_nums = torch.zeros(len(geometries), max_atoms, dtype=torch.long)
+    coords = torch.zeros(len(geometries), max_atoms, 3)
+    for i, geom in enumerate(geometries):
+        at_nums[i, :geom.n_atoms] = geom.atoms.long()
+        coords[i, :geom.n_atoms] = geom.xyz
+    optimizer = OPTIMIZERS[algorithm](force_fn, at_nums, coords, **kwargs)
+    trajectories = optimizer.run(max_steps, record_every)
+    return trajectories, optimizer.converged.cpu()
@@ -2,34 +2,193 @@
 Functions for generating samples of molecules, such as Normal Modes Sampling
 """
 
+import os
+import math
+import zlib
+import warnings
+import multiprocessing
+
+import numpy as np
 import torch
-from qcelemental import periodictable, physical_constants
+from qcelemental import constants
+
+from tensorchem.molecules.filters import plausibility_mask, merge_reports
+from tensorchem.molecules.geometry import Geometry
+from tensorchem.molecules.molecule import Molecule
+from tensorchem.molecules.trajectory import NMSTrajectory
+
+# Boltzmann constant in mDyne * angstrom / K, to go with force constants in mDyne / angstrom
+KB = constants.kb * constants.conversion_factor("joule", "millidyne * angstrom")
+
+
+def sample_normal_modes(conformer, n_samples, temperature, generator=None):
+    """
+    Normal Mode Sampling of a conformer (Smith et al., Chem. Sci. 2017). Each sample draws a random fraction c_i of a
+    random total c in [0, 1) for each mode and displaces along the mode by +/- sqrt(3 c_i Na kB T / K_i), where K_i is
+    the force constant of the mode. Every sample is drawn at once as n_samples x n_modes tensors, and the
+    displacements are a single matmul against the stacked normal modes.
+
+    Args:
+        conformer: Geometry with 'normal modes' (n_modes x Na x 3) and 'force constants' (n_modes, mDyne/angstrom)
+            labels
+        n_samples: number of geometries to sample
+        temperature: temperature in K
+        generator: optional torch.Generator for reproducible samples
+
+    Returns:
+        trajectory: NMSTrajectory of the sampled geometries
+    """
+    coords = _normal_mode_coords(conformer, n_samples, temperature, generator)
+    return _nms_trajectory(conformer, temperature, coords)
+
+
+def sample_plausible_normal_modes(conformer, n_samples, temperature, generator=None, oversample=1.2, max_rounds=10,
+                                  max_draw=10000, **filter_kwargs):
+    """
+    Normal Mode Sampling which oversamples and drops implausible geometries with plausibility_mask, checking the bond
+    topology against the conformer. Each round draws oversample x the remaining samples divided by the acceptance
+    rate seen so far, at most max_draw, until n_samples are kept. The trajectory comes up short, with a warning, if
+    more than max_rounds are needed or a round accepts no samples at all, as then the filter rejects (nearly) every
+    sample of this conformer and temperature.
+
+    Args:
+        conformer, n_samples, temperature, generator: as for sample_normal_modes
+        oversample: ratio of the samples drawn to the expected number needed in each round
+        max_rounds: maximum number of rounds of sampling
+        max_draw: maximum number of samples drawn in one round
+        filter_kwargs: further arguments for plausibility_mask, e.g. min_scale and bond_scale
+
+    Returns:
+        trajectory: NMSTrajectory of the kept geometries
+        report: the plausibility_mask report summed over every round
+    """
+    kept, reports = [conformer.xyz.new_zeros(0, conformer.n_atoms, 3)], []
+    n_kept, n_drawn, n_accepted = 0, 0, 0
+    for _ in range(max_rounds):
+        if n_kept >= n_samples:
+            break
+        acceptance = max(n_accepted, 1) / n_drawn if n_drawn else 1.0
+        n_draw = min(math.ceil(oversample * (n_samples - n_kept) / acceptance), max_draw)
+        coords = _normal_mode_coords(conformer, n_draw, temperature, generator)
+        keep, report = plausibility_mask(conformer.atoms, coords, reference=conformer.xyz, **filter_kwargs)
+        kept.append(coords[keep][:n_samples - n_kept])
+        reports.append(report)
+        n_kept += kept[-1].shape[0]
+        n_drawn += n_draw
+        n_accepted += report["n_accepted"]
+        if report["n_accepted"] == 0:
+            break
+    if n_kept < n_samples:
+        warnings.warn(f"kept {n_kept} of {n_samples} normal mode samples, {n_drawn - n_accepted} of {n_drawn} drawn "
+                      f"were implausible")
+    return _nms_trajectory(conformer, temperature, torch.cat(kept)), merge_reports(reports)
+
 
+def _normal_mode_coords(conformer, n_samples, temperature, generator=None):
+    n_atoms = conformer.n_atoms
+    normal_modes = torch.as_tensor(conformer.labels['normal modes'], dtype=torch.float64).reshape(-1, n_atoms * 3)
+    force_constants = torch.as_tensor(conformer.labels['force constants'], dtype=torch.float64).reshape(-1)
+    n_modes = normal_modes.shape[0]
 
-def sample_normal_modes(conformer, n_samples, temperature):
+    coefficients = torch.rand(n_samples, n_modes, generator=generator, dtype=torch.float64)
+    scales = torch.rand(n_samples, 1, generator=generator, dtype=torch.float64)
+    coefficients = scales * coefficients / coefficients.sum(-1, keepdim=True)
+    signs = torch.randint(0, 2, (n_samples, n_modes), generator=generator).to(torch.float64) * 2.0 - 1.0
+    displacement_scalars = signs * torch.sqrt(3.0 * coefficients * n_atoms * KB * temperature / force_constants)
+    displacements = (displacement_scalars @ normal_modes).reshape(n_samples, n_atoms, 3)
+    return (conformer.xyz.to(torch.float64) + displacements).to(conformer.xyz.dtype)
+
+
+def _nms_trajectory(conformer, temperature, coords):
+    trajectory = NMSTrajectory()
+    trajectory.nms_temp = temperature
+    trajectory.conformer = conformer
+    trajectory.geometries = [Geometry(conformer.atoms, xyz) for xyz in coords]
+    return trajectory
+
+
+def conformer_generator(seed, name, index):
+    """
+    A torch.Generator for conformer index of the mset name. The stream depends only on the seed, the name and the
+    index, so samples are the same whichever worker draws them and in whatever order the msets are given.
+    """
+    state = np.random.SeedSequence([seed, zlib.crc32(name.encode()), index]).generate_state(1, dtype=np.uint64)
+    return torch.Generator().manual_seed(int(state[0]))
+
+
+def sample_mset(filename, out_path, n_samples, temperature, seed=0, filter_kwargs=None):
     """
-    Take a conformer and return randomly sampled geometries by applying
-    random displacements according to the normal modes of the molecule
+    Normal Mode Sampling of every conformer in an mset, i.e. each geometry with 'normal modes' and 'force constants'
+    labels. The sampled NMSTrajectories are added to the molecule, which is written to out_path under the same name
+    with an atomic rename, so an interrupted run never leaves a partial mset behind. When filter_kwargs is given,
+    implausible samples are filtered out with sample_plausible_normal_modes and those arguments.
+
+    Returns:
+        name: the mset filename
+        n_conformers: number of conformers sampled
+        n_geometries: number of geometries sampled
+        n_rejected: number of implausible samples dropped
     """
-    atoms = conformer.atoms
-    n_atoms = atoms.shape[0]
-    original_xyz = conformer.xyz
-    masses = [periodictable.to_mass(atom) for atom in atoms.tolist()]
-    normal_modes = conformer.labels['normal modes']
+    name = os.path.basename(filename)
+    molecule = Molecule()
+    molecule.load(name, os.path.dirname(filename) or os.getcwd())
+    conformers = [geom for geom in molecule.geometries if 'normal modes' in geom.labels]
+    n_geometries, n_rejected = 0, 0
+    for i, conformer in enumerate(conformers):
+        generator = conformer_generator(seed, name, i)
+        if filter_kwargs is None:
+            trajectory = sample_normal_modes(conformer, n_samples, temperature, generator=generator)
+        else:
+            trajectory, report = sample_plausible_normal_modes(conformer, n_samples, temperature, generator=generator,
+                                                               **filter_kwargs)
+            n_rejected += report["n_samples"] - report["n_accepted"]
+        molecule.trajectories.append(trajectory)
+        n_geometries += len(trajectory.geometries)
+    molecule.filename, molecule.filepath = name, out_path
+    tmp_name = f"{name}.tmp{os.getpid()}"
+    molecule.save(tmp_name, out_path)
+    os.replace(os.path.join(out_path, tmp_name), os.path.join(out_path, name))
+    return name, len(conformers), n_geometries, n_rejected
+
+
+def _sample_mset_job(job):
+    return sample_mset(*job)
+
 
-    force_constants = conformer.labels['force constants']
-    n_modes = len(normal_modes)
-    kb = physical_constants.pc['boltzmann constant']
+def _init_worker():
+    # Each worker samples one mset at a time, so intra-op threads would only oversubscribe the cores
+    torch.set_num_threads(1)
 
-    new_coords = []
-    for sample in range(n_samples):
-        cis = torch.rand(n_modes)
-        c_scale = torch.rand(1)
-        cis = c_scale * cis / cis.sum()
-        displacement_scalars = (((torch.bernoulli(torch.fill(n_modes, 0.5)) - 0.5) * 2.0)
-                               * torch.sqrt(3.0 * cis * n_atoms * kb * temperature / force_constants))
-        displacements = [mode * displacement_scalars[i] for i, mode in enumerate(normal_modes)]
 
+def sample_msets(filenames, out_path, n_samples, temperature, seed=0, filter_kwargs=None, n_workers=None,
+                 chunksize=1):
+    """
+    Normal Mode Sampling of the conformers of many msets over a process pool. Each worker loads, samples and writes
+    one mset at a time and only a summary is sent back, so memory is bounded by n_workers msets however many are
+    sampled. Every conformer draws from its own stream from conformer_generator, so the msets written are identical
+    for any number of workers.
+
+    Args:
+        filenames: list of mset filenames, with unique basenames
+        out_path: directory to write the sampled msets to, which may be the input directory
+        n_samples: number of geometries to sample per conformer
+        temperature: temperature in K
+        seed: base seed of the per conformer streams
+        filter_kwargs: optional arguments for sample_plausible_normal_modes, to drop implausible samples
+        n_workers: number of processes, None for the CPU count and 1 to sample in this process
+        chunksize: number of msets sent to a worker at once
+
+    Yields:
+        name, n_conformers, n_geometries, n_rejected: for each mset as it is written, in order of completion
+    """
+    names = [os.path.basename(filename) for filename in filenames]
+    if len(set(names)) != len(names):
+        raise ValueError("mset filenames must be unique, the sampled msets are written under the same names")
+    os.makedirs(out_path, exist_ok=True)
+    jobs = [(filename, out_path, n_samples, temperature, seed, filter_kwargs) for filename in filenames]
+    if n_workers == 1:
+        yield from map(_sample_mset_job, jobs)
+        return
+    with multiprocessing.Pool(n_workers, initializer=_init_worker) as pool:
+        yield from pool.imap_unordered(_sample_mset_job, jobs, chunksize=chunksize)
 
-def apply_transformation(coords, transformation):
-    transformation.mean(dim=1)
@@ -0,0 +1,247 @@
+"""
+Selection of diverse subsets of geometries, e.g. to drop the near duplicate frames of dynamics trajectories before
+they are labelled or trained on.
+"""
+
+import math
+
+import torch
+
+from tensorchem.featurizers.util import dist_matrix_dense
+from tensorchem.molecules.transformations import center
+
+DEDUPLICATION_MODES = ("leader", "cluster")
+SUBSAMPLING_METHODS = ("stride", "farthest_point", "energy")
+
+
+def aligned_rmsd(coords, reference):
+    """
+    RMSD after optimal superposition of each geometry onto its reference. The minimum over rotations follows from the
+    covariance matrices, so no rotation is applied.
+
+    Args:
+        coords: ... x Na x 3 tensor of atomic positions
+        reference: tensor of reference positions broadcastable to coords
+
+    Returns:
+        rmsd: tensor of the leading dimensions of coords
+    """
+    coords, reference = torch.broadcast_tensors(coords, reference)
+    shape = coords.shape[:-2]
+    coords, _ = center(coords.reshape((-1,) + coords.shape[-2:]).double())
+    reference, _ = center(reference.reshape((-1,) + reference.shape[-2:]).double())
+    sq_norms = torch.square(coords).sum((-1, -2)) + torch.square(reference).sum((-1, -2))
+    covariance = torch.bmm(reference.transpose(-1, -2), coords)
+    return _rmsd(covariance, sq_norms, coords.shape[-2]).reshape(shape).float()
+
+
+def pairwise_aligned_rmsd(coords, others=None, chunk_size=1024):
+    """
+    Aligned RMSD between every pair of geometries of the same molecule, built in chunks of rows
+
+    Args:
+        coords: n x Na x 3 tensor of atomic positions
+        others: optional k x Na x 3 tensor of positions, coords itself when None
+        chunk_size: number of rows computed at once, the memory is chunk_size x k 3 x 3 matrices
+
+    Returns:
+        rmsd: n x k tensor
+    """
+    coords, _ = center(coords.double())
+    others = coords if others is None else center(others.double())[0]
+    other_sq_norms = torch.square(others).sum((-1, -2))
+    rows = [coords.new_zeros(0, others.shape[0])]
+    flat_others = others.permute(0, 2, 1).reshape(-1, others.shape[1])
+    for chunk in torch.split(coords, chunk_size):
+        # One GEMM of (k 3) x Na by Na x (n 3) for every covariance matrix of the chunk
+        covariance = torch.mm(flat_others, chunk.permute(1, 0, 2).reshape(chunk.shape[1], -1))
+        covariance = covariance.reshape(others.shape[0], 3, chunk.shape[0], 3).permute(2, 0, 1, 3).reshape(-1, 3, 3)
+        sq_norms = torch.square(chunk).sum((-1, -2)).unsqueeze(-1) + other_sq_norms
+        rows.append(_rmsd(covariance, sq_norms.reshape(-1), coords.shape[-2]).reshape(chunk.shape[0], others.shape[0]))
+    return torch.cat(rows).float()
+
+
+def _rmsd(covariance, sq_norms, n_atoms, n_iterations=50):
+    """
+    Aligned RMSD of centered geometries from their B x 3 x 3 covariance matrices and the B sums of their squared
+    norms, by the quaternion characteristic polynomial method (Theobald, Acta Cryst. A 2005). The maximum overlap is
+    the largest root of the quartic characteristic polynomial of a 4 x 4 key matrix, found by Newton iterations from
+    the upper bound sq_norms / 2, which are elementwise and much faster than batched SVDs of 3 x 3 matrices.
+    """
+    (s_xx, s_xy, s_xz), (s_yx, s_yy, s_yz), (s_zx, s_zy, s_zz) = [row.unbind(-1) for row in covariance.unbind(-2)]
+    key = torch.stack([s_xx + s_yy + s_zz, s_yz - s_zy, s_zx - s_xz, s_xy - s_yx,
+                       s_yz - s_zy, s_xx - s_yy - s_zz, s_xy + s_yx, s_zx + s_xz,
+                       s_zx - s_xz, s_xy + s_yx, -s_xx + s_yy - s_zz, s_yz + s_zy,
+                       s_xy - s_yx, s_zx + s_xz, s_yz + s_zy, -s_xx - s_yy + s_zz], dim=-1).reshape(-1, 4, 4)
+    c2 = -2.0 * torch.square(covariance).sum((-1, -2))
+    c1 = -8.0 * torch.linalg.det(covariance)
+    c0 = torch.linalg.det(key)
+    overlap = 0.5 * sq_norms
+    for _ in range(n_iterations):
+        sq_overlap = overlap * overlap
+        value = (sq_overlap + c2) * sq_overlap + c1 * overlap + c0
+        slope = (4.0 * sq_overlap + 2.0 * c2) * overlap + c1
+        step = value / torch.where(slope == 0, torch.ones_like(slope), slope)
+        overlap = overlap - step
+        if torch.all(torch.abs(step) <= 1e-11 * torch.abs(overlap)):
+            break
+    return ((sq_norms - 2.0 * overlap).clamp(min=0.0) / n_atoms).sqrt()
+
+
+def deduplicate(coords, threshold, mode="leader", chunk_size=1024):
+    """
+    Indices of a subset of geometries of one molecule in which no two are within threshold aligned RMSD.
+
+    Leader mode walks the geometries in order and keeps each one further than threshold from every geometry kept so
+    far. It costs O(n k) RMSDs for k kept geometries, computed chunk_size geometries at a time, so it suits long
+    trajectories. Cluster mode builds the full n x n RMSD matrix and keeps the centroids of Butina clustering, visiting
+    the geometries with the most neighbours within threshold first. It keeps fewer, more central geometries for
+    O(n^2) time and memory.
+
+    Args:
+        coords: n x Na x 3 tensor of atomic positions
+        threshold: RMSD in angstrom below which geometries are duplicates
+        mode: "leader" or "cluster"
+        chunk_size: number of geometries compared at once
+
+    Returns:
+        keep: sorted list of the indices of the kept geometries
+    """
+    if mode not in DEDUPLICATION_MODES:
+        raise ValueError(f"Unknown deduplication mode {mode}, expected one of {DEDUPLICATION_MODES}")
+    if mode == "cluster":
+        return _butina_centroids(pairwise_aligned_rmsd(coords, chunk_size=chunk_size) < threshold)
+    keep = []
+    for start in range(0, coords.shape[0], chunk_size):
+        chunk = coords[start:start + chunk_size]
+        candidates = torch.arange(chunk.shape[0])
+        if keep:
+            # Only chunk members which are not duplicates of an earlier leader can become leaders
+            min_rmsd = pairwise_aligned_rmsd(chunk, coords[keep], chunk_size).min(-1).values
+            candidates = candidates[min_rmsd >= threshold]
+        # The first remaining candidate leads and removes its duplicates from the rest of the chunk
+        while candidates.shape[0] > 0:
+            keep.append(start + int(candidates[0]))
+            candidates = candidates[1:][aligned_rmsd(chunk[candidates[1:]], chunk[candidates[0]]) >= threshold]
+    return keep
+
+
+def _butina_centroids(neighbours):
+    """
+    Butina clustering (J. Chem. Inf. Comput. Sci. 1999) of an n x n neighbour matrix. Geometries are visited in
+    order of decreasing neighbour count, and each one not yet in a cluster becomes a centroid of its free neighbours.
+    """
+    order = torch.sort(neighbours.sum(-1), descending=True, stable=True).indices
+    assigned = torch.zeros(neighbours.shape[0], dtype=torch.bool)
+    centroids = []
+    for idx in order.tolist():
+        if not assigned[idx]:
+            centroids.append(idx)
+            assigned |= neighbours[idx]
+            assigned[idx] = True
+    return sorted(centroids)
+
+
+def subsample(coords, method, n_select=None, fraction=None, stride=None, features=None, energies=None, n_bins=10,
+              generator=None):
+    """
+    Indices of a subset of the frames of a trajectory of one molecule, to thin out correlated frames.
+
+    Stride keeps every stride-th frame. Farthest point sampling starts from the first frame and repeatedly adds the
+    frame furthest from all those selected in feature space, by default the inverse interatomic distances, which
+    covers the visited configurations evenly. Energy sampling splits the energy range into n_bins equal bins and
+    draws the same number of frames at random from each bin, with the quota of bins that run out passed on to the
+    others, so rare high energy frames are kept.
+
+    Args:
+        coords: n x Na x 3 tensor of atomic positions
+        method: "stride", "farthest_point" or "energy"
+        n_select: number of frames to keep, for farthest_point and energy
+        fraction: fraction of the frames to keep instead of n_select
+        stride: frame stride, for stride
+        features: optional n x F tensor of features for farthest_point, e.g. symmetry functions
+        energies: n tensor of energies, for energy
+        n_bins: number of energy bins
+        generator: optional torch.Generator for energy sampling
+
+    Returns:
+        keep: sorted list of the indices of the kept frames
+    """
+    if method not in SUBSAMPLING_METHODS:
+        raise ValueError(f"Unknown subsampling method {method}, expected one of {SUBSAMPLING_METHODS}")
+    n_frames = coords.shape[0]
+    if method == "stride":
+        if stride is None:
+            stride = max(int(round(1.0 / fraction)), 1) if fraction is not None else 1
+        return list(range(0, n_frames, stride))
+    if n_select is None:
+        if fraction is None:
+            raise ValueError(f"{method} subsampling needs n_select or fraction")
+        n_select = math.ceil(fraction * n_frames)
+    n_select = min(n_select, n_frames)
+    if method == "farthest_point":
+        return farthest_point_indices(distance_features(coords) if features is None else features, n_select)
+    if energies is None:
+        raise ValueError("energy subsampling needs energies")
+    return energy_stratified_indices(energies, n_select, n_bins, generator)
+
+
+def distance_features(coords):
+    """
+    Inverse distances between every pair of atoms of each frame, as n x (Na (Na - 1) / 2) features which are
+    invariant to rotations and translations and weight the short distances that change the energy most
+    """
+    n_atoms = coords.shape[-2]
+    rows, cols = torch.triu_indices(n_atoms, n_atoms, offset=1)
+    return 1.0 / dist_matrix_dense(coords.float())[:, rows, cols].clamp(min=1e-6)
+
+
+def farthest_point_indices(features, n_select):
+    """
+    Greedy farthest point sampling of n_select rows of an n x F feature tensor, starting from the first row. Each
+    step gets the squared distances from the newest point to every row from one matrix-vector product, as
+    |f|^2 - 2 f.g + |g|^2, so it costs O(n n_select F). Selected rows are masked out, so duplicate rows never give
+    repeated indices.
+
+    Returns:
+        keep: sorted list of the selected row indices
+    """
+    features = features.reshape(features.shape[0], -1).double()
+    if features.shape[0] == 0 or n_select <= 0:
+        return []
+    sq_norms = torch.square(features).sum(-1)
+    selected = [0]
+    min_dist = sq_norms - 2.0 * torch.mv(features, features[0]) + sq_norms[0]
+    min_dist[0] = -math.inf
+    for _ in range(min(n_select, features.shape[0]) - 1):
+        idx = int(torch.argmax(min_dist))
+        selected.append(idx)
+        min_dist = torch.minimum(min_dist, sq_norms - 2.0 * torch.mv(features, features[idx]) + sq_norms[idx])
+        min_dist[idx] = -math.inf
+    return sorted(selected)
+
+
+def energy_stratified_indices(energies, n_select, n_bins=10, generator=None):
+    """
+    Draws n_select frames spread evenly over n_bins equal width bins of the energy range
+
+    Returns:
+        keep: sorted list of the selected indices
+    """
+    energies = torch.as_tensor(energies, dtype=torch.float64).reshape(-1)
+    n_select = min(n_select, energies.shape[0])
+    low, high = energies.min(), energies.max()
+    bins = ((energies - low) / (high - low).clamp(min=1e-12) * n_bins).long().clamp(max=n_bins - 1)
+    members = [torch.nonzero(bins == i).reshape(-1) for i in range(n_bins)]
+    members = [idx[torch.randperm(idx.shape[0], generator=generator)] for idx in members if idx.shape[0] > 0]
+    # Fill the bins level by level, so a bin with fewer frames than its share passes the rest to the others
+    quotas = [0] * len(members)
+    remaining = n_select
+    while remaining > 0:
+        open_bins = [i for i, idx in enumerate(members) if quotas[i] < idx.shape[0]]
+        share = max(remaining // len(open_bins), 1)
+        for i in open_bins:
+            take = min(share, members[i].shape[0] - quotas[i], remaining)
+            quotas[i] += take
+            remaining -= take
+    return sorted(int(i) for idx, quota in zip(members, quotas) for i in idx[:quota])
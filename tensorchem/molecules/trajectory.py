@@ -5,8 +5,12 @@ trajectory, or by applying perturbations (e.g. normal mode sampling)
 """
 
 import os
+import copy
+
+import torch
 
 from tensorchem.molecules.geometry import Geometry
+from tensorchem.molecules.selection import deduplicate, subsample
 
 
 class Trajectory:
@@ -24,6 +28,35 @@ class Trajectory:
         new_traj.geometries = [Geometry.from_json(geom) for geom in json_data["geometries"]]
         return new_traj
 
+    def deduplicate(self, threshold, mode="leader", chunk_size=1024):
+        """
+        A copy of the trajectory without near duplicate frames, keeping a subset in which no two geometries are within
+        threshold aligned RMSD (angstrom). See tensorchem.molecules.selection.deduplicate for the modes.
+        """
+        new_traj = copy.copy(self)
+        if not self.geometries:
+            new_traj.geometries = []
+            return new_traj
+        coords = torch.stack([geom.xyz for geom in self.geometries])
+        new_traj.geometries = [self.geometries[i] for i in deduplicate(coords, threshold, mode, chunk_size)]
+        return new_traj
+
+    def subsample(self, method, energy_key=None, **kwargs):
+        """
+        A copy of the trajectory with a subset of its frames, see tensorchem.molecules.selection.subsample for the
+        methods and their arguments. Energy subsampling reads the energies from the energy_key label of each frame.
+        """
+        new_traj = copy.copy(self)
+        if not self.geometries:
+            new_traj.geometries = []
+            return new_traj
+        coords = torch.stack([geom.xyz for geom in self.geometries])
+        if energy_key is not None:
+            kwargs["energies"] = torch.stack([torch.as_tensor(geom.labels[energy_key]).reshape(())
+                                              for geom in self.geometries])
+        new_traj.geometries = [self.geometries[i] for i in subsample(coords, method, **kwargs)]
+        return new_traj
+
     def write_xyz_trajectory(self, filename: str, filepath: str = None):
         if filepath is None:
             filepath = os.getcwd()
@@ -44,10 +77,11 @@ class OptTrajectory(Trajectory):
         data_dict["opt_algorithm"] = self.opt_algo
         return data_dict
 
-    def from_json(self, json_data: dict):
-        new_geom = super(OptTrajectory, self).from_json(json_data)
-        new_geom.opt_algo = json_data["opt_algo"]
-        return new_geom
+    @classmethod
+    def from_json(cls, json_data: dict):
+        new_traj = super(OptTrajectory, cls).from_json(json_data)
+        new_traj.opt_algo = json_data["opt_algorithm"]
+        return new_traj
 
 
 class NMSTrajectory(Trajectory):
@@ -60,11 +94,50 @@ class NMSTrajectory(Trajectory):
     def to_json(self):
         data_dict = super(NMSTrajectory, self).to_json()
         data_dict['nms_temp'] = self.nms_temp
-        data_dict['conformer'] = self.conformer.to_json()
+        data_dict['conformer'] = self.conformer.to_json() if self.conformer is not None else None
+        return data_dict
+
+    @classmethod
+    def from_json(cls, json_data: dict):
+        new_traj = super(NMSTrajectory, cls).from_json(json_data)
+        new_traj.nms_temp = json_data["nms_temp"]
+        if json_data["conformer"] is not None:
+            new_traj.conformer = Geometry.from_json(json_data["conformer"])
+        return new_traj
+
+
+class MDTrajectory(Trajectory):
+    def __init__(self, frame_interval: float = None, md_temp: float = None, friction: float = None):
+        super().__init__()
+        self.frame_interval = frame_interval
+        self.md_temp = md_temp
+        self.friction = friction
+        return
+
+    def to_json(self):
+        data_dict = super(MDTrajectory, self).to_json()
+        data_dict['frame_interval'] = self.frame_interval
+        data_dict['md_temp'] = self.md_temp
+        data_dict['friction'] = self.friction
         return data_dict
 
-    def from_json(self, json_data: dict):
-        new_geom = super(NMSTrajectory, self).from_json(json_data)
-        new_geom.nms_temp = json_data["nms_temp"]
-        new_geom.conformer = Geometry.from_json(json_data["conformer"])
-        return new_geom
+    @classmethod
+    def from_json(cls, json_data: dict):
+        new_traj = super(MDTrajectory, cls).from_json(json_data)
+        new_traj.frame_interval = json_data["frame_interval"]
+        new_traj.md_temp = json_data["md_temp"]
+        new_traj.friction = json_data["friction"]
+        return new_traj
+
+
+def trajectory_from_json(json_data: dict) -> Trajectory:
+    """
+    Loads a Trajectory of the subclass which wrote json_data, from the keys that subclass adds
+    """
+    if "nms_temp" in json_data:
+        return NMSTrajectory.from_json(json_data)
+    if "md_temp" in json_data:
+        return MDTrajectory.from_json(json_data)
+    if "opt_algorithm" in json_data:
+        return OptTrajectory.from_json(json_data)
+    return Trajectory.from_json(json_data)
@@ -0,0 +1,189 @@
+"""
+Batched rigid body transformations of molecular coordinates, for data augmentation and for aligning geometries.
+Coordinates are B x Na x 3 tensors, optionally with a B x Na mask of the real atoms so that zero padded batches keep
+their padding at the origin. Vector labels such as forces and dipoles are rotated with the same rotations.
+"""
+
+import torch
+
+
+def random_rotations(n_rotations, generator=None, dtype=torch.float32, device="cpu"):
+    """
+    Rotation matrices uniformly distributed over SO(3), from normalized Gaussian quaternions
+
+    Returns:
+        rotations: n_rotations x 3 x 3 tensor
+    """
+    quaternions = torch.randn(n_rotations, 4, generator=generator, dtype=torch.float64)
+    quaternions = (quaternions / quaternions.norm(dim=-1, keepdim=True)).to(dtype=dtype, device=device)
+    return quaternion_to_matrix(quaternions)
+
+
+def quaternion_to_matrix(quaternions):
+    """
+    Rotation matrices of ... x 4 unit quaternions (w, x, y, z)
+    """
+    w, x, y, z = quaternions.unbind(-1)
+    rotations = torch.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w),
+                             2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w),
+                             2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], dim=-1)
+    return rotations.reshape(quaternions.shape[:-1] + (3, 3))
+
+
+def centroid(coords, mask=None):
+    """
+    Mean position of the real atoms of each molecule
+
+    Args:
+        coords: B x Na x 3 tensor of atomic positions
+        mask: optional B x Na bool tensor of the real atoms
+
+    Returns:
+        centroids: B x 3 tensor
+    """
+    if mask is None:
+        return coords.mean(-2)
+    mask = mask.unsqueeze(-1).to(coords.dtype)
+    return (coords * mask).sum(-2) / mask.sum(-2).clamp(min=1.0)
+
+
+def center(coords, mask=None):
+    """
+    Translates each molecule so that the centroid of its real atoms is at the origin, leaving padding at 0
+
+    Returns:
+        centered: B x Na x 3 tensor of centered positions
+        centroids: B x 3 tensor of the centroids that were subtracted
+    """
+    centroids = centroid(coords, mask)
+    centered = coords - centroids.unsqueeze(-2)
+    if mask is not None:
+        centered = centered * mask.unsqueeze(-1).to(coords.dtype)
+    return centered, centroids
+
+
+def apply_transformation(coords, rotation=None, translation=None, mask=None):
+    """
+    Rotates about the origin, then translates, each molecule of a batch
+
+    Args:
+        coords: B x Na x 3 tensor of atomic positions
+        rotation: optional B x 3 x 3 tensor of rotation matrices
+        translation: optional B x 3 tensor of translations
+        mask: optional B x Na bool tensor of the real atoms, padding is left at 0
+
+    Returns:
+        transformed: B x Na x 3 tensor
+    """
+    if rotation is not None:
+        coords = torch.bmm(coords, rotation.to(coords.dtype).transpose(-1, -2))
+    if translation is not None:
+        coords = coords + translation.to(coords.dtype).unsqueeze(-2)
+        if mask is not None:
+            coords = coords * mask.unsqueeze(-1).to(coords.dtype)
+    return coords
+
+
+def rotate_vectors(vectors, rotation):
+    """
+    Rotates vector labels, e.g. B x Na x 3 forces or B x 3 dipoles, by one B x 3 x 3 rotation per molecule
+    """
+    return torch.einsum("bij,b...j->b...i", rotation.to(vectors.dtype), vectors)
+
+
+def kabsch(coords, reference, mask=None):
+    """
+    The proper rotations which best superimpose each centered molecule onto its centered reference in the least squares
+    sense (Kabsch, Acta Cryst. A 1976), from the SVD of the 3 x 3 covariance matrices
+
+    Args:
+        coords: B x Na x 3 tensor of atomic positions
+        reference: B x Na x 3 or Na x 3 tensor of reference positions
+        mask: optional B x Na bool tensor of the real atoms
+
+    Returns:
+        rotations: B x 3 x 3 tensor, such that (coords - centroid) @ rotations^T is aligned with the reference
+    """
+    coords, _ = center(coords, mask)
+    reference, _ = center(reference.expand_as(coords), mask)
+    covariance = torch.bmm(reference.transpose(-1, -2), coords).to(torch.float64)
+    u, _, vh = torch.linalg.svd(covariance)
+    # Flip the smallest singular direction where the best orthogonal transformation is a reflection
+    sign = torch.sign(torch.linalg.det(u) * torch.linalg.det(vh))
+    sign = torch.where(sign == 0, torch.ones_like(sign), sign)
+    u = torch.cat([u[..., :2], u[..., 2:] * sign.reshape(-1, 1, 1)], dim=-1)
+    return torch.bmm(u, vh).to(coords.dtype)
+
+
+def align(coords, reference, mask=None):
+    """
+    Superimposes each molecule onto its reference with the Kabsch rotation and the reference centroid
+
+    Returns:
+        aligned: B x Na x 3 tensor of aligned positions
+        rotations: B x 3 x 3 tensor of the rotations applied, for rotating vector labels to match
+    """
+    reference = reference.expand_as(coords)
+    rotations = kabsch(coords, reference, mask)
+    centered, _ = center(coords, mask)
+    return apply_transformation(centered, rotations, centroid(reference, mask), mask), rotations
+
+
+def rmsd(coords, reference, mask=None):
+    """
+    Root mean square deviation of the real atoms of each molecule from its reference, without alignment
+
+    Returns:
+        rmsd: B tensor
+    """
+    sq_dist = torch.square(coords - reference).sum(-1)
+    if mask is None:
+        return sq_dist.mean(-1).sqrt()
+    mask = mask.to(coords.dtype)
+    return ((sq_dist * mask).sum(-1) / mask.sum(-1).clamp(min=1.0)).sqrt()
+
+
+class RandomRigidTransform:
+    """
+    Data augmentation by a uniformly random rotation of each molecule about its centroid, and an optional random
+    translation, applied to the coordinates and to vector labels such as forces. Works on single dataset items with
+    Na x 3 coordinates, e.g. as MixedDataset.transform, and on padded batches from pad_collate, where it costs one
+    batched matmul for the whole batch. Energies and other scalar labels are invariant and left untouched.
+
+    Args:
+        coords_key: key of the coordinates
+        vector_keys: keys of labels with a trailing dimension of 3 to rotate with the molecule
+        atomic_num_key: key of the atomic numbers, used to keep the padding of batches at the origin
+        translation: standard deviation in angstrom of a random translation after the rotation, 0 for none
+        generator: optional torch.Generator for reproducible augmentation
+    """
+
+    def __init__(self, coords_key="coordinates", vector_keys=(), atomic_num_key="atomic_numbers", translation=0.0,
+                 generator=None):
+        self.coords_key = coords_key
+        self.vector_keys = list(vector_keys)
+        self.atomic_num_key = atomic_num_key
+        self.translation = translation
+        self.generator = generator
+
+    def __call__(self, sample):
+        coords = sample[self.coords_key]
+        batched = coords.dim() == 3
+        if not batched:
+            sample = {key: value.unsqueeze(0) for key, value in sample.items()}
+            coords = sample[self.coords_key]
+        mask = torch.ne(sample[self.atomic_num_key], 0) if self.atomic_num_key in sample else None
+        rotations = random_rotations(coords.shape[0], self.generator, dtype=coords.dtype).to(coords.device)
+        translation = None
+        if self.translation:
+            translation = self.translation * torch.randn(coords.shape[0], 3, generator=self.generator,
+                                                         dtype=coords.dtype).to(coords.device)
+        centered, centroids = center(coords, mask)
+        translation = centroids if translation is None else centroids + translation
+        sample = dict(sample)
+        sample[self.coords_key] = apply_transformation(centered, rotations, translation, mask)
+        for key in self.vector_keys:
+            sample[key] = rotate_vectors(sample[key], rotations.to(sample[key].device))
+        if not batched:
+            sample = {key: value.squeeze(0) for key, value in sample.items()}
+        return sample
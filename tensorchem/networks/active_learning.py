@@ -0,0 +1,205 @@
+"""
+Active learning by query by committee: candidate geometries, e.g. from normal mode sampling or dynamics, are scored by
+the disagreement of an ensemble of TensorChem models, and the most uncertain diverse ones are written out as Q-Chem
+inputs for labelling.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import os
+from collections import deque
+
+import torch
+
+from tensorchem.molecules import Molecule
+from tensorchem.molecules.selection import aligned_rmsd
+from tensorchem.networks.ensemble import TensorChemEnsemble, evaluate_committee
+from tensorchem.util.qchem import write_input
+
+DISAGREEMENT_METRICS = ("force", "energy")
+
+
+def committee_disagreement(ensemble, sym_func_params, geometries, metric="force", batch_size=64, precision=None):
+    """
+    Scores geometries by the disagreement of the members of an ensemble. The force metric is the largest norm over
+    atoms of the standard deviation of the member forces, and the energy metric is the standard deviation of the
+    member energies per atom, so molecules of different sizes compare fairly.
+
+    Args:
+        ensemble: a TensorChemEnsemble
+        sym_func_params: dict of symmetry function parameter tensors the members were trained with
+        geometries: list of Geometries
+        metric: "force" or "energy"
+        batch_size: number of geometries evaluated together, after sorting by size
+        precision: optional featurization precision policy
+
+    Returns:
+        scores: tensor with the disagreement of each geometry, in the order given
+    """
+    if metric not in DISAGREEMENT_METRICS:
+        raise ValueError(f"Unknown disagreement metric {metric}, expected one of {DISAGREEMENT_METRICS}")
+    device = ensemble.elements.device
+    scores = torch.zeros(len(geometries))
+    order = sorted(range(len(geometries)), key=lambda i: geometries[i].n_atoms)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        at_nums, coords = _pad([geometries[i] for i in batch])
+        at_nums, coords = at_nums.to(device), coords.to(device)
+        committee = evaluate_committee(ensemble, sym_func_params, at_nums, coords, forces=metric == "force",
+                                       precision=precision)
+        if metric == "force":
+            batch_scores = committee["force_std"].norm(dim=-1).max(-1).values
+        else:
+            batch_scores = committee["energy_std"] / torch.count_nonzero(at_nums, dim=-1)
+        scores[batch] = batch_scores.detach().cpu()
+    return scores
+
+
+def _pad(geometries):
+    max_atoms = max(geom.n_atoms for geom in geometries)
+    at_nums = torch.zeros(len(geometries), max_atoms, dtype=torch.long)
+    coords = torch.zeros(len(geometries), max_atoms, 3)
+    for i, geom in enumerate(geometries):
+        at_nums[i, :geom.n_atoms] = geom.atoms.long()
+        coords[i, :geom.n_atoms] = geom.xyz
+    return at_nums, coords
+
+
+def mset_candidates(filenames):
+    """
+    Streams the geometries of msets one mset at a time
+
+    Yields:
+        name: the mset filename without extension and the index of the geometry
+        geometry: the Geometry
+        charge: the charge of the molecule, 0 when the mset has none
+    """
+    for filename in filenames:
+        molecule = Molecule()
+        molecule.load(os.path.basename(filename), os.path.dirname(filename) or os.getcwd())
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        for i, geometry in enumerate(molecule.geometries):
+            yield f"{stem}_{i}", geometry, molecule.charge or 0
+
+
+_worker = {}
+
+
+def _init_worker(checkpoints, metric, batch_size, n_threads):
+    torch.set_num_threads(n_threads)
+    ensemble, hyper_params = TensorChemEnsemble.from_checkpoints(checkpoints)
+    _worker.update(ensemble=ensemble.eval(), metric=metric, batch_size=batch_size,
+                   precision=hyper_params.get('precision'),
+                   sym_func_params={key: torch.as_tensor(value, dtype=torch.float32)
+                                    for key, value in hyper_params['sym_func_params'].items()})
+
+
+def _score_chunk(geometries):
+    return committee_disagreement(_worker["ensemble"], _worker["sym_func_params"], geometries, _worker["metric"],
+                                  _worker["batch_size"], _worker["precision"])
+
+
+def select_candidates(checkpoints, candidates, k, metric="force", min_rmsd=0.1, pool_factor=4, chunk_size=256,
+                      batch_size=64, n_workers=None, n_threads=1, max_pending=None):
+    """
+    Streams candidates through committee scoring on a process pool and selects the k most uncertain, skipping any
+    within min_rmsd aligned RMSD of an already selected geometry of the same molecule. Each worker loads the ensemble
+    once. At most max_pending chunks are in flight and only the pool_factor x k best candidates are kept in a heap, so
+    memory stays bounded however many candidates there are. Fewer than k geometries are returned when the pool holds
+    fewer diverse ones, e.g. when the most uncertain candidates are all samples around one conformer, in which case a
+    larger pool_factor helps.
+
+    Args:
+        checkpoints: list of checkpoint filenames of the ensemble members
+        candidates: iterable of (name, Geometry, charge), e.g. from mset_candidates
+        k: number of geometries to select
+        metric: "force" or "energy", see committee_disagreement
+        min_rmsd: smallest aligned RMSD in angstrom between selected geometries of the same molecule
+        pool_factor: multiple of k of the best candidates kept for the diversity selection
+        chunk_size: number of candidates sent to a worker at once
+        batch_size: number of geometries a worker evaluates together
+        n_workers: number of processes, None for the CPU count and 1 to score in this process
+        n_threads: torch threads per worker
+        max_pending: maximum number of chunks in flight, twice the number of workers by default
+
+    Returns:
+        selected: list of (score, name, Geometry, charge) in order of decreasing score
+        n_scored: number of candidates scored
+    """
+    heap = []
+    counter = itertools.count()
+    n_scored = 0
+
+    def merge(chunk, scores):
+        for (name, geometry, charge), score in zip(chunk, scores.tolist()):
+            item = (score, next(counter), name, geometry, charge)
+            if len(heap) < pool_factor * k:
+                heapq.heappush(heap, item)
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    # islice restarts a list or other re-iterable from its first element, so take chunks from one iterator
+    candidates = iter(candidates)
+    chunks = iter(lambda: list(itertools.islice(candidates, chunk_size)), [])
+    if n_workers == 1:
+        _init_worker(checkpoints, metric, batch_size, torch.get_num_threads())
+        for chunk in chunks:
+            merge(chunk, _score_chunk([geometry for _, geometry, _ in chunk]))
+            n_scored += len(chunk)
+    else:
+        n_workers = n_workers or os.cpu_count()
+        max_pending = max_pending or 2 * n_workers
+        with multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                  initargs=(checkpoints, metric, batch_size, n_threads)) as pool:
+            pending = deque()
+            for chunk in itertools.chain(chunks, [None]):
+                if chunk is not None:
+                    geometries = [geometry for _, geometry, _ in chunk]
+                    pending.append((chunk, pool.apply_async(_score_chunk, (geometries,))))
+                while pending and (chunk is None or len(pending) >= max_pending):
+                    done, result = pending.popleft()
+                    merge(done, result.get())
+                    n_scored += len(done)
+    ranked = sorted(heap, key=lambda item: (-item[0], item[1]))
+    return diverse_top_k([(score, name, geometry, charge) for score, _, name, geometry, charge in ranked], k,
+                         min_rmsd), n_scored
+
+
+def diverse_top_k(ranked, k, min_rmsd):
+    """
+    Greedily takes candidates in order, skipping those within min_rmsd aligned RMSD of a geometry of the same molecule
+    taken before
+
+    Args:
+        ranked: list of (score, name, Geometry, charge) in order of preference
+
+    Returns:
+        selected: list of at most k of the entries of ranked
+    """
+    selected, by_molecule = [], {}
+    for score, name, geometry, charge in ranked:
+        if len(selected) >= k:
+            break
+        key = tuple(geometry.atoms.tolist())
+        taken = by_molecule.setdefault(key, [])
+        if taken and float(aligned_rmsd(torch.stack(taken), geometry.xyz).min()) < min_rmsd:
+            continue
+        taken.append(geometry.xyz)
+        selected.append((score, name, geometry, charge))
+    return selected
+
+
+def write_selection(selected, out_path, rem=None, multiplicity=1):
+    """
+    Writes a Q-Chem input for each selected geometry to out_path, named after the candidate and with its charge
+
+    Returns:
+        filenames: list of the inputs written
+    """
+    os.makedirs(out_path, exist_ok=True)
+    filenames = []
+    for _, name, geometry, charge in selected:
+        filenames.append(os.path.join(out_path, f"{name}.in"))
+        write_input(geometry, filenames[-1], rem, charge, multiplicity)
+    return filenames
@@ -0,0 +1,215 @@
+"""
+Committees of TensorChem models evaluated together on shared features, for uncertainty estimates in active learning.
+"""
+
+from typing import Optional
+
+import torch
+import torch.nn as nn
+
+from tensorchem.featurizers.util import element_index
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+from tensorchem.networks.tensormol import TensorChem, StackedSubNet, group_by_element, load_model
+
+
+class TensorChemEnsemble(nn.Module):
+    """
+    A committee of TensorChem models with the same elements, layers and features. The subnet weights of every member
+    are stacked into n_members x n_elements x in x out parameters. The first layer of all members is one batched
+    matmul per element on the shared features, and the remaining layers are batched matmuls over every member and
+    element, so the committee costs one featurization and one grouping of atoms by element, plus the extra matmuls.
+
+    Args:
+        elements: a list of unique elements by atomic number
+        layers: list of ints defining the number of layers and hidden neurons per subnetwork
+        input_size: number of features per atom
+        n_members: number of models in the committee
+    """
+    n_members: torch.jit.Final[int]
+    n_layers: torch.jit.Final[int]
+
+    def __init__(self, elements, layers, input_size, n_members):
+        super().__init__()
+        self.register_buffer("elements", torch.as_tensor(elements, dtype=torch.long))
+        self.layers = list(layers)
+        self.input_size = input_size
+        self.n_members = n_members
+        members = [StackedSubNet(elements, input_size, layers) for _ in range(n_members)]
+        self.n_layers = members[0].n_layers
+        self.weights = nn.ParameterList([nn.Parameter(torch.stack([member.weights[i].detach() for member in members]))
+                                         for i in range(self.n_layers)])
+        self.biases = nn.ParameterList([nn.Parameter(torch.stack([member.biases[i].detach() for member in members]))
+                                        for i in range(self.n_layers)])
+        self.activation = nn.Softplus()
+        return
+
+    @classmethod
+    def from_models(cls, models):
+        """
+        Builds an ensemble with the weights of a list of grouped or stacked TensorChem models
+        """
+        stacked = [model.to_stacked() for model in models]
+        first = stacked[0]
+        for model in stacked[1:]:
+            if not torch.equal(model.elements, first.elements) or model.layers != first.layers or \
+                    model.input_size != first.input_size:
+                raise ValueError("Ensemble members must have the same elements, layers and input size")
+        ensemble = cls(first.elements.tolist(), first.layers, first.input_size, len(stacked))
+        with torch.no_grad():
+            for i in range(ensemble.n_layers):
+                ensemble.weights[i].copy_(torch.stack([model.subnets.weights[i] for model in stacked]))
+                ensemble.biases[i].copy_(torch.stack([model.subnets.biases[i] for model in stacked]))
+        return ensemble.to(first.elements.device)
+
+    @classmethod
+    def from_checkpoints(cls, filenames, device="cpu"):
+        """
+        Builds an ensemble from checkpoints saved by TensorChemTrainer.save_checkpoint
+
+        Returns:
+            ensemble: the TensorChemEnsemble
+            hyper_params: the hyper parameters of the first member
+        """
+        loaded = [load_model(filename, device) for filename in filenames]
+        return cls.from_models([model for model, _ in loaded]), loaded[0][1]
+
+    def member(self, i):
+        """
+        Returns member i as a stacked TensorChem model
+        """
+        model = TensorChem(self.elements.tolist(), self.layers, self.input_size, stacked=True)
+        with torch.no_grad():
+            for weight, bias, member_weight, member_bias in zip(model.subnets.weights, model.subnets.biases,
+                                                                self.weights, self.biases):
+                weight.copy_(member_weight[i])
+                bias.copy_(member_bias[i])
+        return model.to(self.elements.device)
+
+    def forward(self, at_nums, features, mol_idx: Optional[torch.Tensor] = None):
+        """
+        Args:
+            at_nums: B x Na tensor of atomic numbers padded with 0, or a flat tensor of atomic numbers with mol_idx
+            features: tensor of atomic features with the same leading dimensions as at_nums
+            mol_idx: optional tensor of the molecule index of each atom for flat inputs
+
+        Returns:
+            energies: n_members x B tensor of the molecular energies from each member
+        """
+        return self._molecular_energies(self.atomic_energies(at_nums, features), at_nums, mol_idx)
+
+    def atomic_energies(self, at_nums, features):
+        """
+        Evaluates the element subnets of every member for every atom
+
+        Returns:
+            atomic_energies: n_members x at_nums.shape tensor of the energy of each atom, 0 for padding
+        """
+        table, hidden = self._group(at_nums, features)
+        return self._member_layers(self._first_layer(hidden), table, at_nums)
+
+    def energies_and_feature_gradients(self, at_nums, features):
+        """
+        Molecular energies of every member with the gradient of each member's energy with respect to the features.
+        The members only share their input, so a single backward pass to the first layer outputs separates the
+        gradients of every member, and only the first layer weights differ in the rest of the chain.
+
+        Returns:
+            energies: n_members x B tensor of molecular energies
+            feature_grads: n_members x features.shape tensor of the gradient of each member's energies
+        """
+        n_elements, n_atoms = self.elements.shape[0], at_nums.numel()
+        with torch.enable_grad():
+            table, hidden = self._group(at_nums, features.detach())
+            first = self._first_layer(hidden).detach().requires_grad_(True)
+            energies = self._molecular_energies(self._member_layers(first, table, at_nums), at_nums)
+            first_grad = torch.autograd.grad([energies.sum()], [first])[0]
+        first_grad = first_grad.reshape(n_elements, table.shape[1], self.n_members, -1)
+        table_grads = torch.einsum("eamh,mefh->meaf", first_grad, self.weights[0].detach())
+        feature_grads = torch.zeros(self.n_members, n_atoms + 1, self.input_size, dtype=table_grads.dtype,
+                                    device=table_grads.device)
+        feature_grads = feature_grads.index_copy(1, table.reshape(-1),
+                                                 table_grads.reshape(self.n_members, -1, self.input_size))
+        return energies.detach(), feature_grads[:, :n_atoms].reshape([self.n_members] + list(features.shape))
+
+    def _group(self, at_nums, features):
+        """
+        Gathers the atoms into an n_elements x max atoms per element x input_size table padded with zeros
+        """
+        flat_features = features.reshape(at_nums.numel(), -1)
+        elem_idx = element_index(at_nums.reshape(-1), self.elements)
+        table, _ = group_by_element(elem_idx, self.elements.shape[0])
+        return table, torch.cat([flat_features, torch.zeros_like(flat_features[:1])])[table]
+
+    def _first_layer(self, hidden):
+        """
+        The members share their input, so the first layer is one matmul per element against the weights of every member
+
+        Returns:
+            first: n_elements x max atoms per element x (n_members * layers[0]) tensor of first layer outputs
+        """
+        weight, bias = self.weights[0], self.biases[0]
+        n_elements = weight.shape[1]
+        return torch.baddbmm(bias.permute(1, 2, 0, 3).reshape(n_elements, 1, -1), hidden,
+                             weight.permute(1, 2, 0, 3).reshape(n_elements, weight.shape[2], -1))
+
+    def _member_layers(self, first, table, at_nums):
+        """
+        Runs the remaining layers of every member and scatters the atomic energies back to the atoms
+        """
+        n_elements, n_slots, n_atoms = first.shape[0], first.shape[1], at_nums.numel()
+        hidden = first.reshape(n_elements, n_slots, self.n_members, -1).permute(2, 0, 1, 3)
+        hidden = hidden.reshape(self.n_members * n_elements, n_slots, -1)
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            if i > 0:
+                hidden = torch.baddbmm(bias.reshape(self.n_members * n_elements, 1, -1), self.activation(hidden),
+                                       weight.reshape(self.n_members * n_elements, weight.shape[2], -1))
+        hidden = hidden.reshape(self.n_members, -1)
+        energies = torch.zeros(self.n_members, n_atoms + 1, dtype=hidden.dtype, device=hidden.device)
+        energies = energies.index_copy(1, table.reshape(-1), hidden)
+        return energies[:, :n_atoms].reshape([self.n_members] + list(at_nums.shape))
+
+    def _molecular_energies(self, atomic_energies, at_nums, mol_idx: Optional[torch.Tensor] = None):
+        atomic_energies = atomic_energies.reshape(self.n_members, -1)
+        if mol_idx is None:
+            n_mols = at_nums.shape[0]
+            mol_idx = torch.arange(n_mols, device=at_nums.device).repeat_interleave(at_nums.shape[-1])
+        else:
+            n_mols = int(mol_idx.max()) + 1
+        energies = torch.zeros(self.n_members, n_mols, dtype=atomic_energies.dtype, device=atomic_energies.device)
+        return energies.index_add(1, mol_idx, atomic_energies)
+
+
+def evaluate_committee(ensemble, sym_func_params, at_nums, coords, forces=True, precision=None):
+    """
+    Featurizes a padded batch once and evaluates every member of an ensemble on it. The spread of the members needs
+    at least two of them.
+
+    Args:
+        ensemble: a TensorChemEnsemble
+        sym_func_params: dict of symmetry function parameters the members were trained with
+        at_nums: B x Na tensor of atomic numbers padded with 0
+        coords: B x Na x 3 tensor of atomic positions
+        forces: also compute the forces from each member
+        precision: optional featurization precision policy
+
+    Returns:
+        committee: dict with energies (n_members x B), energy_mean and energy_std (B), and when forces is True forces
+            (n_members x B x Na x 3), force_mean and force_std (B x Na x 3)
+    """
+    if ensemble.n_members < 2:
+        raise ValueError(f"A committee needs at least 2 members for their spread, got {ensemble.n_members}")
+    with torch.set_grad_enabled(forces):
+        coords = coords.detach().requires_grad_(forces)
+        features = get_sym_funcs(sym_func_params, at_nums, coords, ensemble.elements, precision=precision)
+        features = features.reshape(at_nums.shape + (-1,)).to(torch.float32)
+        if not forces:
+            energies = ensemble(at_nums, features)
+            return {"energies": energies, "energy_mean": energies.mean(0), "energy_std": energies.std(0)}
+        energies, feature_grads = ensemble.energies_and_feature_gradients(at_nums, features)
+        # Only the backward pass through the shared featurization is repeated for each member
+        n_members = ensemble.n_members
+        member_forces = [-torch.autograd.grad(features, coords, feature_grads[i], retain_graph=i < n_members - 1)[0]
+                         for i in range(n_members)]
+    forces = torch.stack(member_forces)
+    return {"energies": energies, "energy_mean": energies.mean(0), "energy_std": energies.std(0), "forces": forces,
+            "force_mean": forces.mean(0), "force_std": forces.std(0)}
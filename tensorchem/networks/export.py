@@ -0,0 +1,101 @@
+"""
+Export of the featurization and TensorChem network as a single compiled module. Exported modules are TorchScript, so
+they can be loaded with torch.jit.load in Python or torch::jit::load in C++ without any tensorchem code.
+"""
+
+import copy
+from typing import Tuple
+
+import torch
+import torch.nn as nn
+
+from tensorchem.featurizers.util import dist_matrix_dense, element_index, scatter_element_channels
+from tensorchem.featurizers.symmetry_functions import get_radial_embed
+
+
+class TensorChemPipeline(nn.Module):
+    """
+    Featurizes padded batches of molecules with radial symmetry functions and evaluates a TensorChem model on them in
+    one module, returning energies and forces. Written to compile with torch.jit.script.
+
+    Args:
+        model: a TensorChem model
+        sym_func_params: dict of the r_nought, eta and rad_cut symmetry function parameters the model was trained with
+        compute_forces: return forces from autograd of the energies with respect to the coordinates
+    """
+    compute_forces: torch.jit.Final[bool]
+
+    def __init__(self, model, sym_func_params, compute_forces=True):
+        super().__init__()
+        self.model = model
+        self.register_buffer("r_nought", torch.as_tensor(sym_func_params['r_nought'], dtype=torch.float32))
+        self.register_buffer("eta", torch.as_tensor(sym_func_params['eta'], dtype=torch.float32))
+        self.register_buffer("rad_cut", torch.as_tensor(sym_func_params['rad_cut'], dtype=torch.float32))
+        self.compute_forces = compute_forces
+
+    def featurize(self, at_nums, coords):
+        dist = dist_matrix_dense(coords)
+        radial_embed = get_radial_embed(dist, self.r_nought, self.eta, self.rad_cut)
+        elements = self.model.elements
+        features = scatter_element_channels(radial_embed, element_index(at_nums, elements), elements.shape[0])
+        return features.reshape(at_nums.shape[0], at_nums.shape[1], -1)
+
+    def forward(self, at_nums, coords) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Args:
+            at_nums: B x Na tensor of atomic numbers padded with 0
+            coords: B x Na x 3 tensor of atomic positions
+
+        Returns:
+            energies: B tensor of energies
+            forces: B x Na x 3 tensor of forces, empty when compute_forces is False
+        """
+        if self.compute_forces:
+            coords = coords.detach().requires_grad_(True)
+        energies = self.model(at_nums, self.featurize(at_nums, coords))
+        if not self.compute_forces:
+            return energies, torch.empty(0)
+        grad = torch.autograd.grad([energies.sum()], [coords])[0]
+        assert grad is not None
+        return energies.detach(), -grad
+
+
+def script_pipeline(model, sym_func_params, compute_forces=True):
+    """
+    Compiles the featurization and a frozen copy of the model into one TorchScript module
+    """
+    model = copy.deepcopy(model).eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return torch.jit.script(TensorChemPipeline(model, sym_func_params, compute_forces).eval())
+
+
+def export_pipeline(model, sym_func_params, filename, compute_forces=True):
+    """
+    Scripts the featurization and model and saves them for loading with torch.jit.load. Energy only pipelines are also
+    frozen, which inlines the parameters as constants for faster inference.
+
+    Returns:
+        scripted: the scripted pipeline that was saved
+    """
+    scripted = script_pipeline(model, sym_func_params, compute_forces)
+    if not compute_forces:
+        scripted = torch.jit.freeze(scripted)
+    scripted.save(filename)
+    return scripted
+
+
+def load_pipeline(filename, device="cpu"):
+    return torch.jit.load(filename, map_location=device)
+
+
+def compile_pipeline(model, sym_func_params, compute_forces=True, **compile_kwargs):
+    """
+    Compiles the featurization and model with torch.compile for in-process use. Unlike export_pipeline the result
+    cannot be saved, and the first call for each new input shape pays the compilation cost. The model is copied, so the
+    one passed in keeps its mode and trainable parameters.
+    """
+    model = copy.deepcopy(model).eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return torch.compile(TensorChemPipeline(model, sym_func_params, compute_forces).eval(), **compile_kwargs)
@@ -0,0 +1,169 @@
+"""
+Inference engine for serving trained TensorChem potentials. Evaluates energies and forces for lists of Geometries in
+batches of molecules with similar sizes.
+"""
+
+import copy
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+from tensorchem.networks.tensormol import load_model
+
+
+class InferenceEngine:
+    """
+    Evaluates a trained TensorChem model on Geometries. Geometries are sorted by size and packed into batches of at
+    most batch_size molecules and max_batch_atoms padded atoms, so little work is wasted on padding. Energy only
+    requests run under torch.inference_mode. Forces need autograd with respect to the coordinates, so they are run
+    with gradients enabled, but the parameters of the engine's copy of the model are frozen and no graph is kept for
+    them, so the model passed in, e.g. one still being trained, is left as it is.
+
+    Args:
+        model: a trained TensorChem model
+        sym_func_params: dict of symmetry function parameters the model was trained with
+        precision: optional featurization precision policy
+        batch_size: maximum number of molecules per batch
+        max_batch_atoms: maximum number of padded atoms (molecules x largest molecule) per batch
+        n_threads: number of worker threads for concurrent callers using submit. None disables the pool
+        device: device to run on
+    """
+
+    def __init__(self, model, sym_func_params, precision=None, batch_size=64, max_batch_atoms=8192, n_threads=None,
+                 device="cpu"):
+        self.device = torch.device(device)
+        self.model = copy.deepcopy(model).to(self.device).eval()
+        for param in self.model.parameters():
+            param.requires_grad_(False)
+        self.elements = self.model.elements
+        self.sym_func_params = {key: torch.as_tensor(value, dtype=torch.float32, device=self.device)
+                                for key, value in sym_func_params.items()}
+        self.precision = precision
+        self.batch_size = batch_size
+        self.max_batch_atoms = max_batch_atoms
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=n_threads) if n_threads is not None else None
+
+    @classmethod
+    def from_checkpoint(cls, filename, device="cpu", **kwargs):
+        """
+        Loads a model saved by TensorChemTrainer.save_checkpoint
+        """
+        model, hyper_params = load_model(filename, device)
+        kwargs.setdefault("precision", hyper_params.get('precision'))
+        return cls(model, hyper_params['sym_func_params'], device=device, **kwargs)
+
+    def batches(self, geometries):
+        """
+        Splits geometries into size bucketed batches
+
+        Returns:
+            batches: list of lists of indices into geometries
+        """
+        order = sorted(range(len(geometries)), key=lambda i: geometries[i].n_atoms)
+        batches, batch = [], []
+        for idx in order:
+            n_atoms = geometries[idx].n_atoms
+            if batch and (len(batch) >= self.batch_size or (len(batch) + 1) * n_atoms > self.max_batch_atoms):
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def collate(self, geometries):
+        """
+        Pads a list of Geometries into B x Na atomic numbers and B x Na x 3 coordinates
+        """
+        max_atoms = max(geom.n_atoms for geom in geometries)
+        at_nums = torch.zeros(len(geometries), max_atoms, dtype=torch.long)
+        coords = torch.zeros(len(geometries), max_atoms, 3)
+        for i, geom in enumerate(geometries):
+            at_nums[i, :geom.n_atoms] = geom.atoms.long()
+            coords[i, :geom.n_atoms] = geom.xyz
+        return at_nums.to(self.device), coords.to(self.device)
+
+    def featurize(self, at_nums, coords):
+        features = get_sym_funcs(self.sym_func_params, at_nums, coords, self.elements, precision=self.precision)
+        return features.reshape(at_nums.shape + (-1,)).to(torch.float32)
+
+    def evaluate_batch(self, at_nums, coords, forces=True):
+        """
+        Evaluates one padded batch
+
+        Returns:
+            energies: B tensor of energies
+            forces: B x Na x 3 tensor of forces, or None when forces is False
+        """
+        if not forces:
+            with torch.inference_mode():
+                return self.model(at_nums, self.featurize(at_nums, coords)), None
+        with torch.enable_grad():
+            coords = coords.detach().requires_grad_(True)
+            energies = self.model(at_nums, self.featurize(at_nums, coords))
+            grad = torch.autograd.grad(energies.sum(), coords)[0]
+        return energies.detach(), -grad
+
+    def evaluate(self, geometries, forces=True):
+        """
+        Evaluates energies and optionally forces for a list of Geometries
+
+        Returns:
+            energies: tensor with the energy of each geometry, in the order given
+            forces: list of Na x 3 force tensors for each geometry, or None when forces is False
+        """
+        energies = torch.zeros(len(geometries))
+        all_forces = [None] * len(geometries) if forces else None
+        for batch in self.batches(geometries):
+            start = time.perf_counter()
+            at_nums, coords = self.collate([geometries[i] for i in batch])
+            batch_energies, batch_forces = self.evaluate_batch(at_nums, coords, forces)
+            energies[batch] = batch_energies.cpu()
+            if forces:
+                batch_forces = batch_forces.cpu()
+                for j, i in enumerate(batch):
+                    all_forces[i] = batch_forces[j, :geometries[i].n_atoms]
+            self._record(len(batch), int(torch.count_nonzero(at_nums)), time.perf_counter() - start)
+        return energies, all_forces
+
+    def submit(self, geometries, forces=True):
+        """
+        Queues geometries for evaluation on the thread pool
+
+        Returns:
+            future: a concurrent.futures.Future for the result of evaluate
+        """
+        if self.pool is None:
+            raise RuntimeError("InferenceEngine was created without a thread pool, set n_threads to use submit")
+        return self.pool.submit(self.evaluate, geometries, forces)
+
+    def _record(self, batch_size, n_atoms, seconds):
+        with self._stats_lock:
+            stats = self.stats.setdefault(batch_size, {"batches": 0, "geometries": 0, "atoms": 0, "seconds": 0.0})
+            stats["batches"] += 1
+            stats["geometries"] += batch_size
+            stats["atoms"] += n_atoms
+            stats["seconds"] += seconds
+
+    def report(self):
+        """
+        Latency and throughput for each batch size evaluated so far
+
+        Returns:
+            report: dict from batch size to mean latency in ms, geometries/sec and atoms/sec
+        """
+        with self._stats_lock:
+            return {batch_size: {"batches": stats["batches"],
+                                 "latency_ms": 1000.0 * stats["seconds"] / stats["batches"],
+                                 "geometries_per_sec": stats["geometries"] / stats["seconds"],
+                                 "atoms_per_sec": stats["atoms"] / stats["seconds"]}
+                    for batch_size, stats in sorted(self.stats.items())}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
@@ -0,0 +1,135 @@
+"""
+Post-training int8 quantization of the element subnets of trained TensorChem models for energy inference.
+"""
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import quantize_dynamic, get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+from tensorchem.featurizers.util import element_index
+from tensorchem.networks.inference import InferenceEngine
+from tensorchem.util.benchmark import time_function
+
+QUANTIZATION_MODES = ("dynamic", "static")
+
+
+def quantize_model(model, mode="dynamic", calibration=None):
+    """
+    Quantizes the subnets of a trained TensorChem model to int8. Dynamic quantization stores the Linear weights as int8
+    and quantizes activations on the fly from their range in each batch. Static quantization also fixes the activation
+    scales ahead of time from a calibration sample, which saves the range computation but needs representative data.
+    The small output layers are kept in float32, because the reference atomic energies in their biases are much larger
+    than the interaction energies and would leave little int8 resolution for them. Quantized kernels only run
+    on CPU and have no autograd support, so quantized models give energies but not forces.
+
+    Args:
+        model: a trained TensorChem model, grouped or stacked
+        mode: "dynamic" or "static"
+        calibration: for static mode, an iterable of (at_nums, features) batches like those from calibration_batches
+
+    Returns:
+        quantized: a grouped copy of the model on the CPU with quantized subnets
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {mode}, expected one of {QUANTIZATION_MODES}")
+    quantized = model.to_grouped().cpu().eval()
+    if mode == "dynamic":
+        for subnet in quantized.subnets:
+            subnet.layers = quantize_dynamic(subnet.layers, {nn.Linear}, dtype=torch.qint8)
+        return quantized
+    if calibration is None:
+        raise ValueError("Static quantization needs calibration data")
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    qconfig_mapping.set_module_name("output", None).set_object_type("squeeze", None)
+    example_inputs = (torch.zeros(1, quantized.input_size),)
+    prepared = [prepare_fx(subnet, qconfig_mapping, example_inputs) for subnet in quantized.subnets]
+    with torch.no_grad():
+        for at_nums, features in calibration:
+            elem_idx = element_index(at_nums.reshape(-1).cpu(), quantized.elements)
+            flat_features = features.reshape(elem_idx.shape[0], -1).cpu()
+            for i, subnet in enumerate(prepared):
+                subnet(flat_features[elem_idx == i])
+    quantized.subnets = nn.ModuleList([convert_fx(subnet) for subnet in prepared])
+    return quantized
+
+
+def calibration_batches(engine, geometries):
+    """
+    Featurizes geometries in the batches an InferenceEngine would use
+
+    Yields:
+        at_nums: B x Na tensor of atomic numbers
+        features: B x Na x input_size tensor of features
+    """
+    for batch in engine.batches(geometries):
+        at_nums, coords = engine.collate([geometries[i] for i in batch])
+        with torch.no_grad():
+            yield at_nums, engine.featurize(at_nums, coords)
+
+
+def dequantize_model(quantized, model):
+    """
+    A float copy of model carrying the int8 rounded weights of quantized. It can be differentiated, so its forces
+    approximate those of the quantized model with only the rounding of the activations left out.
+    """
+    dequantized = model.to_grouped().cpu().eval()
+    with torch.no_grad():
+        for subnet, quantized_subnet in zip(dequantized.subnets, quantized.subnets):
+            for name, layer in subnet.named_modules():
+                if not isinstance(layer, nn.Linear):
+                    continue
+                weight = quantized_subnet.get_submodule(name).weight
+                layer.weight.copy_(weight().dequantize() if callable(weight) else weight.dequantize())
+    return dequantized
+
+
+def quantization_report(model, quantized, sym_func_params, geometries, energies=None, n_repeats=3, **engine_kwargs):
+    """
+    Compares a quantized model against the float32 model it came from on a set of geometries
+
+    Args:
+        model: the float32 TensorChem model
+        quantized: the model returned by quantize_model
+        sym_func_params: dict of symmetry function parameters the model was trained with
+        geometries: list of Geometries, e.g. the validation set
+        energies: optional tensor of reference energies for the geometries
+        n_repeats: number of timed passes over the geometries for the throughput
+        engine_kwargs: further arguments for the InferenceEngines, e.g. batch_size
+
+    Returns:
+        report: dict of the mean absolute and max energy and force differences between the models, the energy MAE of
+            each model against the reference energies if given, and the energy only geometries/sec of each model end to
+            end and for the network alone on precomputed features
+    """
+    # The engines work on copies, so model stays on its device and trainable
+    engine = InferenceEngine(model, sym_func_params, **engine_kwargs)
+    quantized_engine = InferenceEngine(quantized, sym_func_params, **engine_kwargs)
+    float_energies, float_forces = engine.evaluate(geometries)
+    quantized_energies, _ = quantized_engine.evaluate(geometries, forces=False)
+    _, quantized_forces = InferenceEngine(dequantize_model(quantized, model), sym_func_params,
+                                          **engine_kwargs).evaluate(geometries)
+    energy_error = torch.abs(quantized_energies - float_energies)
+    force_error = torch.cat([torch.abs(q - f).reshape(-1) for q, f in zip(quantized_forces, float_forces)])
+    report = {"energy_mae": energy_error.mean().item(), "energy_max_error": energy_error.max().item(),
+              "force_mae": force_error.mean().item(), "force_max_error": force_error.max().item()}
+    if energies is not None:
+        energies = torch.as_tensor(energies, dtype=torch.float32).reshape(-1)
+        report["float32_energy_mae"] = torch.abs(float_energies - energies).mean().item()
+        report["int8_energy_mae"] = torch.abs(quantized_energies - energies).mean().item()
+    report["float32_geometries_per_sec"] = len(geometries) / time_function(
+        lambda: engine.evaluate(geometries, forces=False), n_repeats=n_repeats, n_warmup=1)
+    report["int8_geometries_per_sec"] = len(geometries) / time_function(
+        lambda: quantized_engine.evaluate(geometries, forces=False), n_repeats=n_repeats, n_warmup=1)
+    report["speedup"] = report["int8_geometries_per_sec"] / report["float32_geometries_per_sec"]
+    batches = list(calibration_batches(engine, geometries))
+    for name, network in [("float32", engine.model), ("int8", quantized)]:
+        def evaluate():
+            with torch.inference_mode():
+                for at_nums, features in batches:
+                    network(at_nums, features)
+        report[f"{name}_network_geometries_per_sec"] = len(geometries) / time_function(evaluate, n_repeats=n_repeats,
+                                                                                       n_warmup=1)
+    report["network_speedup"] = \
+        report["int8_network_geometries_per_sec"] / report["float32_network_geometries_per_sec"]
+    return report
@@ -3,48 +3,583 @@ tensorchem is a Neural Network force field based on the High-Dimensional Neural
 by Behler and Parrinello.
 """
 
+import os
+import copy
+import math
+import time
+from typing import List, Optional
+
 import torch
 import torch.nn as nn
 import torch.optim as opt
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.checkpoint import checkpoint
+from torch.utils.data import DataLoader, BatchSampler, DistributedSampler, SequentialSampler, random_split
+
+from tensorchem.dataset.dataset import pad_collate, atom_counts, MemoryBudgetBatchSampler, ResumableBatchSampler
+from tensorchem.featurizers.cache import FeatureCache
+from tensorchem.featurizers.util import element_index
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs, sym_funcs_key
+from tensorchem.molecules.transformations import RandomRigidTransform
+from tensorchem.util.checkpoint import AsyncCheckpointer, save_atomic, rng_state, set_rng_state
+
+DEFAULT_HYPER_PARAMS = {
+    "atomic_num_key": "atomic_numbers",
+    "coords_key": "coordinates",
+    "forces_key": None,
+    "force_weight": 1.0,
+    "batch_size": 32,
+    "max_epochs": 100,
+    "validation_split": 0.1,
+    "stacked": False,
+    "precision": None,
+    "num_workers": 0,
+    "seed": 0,
+    "checkpoint_path": None,
+    "distributed": False,
+    "bucket_cap_mb": 25,
+    "checkpoint_featurizer": False,
+    "checkpoint_chunk_size": 1,
+    "checkpoint_subnets": False,
+    "memory_budget_mb": None,
+    "bytes_per_atom": None,
+    "bytes_per_pair": None,
+    "lr_decay": 1.0,
+    "checkpoint_every": None,
+    "async_checkpoint": True,
+    "resume": False,
+    "random_rotations": False,
+    "feature_cache_mb": None,
+    "feature_cache_dir": None
+}
 
 
 class TensorChemTrainer(nn.Module):
     """
     Trainer for TensorChem networks. Coordinates the featurization of data to feed into TensorChem, recovers the latent
     featurization after the final non-linear layer to feed to linear regression layers for final label prediction.
+
+    Args:
+        dataset: a Dataset whose items are dicts of tensors with atomic numbers, coordinates and energy labels
+        hyper_params: dict of training settings. Required keys are learning_rate, betas, weight_decay, elements,
+            layers, sym_func_params (r_nought, eta, rad_cut) and energy_key. Optional keys are forces_key,
+            force_weight, atomic_num_key, coords_key, batch_size, max_epochs, validation_split, stacked, precision,
+            num_workers, seed and checkpoint_path. Setting distributed trains with DistributedDataParallel over the
+            gloo backend, with bucket_cap_mb setting the gradient bucket size. The process group is initialized from
+            the torchrun environment variables unless it already exists, each rank trains on its own shard of the
+            training data and only rank 0 writes checkpoints.
+            For large molecules, checkpoint_featurizer recomputes the featurization and forces of force training in
+            chunks of checkpoint_chunk_size molecules during the backward pass, and checkpoint_subnets recomputes
+            the subnet activations. Setting memory_budget_mb replaces the fixed batch_size with batches planned by
+            MemoryBudgetBatchSampler, from the bytes_per_atom and bytes_per_pair estimates of memory_coefficients
+            unless they are given.
+            Checkpoints hold the model, optimizer, learning rate scheduler (exponential decay by lr_decay each epoch),
+            RNG states and the position in the epoch. They are written after every epoch and every checkpoint_every
+            training batches to checkpoint_path, which checkpoint_every needs. During fit they are written from a
+            background thread unless async_checkpoint is False, while save_checkpoint always writes before it returns.
+            With resume set, training continues from checkpoint_path if it exists, starting at the next batch of the
+            interrupted epoch.
+            Setting random_rotations augments each training batch with a random rotation of every molecule, which also
+            rotates the force labels.
+            Setting feature_cache_mb keeps the features of each molecule in a FeatureCache of that many MB, memory
+            mapped from feature_cache_dir when it is given, so epochs after the first skip featurization. The cache is
+            not used with random_rotations, whose features change every epoch, nor in force training, which needs the
+            featurization graph.
     """
 
     def __init__(self, dataset, hyper_params):
         super().__init__()
         cuda_condition = torch.cuda.is_available()
         self.device = torch.device("cuda" if cuda_condition else "cpu")
-        self.featurization = None  # TODO Need featurization modules implemented
-        self.model = TensorChem(elements, layers, input_size)
+        self.hyper_params = dict(DEFAULT_HYPER_PARAMS, **hyper_params)
+        self.dataset = dataset
+        self.elements = torch.tensor(self.hyper_params['elements'], dtype=torch.long, device=self.device)
+        self.sym_func_params = {key: torch.as_tensor(value, dtype=torch.float32, device=self.device)
+                                for key, value in self.hyper_params['sym_func_params'].items()}
+        self.atomic_num_key = self.hyper_params['atomic_num_key']
+        self.coords_key = self.hyper_params['coords_key']
+        self.energy_key = self.hyper_params['energy_key']
+        self.forces_key = self.hyper_params['forces_key']
+        self.force_weight = self.hyper_params['force_weight']
+        self.augment = None
+        if self.hyper_params['random_rotations']:
+            vector_keys = [self.forces_key] if self.forces_key is not None else []
+            self.augment = RandomRigidTransform(self.coords_key, vector_keys, self.atomic_num_key)
+        self.feature_cache = None
+        if self.hyper_params['feature_cache_mb'] is not None and not self.hyper_params['random_rotations']:
+            self.feature_cache = FeatureCache(int(self.hyper_params['feature_cache_mb'] * 2 ** 20),
+                                              self.hyper_params['feature_cache_dir'])
+        input_size = len(self.hyper_params['elements']) * self.sym_func_params['r_nought'].shape[0]
+        self.model = TensorChem(self.hyper_params['elements'], self.hyper_params['layers'], input_size,
+                                stacked=self.hyper_params['stacked'],
+                                checkpoint_subnets=self.hyper_params['checkpoint_subnets'])
         self.model.to(self.device)
-        self.learn_rate = hyper_params['learning_rate']
-        self.betas = hyper_params['betas']
-        self.weight_decay = hyper_params['weight_decay']
+        self.rank, self.world_size = 0, 1
+        self.network = self.model
+        if self.hyper_params['distributed']:
+            self._init_distributed()
+        self.learn_rate = self.hyper_params['learning_rate']
+        self.betas = self.hyper_params['betas']
+        self.weight_decay = self.hyper_params['weight_decay']
         self.optimizer = opt.Adam(self.model.parameters(), lr=self.learn_rate, betas=self.betas,
                                   weight_decay=self.weight_decay)
+        self.scheduler = opt.lr_scheduler.ExponentialLR(self.optimizer, self.hyper_params['lr_decay'])
+        self.epoch = 0
+        self.batches_done = 0
+        self.best_loss = float("inf")
+        self.history = []
+        if self.hyper_params['checkpoint_every'] is not None and self.hyper_params['checkpoint_path'] is None:
+            raise ValueError("checkpoint_every needs a checkpoint_path to write the checkpoints to")
+        # Only set while fit runs, so no writer thread outlives training
+        self.checkpointer = None
+        self._init_data()
+        checkpoint_path = self.hyper_params['checkpoint_path']
+        if self.hyper_params['resume'] and checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.load_checkpoint(checkpoint_path)
         return
 
+    def _init_distributed(self):
+        if not dist.is_initialized():
+            dist.init_process_group(backend="gloo")
+        self.rank, self.world_size = dist.get_rank(), dist.get_world_size()
+        # Every subnet runs on every batch, even with no atoms of its element, so all parameters get gradients
+        self.network = DistributedDataParallel(self.model, bucket_cap_mb=self.hyper_params['bucket_cap_mb'],
+                                               find_unused_parameters=False)
+
+    def _init_data(self):
+        generator = torch.Generator().manual_seed(self.hyper_params['seed'])
+        n_valid = int(round(len(self.dataset) * self.hyper_params['validation_split']))
+        self.train_data, self.valid_data = random_split(self.dataset, [len(self.dataset) - n_valid, n_valid],
+                                                        generator=generator)
+        num_workers = self.hyper_params['num_workers']
+        if self.hyper_params['memory_budget_mb'] is not None:
+            train_batches = self._budget_sampler(self.train_data, train=True)
+            valid_batches = self._budget_sampler(self.valid_data, train=False)
+        else:
+            # Shuffled from the seed and the epoch rather than a running generator, so the order of any epoch can be
+            # reproduced when resuming from a checkpoint
+            batch_size = self.hyper_params['batch_size']
+            train_batches = BatchSampler(DistributedSampler(self.train_data, self.world_size, self.rank, shuffle=True,
+                                                            seed=self.hyper_params['seed']), batch_size, False)
+            valid_sampler = SequentialSampler(self.valid_data)
+            if self.hyper_params['distributed']:
+                valid_sampler = DistributedSampler(self.valid_data, self.world_size, self.rank, shuffle=False)
+            valid_batches = BatchSampler(valid_sampler, batch_size, False)
+        self.train_sampler = ResumableBatchSampler(train_batches)
+        self.train_loader = DataLoader(self.train_data, batch_sampler=self.train_sampler, collate_fn=pad_collate,
+                                       num_workers=num_workers)
+        self.valid_loader = DataLoader(self.valid_data, batch_sampler=valid_batches, collate_fn=pad_collate,
+                                       num_workers=num_workers)
+
+    def _budget_sampler(self, data, train):
+        bytes_per_atom, bytes_per_pair = self.memory_coefficients()
+        pair_chunk = None
+        if train and self.hyper_params['checkpoint_featurizer'] and self.forces_key is not None:
+            pair_chunk = self.hyper_params['checkpoint_chunk_size']
+        return MemoryBudgetBatchSampler(atom_counts(data, self.atomic_num_key),
+                                        self.hyper_params['memory_budget_mb'] * 2 ** 20, bytes_per_atom,
+                                        bytes_per_pair, pair_chunk=pair_chunk, shuffle=train,
+                                        seed=self.hyper_params['seed'], num_replicas=self.world_size, rank=self.rank)
+
+    def memory_coefficients(self):
+        """
+        Estimated float32 memory per padded atom and per padded atom pair of a training batch. The pair tensors of
+        the featurization dominate for large molecules. Force training keeps about 20 of them with n_gaussians values
+        per pair for the double backward pass, while energy training only holds a few at a time. The bytes_per_atom
+        and bytes_per_pair hyper_params override the estimates, e.g. with values measured on the target machine.
+
+        Returns:
+            bytes_per_atom: estimated bytes for each padded atom
+            bytes_per_pair: estimated bytes for each padded atom pair
+        """
+        n_gaussians = self.sym_func_params['r_nought'].shape[0]
+        forces = self.forces_key is not None
+        bytes_per_atom = 4 * (self.model.input_size * (3 if forces else 2) +
+                              sum(self.model.layers) * (6 if forces else 3))
+        bytes_per_pair = 4 * n_gaussians * (20 if forces else 4)
+        if self.hyper_params['bytes_per_atom'] is not None:
+            bytes_per_atom = self.hyper_params['bytes_per_atom']
+        if self.hyper_params['bytes_per_pair'] is not None:
+            bytes_per_pair = self.hyper_params['bytes_per_pair']
+        return bytes_per_atom, bytes_per_pair
+
+    def featurize(self, at_nums, coords):
+        """
+        Symmetry function features for a padded batch, flattened to B x Na x (n_elements * n_gaussians)
+        """
+        if self.feature_cache is not None and not coords.requires_grad:
+            features = self.cached_features(at_nums, coords)
+        else:
+            features = get_sym_funcs(self.sym_func_params, at_nums, coords, self.elements,
+                                     precision=self.hyper_params['precision'])
+        return features.reshape(at_nums.shape + (-1,)).to(torch.float32)
+
+    def cached_features(self, at_nums, coords):
+        """
+        Features of a padded batch through the feature cache. Molecules are cached one at a time without their padding,
+        so they are found again whatever batch they are drawn in, and only the molecules missing from the cache are
+        featurized, together.
+        """
+        precision = self.hyper_params['precision']
+        n_atoms = torch.count_nonzero(at_nums, dim=-1).tolist()
+        keys = [sym_funcs_key(self.sym_func_params, at_nums[i, :n], coords[i, :n], self.elements, precision=precision)
+                for i, n in enumerate(n_atoms)]
+        cached = [self.feature_cache.get(key) for key in keys]
+        missing = [i for i, features in enumerate(cached) if features is None]
+        if missing:
+            computed = get_sym_funcs(self.sym_func_params, at_nums[missing], coords[missing], self.elements,
+                                     precision=precision)
+            for j, i in enumerate(missing):
+                cached[i] = computed[j, :n_atoms[i]]
+                self.feature_cache.put(keys[i], cached[i])
+        features = torch.zeros(at_nums.shape + cached[0].shape[1:], dtype=cached[0].dtype, device=self.device)
+        for i, n in enumerate(n_atoms):
+            features[i, :n] = cached[i].to(self.device)
+        return features
+
+    def fit_atomic_energies(self):
+        """
+        Least squares fit of one reference energy per element to the training energies, used as the starting output
+        bias of each subnet
+        """
+        counts, energies = [], []
+        for batch in DataLoader(self.train_data, batch_size=256, collate_fn=pad_collate):
+            at_nums = batch[self.atomic_num_key].long()
+            counts.append(torch.eq(at_nums.unsqueeze(-1), self.elements.cpu()).sum(1).double())
+            energies.append(batch[self.energy_key].reshape(-1).double())
+        atomic_energies = torch.linalg.lstsq(torch.cat(counts), torch.cat(energies).unsqueeze(-1)).solution
+        self.model.set_atomic_energies(atomic_energies.squeeze(-1).float())
+        return atomic_energies.squeeze(-1)
+
+    def step(self, batch, train=True):
+        """
+        Runs one batch through featurization and the network, and takes an optimizer step when training
+
+        Returns:
+            loss: the total loss for the batch as a float
+            timings: dict of seconds spent in featurization, forward (including forces) and backward
+        """
+        start = time.perf_counter()
+        if train and self.augment is not None:
+            batch = self.augment(batch)
+        at_nums = batch[self.atomic_num_key].long().to(self.device)
+        coords = batch[self.coords_key].to(self.device)
+        target_energies = batch[self.energy_key].reshape(-1).to(self.device)
+        if self.forces_key is not None:
+            coords.requires_grad_(True)
+        with torch.set_grad_enabled(train or self.forces_key is not None):
+            if train and self.forces_key is not None and self.hyper_params['checkpoint_featurizer']:
+                # Featurization is timed as part of forward, since it is interleaved with the network in each chunk
+                featurize_time = start
+                energies, forces = self.checkpointed_forces(at_nums, coords)
+            else:
+                features = self.featurize(at_nums, coords)
+                featurize_time = time.perf_counter()
+                # Validation uses the bare model so DDP does not wait for a backward pass that never comes
+                energies = self.network(at_nums, features) if train else self.model(at_nums, features)
+                if self.forces_key is not None:
+                    forces = -torch.autograd.grad(energies.sum(), coords, create_graph=train)[0]
+            loss = torch.mean(torch.square(energies - target_energies))
+            if self.forces_key is not None:
+                atom_mask = torch.ne(at_nums, 0).unsqueeze(-1)
+                force_error = torch.square(forces - batch[self.forces_key].to(self.device)) * atom_mask
+                loss = loss + self.force_weight * force_error.sum() / (3 * atom_mask.sum())
+            forward_time = time.perf_counter()
+            if train:
+                self.optimizer.zero_grad()
+                loss.backward()
+                self.optimizer.step()
+        backward_time = time.perf_counter()
+        timings = {"featurization": featurize_time - start, "forward": forward_time - featurize_time,
+                   "backward": backward_time - forward_time}
+        return loss.item(), timings
+
+    def checkpointed_forces(self, at_nums, coords):
+        """
+        Energies and forces for force training with activation checkpointing. Force training differentiates the
+        forces again, so it keeps every pair tensor of the featurization of the whole batch until the backward pass.
+        Here each chunk of checkpoint_chunk_size molecules keeps only its inputs and outputs, and its featurization
+        and force graph are recomputed one chunk at a time in the backward pass.
+
+        Returns:
+            energies: B tensor of energies
+            forces: B x Na x 3 tensor of forces with a graph for the backward pass
+        """
+        chunk = self.hyper_params['checkpoint_chunk_size']
+        outputs = [checkpoint(self._energies_and_forces, at_nums[i:i + chunk], coords[i:i + chunk],
+                              use_reentrant=False) for i in range(0, at_nums.shape[0], chunk)]
+        return torch.cat([energies for energies, _ in outputs]), torch.cat([forces for _, forces in outputs])
+
+    def _energies_and_forces(self, at_nums, coords):
+        energies = self.network(at_nums, self.featurize(at_nums, coords))
+        return energies, -torch.autograd.grad(energies.sum(), coords, create_graph=True)[0]
+
+    def run_epoch(self, loader, train=True):
+        """
+        Runs one pass over a DataLoader
+
+        Returns:
+            stats: dict with the mean loss, samples/sec, atoms/sec and the time spent in data loading, featurization,
+                forward and backward
+        """
+        self.model.train(train)
+        stats = {"loss": 0.0, "samples": 0, "atoms": 0, "data_loading": 0.0, "featurization": 0.0, "forward": 0.0,
+                 "backward": 0.0, "checkpoint": 0.0}
+        checkpoint_every = self.hyper_params['checkpoint_every'] if train else None
+        start = time.perf_counter()
+        batch_start = start
+        for batch in loader:
+            stats["data_loading"] += time.perf_counter() - batch_start
+            loss, timings = self.step(batch, train)
+            n_samples = batch[self.atomic_num_key].shape[0]
+            stats["loss"] += loss * n_samples
+            stats["samples"] += n_samples
+            stats["atoms"] += int(torch.count_nonzero(batch[self.atomic_num_key]))
+            for key, value in timings.items():
+                stats[key] += value
+            if train:
+                self.batches_done += 1
+            if checkpoint_every is not None and self.batches_done % checkpoint_every == 0:
+                checkpoint_start = time.perf_counter()
+                self._checkpoint()
+                stats["checkpoint"] += time.perf_counter() - checkpoint_start
+            batch_start = time.perf_counter()
+        elapsed = time.perf_counter() - start
+        if self.world_size > 1:
+            stats, elapsed = self._reduce_stats(stats, elapsed)
+        stats["loss"] /= max(stats["samples"], 1)
+        stats["seconds"] = elapsed
+        stats["samples_per_sec"] = stats["samples"] / elapsed
+        stats["atoms_per_sec"] = stats["atoms"] / elapsed
+        return stats
+
+    def _reduce_stats(self, stats, elapsed):
+        """
+        Sums the counts and losses of an epoch over all ranks. Times are the slowest rank
+        """
+        keys = ["loss", "samples", "atoms"]
+        totals = torch.tensor([stats[key] for key in keys], dtype=torch.float64)
+        dist.all_reduce(totals)
+        timings = ["data_loading", "featurization", "forward", "backward", "checkpoint"]
+        times = torch.tensor([stats[key] for key in timings] + [elapsed], dtype=torch.float64)
+        dist.all_reduce(times, op=dist.ReduceOp.MAX)
+        stats.update({key: value for key, value in zip(keys, totals.tolist())})
+        stats.update({key: value for key, value in zip(timings, times.tolist())})
+        stats["samples"], stats["atoms"] = int(stats["samples"]), int(stats["atoms"])
+        return stats, times[-1].item()
+
+    def fit(self, max_epochs=None):
+        """
+        Trains until max_epochs epochs are done, validating and checkpointing after each epoch. A run resumed from a
+        checkpoint finishes the interrupted epoch from where it stopped and then the remaining epochs.
+
+        Returns:
+            history: list of dicts of training and validation stats for each epoch
+        """
+        if max_epochs is None:
+            max_epochs = self.hyper_params['max_epochs']
+        if self.epoch == 0 and self.batches_done == 0:
+            self.fit_atomic_energies()
+        if self.hyper_params['async_checkpoint'] and self.hyper_params['checkpoint_path'] is not None:
+            self.checkpointer = AsyncCheckpointer()
+        try:
+            while self.epoch < max_epochs:
+                self.train_sampler.set_epoch(self.epoch)
+                self.train_sampler.skip(self.batches_done)
+                train_stats = self.run_epoch(self.train_loader, train=True)
+                valid_stats = self.run_epoch(self.valid_loader, train=False) if len(self.valid_data) > 0 else None
+                self.epoch += 1
+                self.batches_done = 0
+                self.scheduler.step()
+                self.history.append({"epoch": self.epoch, "train": train_stats, "valid": valid_stats})
+                if self.rank == 0:
+                    self.print_epoch(train_stats, valid_stats)
+                valid_loss = train_stats["loss"] if valid_stats is None else valid_stats["loss"]
+                best = valid_loss < self.best_loss
+                self.best_loss = min(self.best_loss, valid_loss)
+                if self.hyper_params['checkpoint_path'] is not None:
+                    self._checkpoint(best)
+        finally:
+            # Every queued checkpoint is on disk when fit returns or raises
+            if self.checkpointer is not None:
+                checkpointer, self.checkpointer = self.checkpointer, None
+                checkpointer.close()
+        return self.history
+
+    def print_epoch(self, train_stats, valid_stats):
+        print(f"Epoch {self.epoch:4d} train loss {train_stats['loss']:.6e} "
+              f"{train_stats['samples_per_sec']:.1f} samples/s {train_stats['atoms_per_sec']:.1f} atoms/s")
+        print(f"    time (s) data {train_stats['data_loading']:.3f} featurization {train_stats['featurization']:.3f} "
+              f"forward {train_stats['forward']:.3f} backward {train_stats['backward']:.3f} "
+              f"checkpoint {train_stats['checkpoint']:.3f}")
+        if valid_stats is not None:
+            print(f"    valid loss {valid_stats['loss']:.6e} {valid_stats['samples_per_sec']:.1f} samples/s")
+
+    def checkpoint_state(self):
+        return {"model": self.model.state_dict(),
+                "optimizer": self.optimizer.state_dict(),
+                "scheduler": self.scheduler.state_dict(),
+                "epoch": self.epoch,
+                "batches_done": self.batches_done,
+                "best_loss": self.best_loss,
+                "rng": rng_state(),
+                "hyper_params": self.hyper_params}
+
+    def save_checkpoint(self, filename, best=False):
+        """
+        Saves a checkpoint to filename, and to filename.best when best is True, and returns once the files are
+        written. Only rank 0 writes.
+        """
+        if self.rank != 0:
+            return
+        state = self.checkpoint_state()
+        for name in [filename, filename + ".best"] if best else [filename]:
+            save_atomic(state, name)
+
+    def _checkpoint(self, best=False):
+        """
+        Saves a checkpoint to checkpoint_path during fit, from the background writer with async_checkpoint
+        """
+        if self.checkpointer is None:
+            self.save_checkpoint(self.hyper_params['checkpoint_path'], best)
+        elif self.rank == 0:
+            filename = self.hyper_params['checkpoint_path']
+            self.checkpointer.save(self.checkpoint_state(), [filename, filename + ".best"] if best else [filename])
+
+    def load_checkpoint(self, filename):
+        checkpoint = torch.load(filename, map_location=self.device)
+        self.model.load_state_dict(checkpoint["model"])
+        self.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.epoch = checkpoint["epoch"]
+        self.best_loss = checkpoint["best_loss"]
+        if "scheduler" in checkpoint:
+            self.scheduler.load_state_dict(checkpoint["scheduler"])
+            self.batches_done = checkpoint["batches_done"]
+            set_rng_state(checkpoint["rng"])
+
 
 class TensorChem(nn.Module):
     """
-    The network class which contains the necessary submodules
+    The network class which contains the necessary submodules. Atoms are grouped by element once per batch with a
+    sorting permutation, so each element subnet is evaluated on one contiguous slab of atoms regardless of how many
+    elements the model has. With stacked=True the element subnets are held as one StackedSubNet instead, which
+    evaluates every element with a single batched matmul per layer.
 
     Args:
         elements: a list of unique elements by atomic number in the training and testing data
         layers: list of ints defining the number of layers and hidden neurons per subnetwork
+        input_size: number of features per atom
+        stacked: use a StackedSubNet rather than one SubNet per element
+        checkpoint_subnets: recompute the subnet activations in the backward pass instead of keeping them in training
     """
+    stacked: torch.jit.Final[bool]
 
-    def __init__(self, elements, layers, input_size):
+    def __init__(self, elements, layers, input_size, stacked=False, checkpoint_subnets=False):
         super().__init__()
-        # subnets = [SubNet(element, input_size, layers) for element in elements]
+        self.register_buffer("elements", torch.as_tensor(elements, dtype=torch.long))
+        self.layers = list(layers)
+        self.input_size = input_size
+        self.stacked = stacked
+        self.checkpoint_subnets = checkpoint_subnets
+        if stacked:
+            self.subnets = StackedSubNet(elements, input_size, layers)
+        else:
+            self.subnets = nn.ModuleList([SubNet(element, input_size, layers) for element in elements])
         return
 
-    def forward(self, at_num, coords):
-        return
+    def set_atomic_energies(self, atomic_energies):
+        """
+        Sets the output bias of each element subnet, e.g. to reference atomic energies fit to the training data, so the
+        network only has to learn the remaining interaction energy
+
+        Args:
+            atomic_energies: tensor with one energy per element in the order of self.elements
+        """
+        with torch.no_grad():
+            if self.stacked:
+                self.subnets.biases[-1].copy_(torch.as_tensor(atomic_energies).reshape(-1, 1, 1))
+            else:
+                for subnet, energy in zip(self.subnets, torch.as_tensor(atomic_energies).tolist()):
+                    subnet.output.bias.fill_(energy)
+
+    def to_stacked(self):
+        """
+        Returns a copy of this model which evaluates the element subnets with a StackedSubNet
+        """
+        if self.stacked:
+            return copy.deepcopy(self)
+        model = TensorChem(self.elements.tolist(), self.layers, self.input_size, stacked=True,
+                           checkpoint_subnets=self.checkpoint_subnets)
+        model.subnets = StackedSubNet.from_subnets(self.subnets)
+        return model.to(self.elements.device)
+
+    def to_grouped(self):
+        """
+        Returns a copy of this model with one SubNet module per element
+        """
+        if not self.stacked:
+            return copy.deepcopy(self)
+        model = TensorChem(self.elements.tolist(), self.layers, self.input_size, stacked=False,
+                           checkpoint_subnets=self.checkpoint_subnets)
+        model.subnets = self.subnets.to_subnets(self.elements.tolist())
+        return model.to(self.elements.device)
+
+    def forward(self, at_nums, features, mol_idx: Optional[torch.Tensor] = None):
+        """
+        Args:
+            at_nums: B x Na tensor of atomic numbers padded with 0, or a flat tensor of atomic numbers with mol_idx
+            features: tensor of atomic features with the same leading dimensions as at_nums
+            mol_idx: optional tensor of the molecule index of each atom for flat inputs
+
+        Returns:
+            energies: tensor of molecular energies
+        """
+        atomic_energies = self.atomic_energies(at_nums, features)
+        if mol_idx is None:
+            n_mols = at_nums.shape[0]
+            mol_idx = torch.arange(n_mols, device=at_nums.device).repeat_interleave(at_nums.shape[-1])
+        else:
+            n_mols = int(mol_idx.max()) + 1
+        energies = torch.zeros(n_mols, dtype=atomic_energies.dtype, device=atomic_energies.device)
+        return energies.index_add(0, mol_idx, atomic_energies.reshape(-1))
+
+    def atomic_energies(self, at_nums, features):
+        """
+        Evaluates the element subnets for every atom
+
+        Args:
+            at_nums: tensor of atomic numbers, 0 or any element not in the model for padding
+            features: tensor of atomic features with the same leading dimensions as at_nums
+
+        Returns:
+            atomic_energies: tensor with the shape of at_nums with the energy of each atom, 0 for padding
+        """
+        if self.checkpoint_subnets and self.training and torch.is_grad_enabled():
+            return self._checkpointed_atomic_energies(at_nums, features)
+        return self._atomic_energies(at_nums, features)
+
+    @torch.jit.unused
+    def _checkpointed_atomic_energies(self, at_nums, features):
+        return checkpoint(self._atomic_energies, at_nums, features, use_reentrant=False)
+
+    def _atomic_energies(self, at_nums, features):
+        flat_features = features.reshape(at_nums.numel(), -1)
+        elem_idx = element_index(at_nums.reshape(-1), self.elements)
+        if self.stacked:
+            return self.subnets(elem_idx, flat_features).reshape(at_nums.shape)
+        # Padding atoms have index -1 and sort to the front, followed by each element in turn
+        order = torch.argsort(elem_idx)
+        counts = torch.bincount(elem_idx + 1, minlength=self.elements.shape[0] + 1)
+        split_sizes: List[int] = counts.tolist()
+        slabs = torch.split(flat_features[order], split_sizes)
+        sorted_energies = [torch.zeros(slabs[0].shape[0], dtype=flat_features.dtype, device=flat_features.device)]
+        for i, subnet in enumerate(self.subnets):
+            # Empty slabs are still evaluated so every parameter stays in the graph
+            sorted_energies.append(subnet(slabs[i + 1]))
+        sorted_energies = torch.cat(sorted_energies)
+        atomic_energies = torch.zeros_like(sorted_energies).index_copy(0, order, sorted_energies)
+        return atomic_energies.reshape(at_nums.shape)
 
 
 class SubNet(nn.Module):
@@ -52,18 +587,158 @@ class SubNet(nn.Module):
     Module for the element subnets.
 
     Args:
+        atomic_num: atomic number of the element this subnet is for
+        input_size: number of features per atom
         layers: list of ints
 
     Returns:
         A feed-forward neural network. The number of hidden layers and neurons per layer is based on len(layers)
-        and the values in the list, respectively.
+        and the values in the list, respectively. A final linear layer gives the energy of each atom.
     """
 
     def __init__(self, atomic_num, input_size, layers):
         super().__init__()
-        self.layers = [nn.Linear(input_size, layers[0])]
-        self.layers += [nn.Linear(layers[i], layers[i + 1]) for i in range(len(layers) - 1)]
+        self.atomic_num = atomic_num
+        self.layers = nn.ModuleList([nn.Linear(input_size, layers[0])])
+        self.layers.extend([nn.Linear(layers[i], layers[i + 1]) for i in range(len(layers) - 1)])
+        self.output = nn.Linear(layers[-1], 1)
+        self.activation = nn.Softplus()
         return
 
-    def forward(self):
+    def forward(self, features):
+        """
+        Args:
+            features: N x input_size tensor of features for atoms of this element
+
+        Returns:
+            energies: N tensor of atomic energies
+        """
+        for layer in self.layers:
+            features = self.activation(layer(features))
+        return self.output(features).squeeze(-1)
+
+
+class StackedSubNet(nn.Module):
+    """
+    All element subnets in one module, with the weights of each layer stacked into n_elements x in x out parameters.
+    Atoms are gathered into an n_elements x max atoms per element x features tensor padded with zeros, so each layer is
+    a single batched matmul over all elements. Computes the same function as one SubNet per element.
+
+    Args:
+        elements: list of atomic numbers, one subnet per element
+        input_size: number of features per atom
+        layers: list of ints giving the number of neurons in each hidden layer
+    """
+    n_layers: torch.jit.Final[int]
+
+    def __init__(self, elements, input_size, layers):
+        super().__init__()
+        n_elements = len(elements)
+        sizes = [input_size] + list(layers) + [1]
+        self.n_layers = len(sizes) - 1
+        self.weights = nn.ParameterList([nn.Parameter(torch.empty(n_elements, sizes[i], sizes[i + 1]))
+                                         for i in range(len(sizes) - 1)])
+        self.biases = nn.ParameterList([nn.Parameter(torch.empty(n_elements, 1, sizes[i + 1]))
+                                        for i in range(len(sizes) - 1)])
+        self.activation = nn.Softplus()
+        self.reset_parameters()
         return
+
+    def reset_parameters(self):
+        # Same distribution as the default nn.Linear initialization for each element
+        for weight, bias in zip(self.weights, self.biases):
+            bound = 1.0 / math.sqrt(weight.shape[1])
+            nn.init.uniform_(weight, -bound, bound)
+            nn.init.uniform_(bias, -bound, bound)
+
+    @classmethod
+    def from_subnets(cls, subnets):
+        """
+        Builds a StackedSubNet with the weights of a list of SubNets
+        """
+        layers = [layer.out_features for layer in subnets[0].layers]
+        stacked = cls([subnet.atomic_num for subnet in subnets], subnets[0].layers[0].in_features, layers)
+        with torch.no_grad():
+            for i in range(len(stacked.weights)):
+                linears = [subnet.layers[i] if i < len(layers) else subnet.output for subnet in subnets]
+                stacked.weights[i].copy_(torch.stack([linear.weight.t() for linear in linears]))
+                stacked.biases[i].copy_(torch.stack([linear.bias.unsqueeze(0) for linear in linears]))
+        return stacked.to(subnets[0].output.weight.device)
+
+    def to_subnets(self, elements=None):
+        """
+        Splits the stacked weights back into a ModuleList of SubNets
+        """
+        n_elements, input_size = self.weights[0].shape[0], self.weights[0].shape[1]
+        layers = [weight.shape[2] for weight in self.weights[:-1]]
+        if elements is None:
+            elements = list(range(n_elements))
+        subnets = nn.ModuleList([SubNet(element, input_size, layers) for element in elements])
+        with torch.no_grad():
+            for e, subnet in enumerate(subnets):
+                for linear, weight, bias in zip(list(subnet.layers) + [subnet.output], self.weights, self.biases):
+                    linear.weight.copy_(weight[e].t())
+                    linear.bias.copy_(bias[e, 0])
+        return subnets.to(self.weights[0].device)
+
+    def forward(self, elem_idx, features):
+        """
+        Args:
+            elem_idx: N tensor of element indices for each atom, -1 for padding
+            features: N x input_size tensor of atomic features
+
+        Returns:
+            energies: N tensor of atomic energies, 0 for padding
+        """
+        table, _ = group_by_element(elem_idx, self.weights[0].shape[0])
+        n_atoms = features.shape[0]
+        padded = torch.cat([features, torch.zeros_like(features[:1])])
+        hidden = padded[table]
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            hidden = torch.baddbmm(bias, hidden, weight)
+            if i < self.n_layers - 1:
+                hidden = self.activation(hidden)
+        energies = torch.zeros(n_atoms + 1, dtype=hidden.dtype, device=hidden.device)
+        energies = energies.index_copy(0, table.reshape(-1), hidden.reshape(-1))
+        return energies[:n_atoms]
+
+
+def group_by_element(elem_idx, n_elements: int):
+    """
+    Builds a table of atom indices for each element from a stable sort of the element indices
+
+    Args:
+        elem_idx: N tensor of element indices, -1 for atoms which belong to no element
+        n_elements: number of elements
+
+    Returns:
+        table: n_elements x max atoms per element tensor of atom indices, padded with N
+        valid: boolean tensor with the shape of table, False for padding
+    """
+    n_atoms = elem_idx.shape[0]
+    order = torch.argsort(elem_idx)
+    counts = torch.bincount(elem_idx + 1, minlength=n_elements + 1)
+    starts = torch.cumsum(counts, 0) - counts
+    sorted_idx = elem_idx[order]
+    slot = torch.arange(n_atoms, device=elem_idx.device) - starts[sorted_idx + 1]
+    table = torch.full((n_elements, int(counts[1:].max())), n_atoms, dtype=torch.long, device=elem_idx.device)
+    real = sorted_idx >= 0
+    table[sorted_idx[real], slot[real]] = order[real]
+    return table, table < n_atoms
+
+
+def load_model(filename, device="cpu"):
+    """
+    Loads the model from a checkpoint saved by TensorChemTrainer.save_checkpoint
+
+    Returns:
+        model: the TensorChem model
+        hyper_params: the hyper parameters it was trained with
+    """
+    checkpoint = torch.load(filename, map_location=device)
+    hyper_params = checkpoint["hyper_params"]
+    input_size = len(hyper_params['elements']) * len(hyper_params['sym_func_params']['r_nought'])
+    model = TensorChem(hyper_params['elements'], hyper_params['layers'], input_size,
+                       stacked=hyper_params.get('stacked', False))
+    model.load_state_dict(checkpoint["model"])
+    return model.to(device), hyper_params
@@ -0,0 +1,136 @@
+"""
+Helpers for benchmarking the featurization and network hot paths: synthetic molecules, timing, peak memory and
+comparison against stored baseline results
+"""
+
+import os
+import json
+import time
+import resource
+
+import torch
+
+
+def random_molecules(n_atoms, batch_size, elements, density=0.1, min_dist=0.9, n_unique=8, generator=None):
+    """
+    Builds a batch of synthetic molecules with atoms placed at random in a cube. Atoms closer than min_dist are pushed
+    apart with a few relaxation steps so the distance distribution looks like a real molecule. Only n_unique molecules
+    are generated and repeated to fill the batch, which keeps setup cheap for large batches.
+
+    Args:
+        n_atoms: number of atoms per molecule
+        batch_size: number of molecules
+        elements: tensor of atomic numbers to draw the atoms from
+        density: atoms per cubic angstrom
+        min_dist: smallest allowed interatomic distance in angstroms
+        n_unique: number of distinct molecules in the batch
+        generator: optional torch.Generator for reproducible molecules
+
+    Returns:
+        at_nums: batch_size x n_atoms tensor of atomic numbers
+        coords: batch_size x n_atoms x 3 tensor of atomic positions
+    """
+    n_unique = min(n_unique, batch_size)
+    box = (n_atoms / density) ** (1.0 / 3.0)
+    at_nums = elements[torch.randint(len(elements), (n_unique, n_atoms), generator=generator)]
+    coords = torch.rand(n_unique, n_atoms, 3, generator=generator) * box
+    for _ in range(10):
+        d_xyz = coords.unsqueeze(-2) - coords.unsqueeze(-3)
+        dist = torch.norm(d_xyz, dim=-1) + torch.eye(n_atoms) * min_dist
+        overlap = torch.clamp(min_dist - dist, min=0.0)
+        if not torch.any(overlap > 0):
+            break
+        coords = coords + 0.5 * (overlap.unsqueeze(-1) * d_xyz / dist.unsqueeze(-1)).sum(-2)
+    n_tiles = -(-batch_size // n_unique)
+    return at_nums.repeat(n_tiles, 1)[:batch_size], coords.repeat(n_tiles, 1, 1)[:batch_size]
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size of this process where the OS allows it (Linux)
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, since the last reset_peak_rss on Linux
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS, and cannot be reset
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 2 ** 20 if os.uname().sysname == "Darwin" else max_rss / 1024.0
+
+
+def time_function(fn, n_repeats=10, n_warmup=2, min_time=None):
+    """
+    Times repeated calls of fn after a few warmup calls
+
+    Args:
+        fn: function taking no arguments
+        n_repeats: number of timed calls
+        n_warmup: number of untimed calls made first
+        min_time: optional minimum total time in seconds. More calls are made until it is reached
+
+    Returns:
+        seconds: mean wall time per call
+    """
+    for _ in range(n_warmup):
+        fn()
+    n_calls = 0
+    start = time.perf_counter()
+    while n_calls < n_repeats or (min_time is not None and time.perf_counter() - start < min_time):
+        fn()
+        n_calls += 1
+    return (time.perf_counter() - start) / n_calls
+
+
+def benchmark_key(result):
+    # Results saved before the precision was recorded ran in the default precision
+    return "/".join(str(result.get(key)) for key in ("case", "n_atoms", "batch_size", "threads", "precision"))
+
+
+def save_results(results, filename):
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results, baseline, metric="geometries_per_sec", tolerance=0.1):
+    """
+    Compares benchmark results with a baseline run of the same cases
+
+    Args:
+        results: list of result dicts with case, n_atoms, batch_size, threads and precision keys and the metric
+        baseline: list of result dicts from an earlier run
+        metric: throughput metric to compare, where larger is better
+        tolerance: fractional slowdown allowed before a case counts as a regression
+
+    Returns:
+        comparisons: list of dicts with the key, baseline and new values, ratio and a regression flag for every case
+            present in both runs
+    """
+    baseline = {benchmark_key(result): result for result in baseline}
+    comparisons = []
+    for result in results:
+        key = benchmark_key(result)
+        if key not in baseline:
+            continue
+        ratio = result[metric] / baseline[key][metric]
+        comparisons.append({"key": key, "baseline": baseline[key][metric], "value": result[metric], "ratio": ratio,
+                            "regression": ratio < 1.0 - tolerance})
+    return comparisons
@@ -0,0 +1,120 @@
+"""
+Checkpoint writing which does not stall training: state is copied to the CPU on the training thread and written to
+disk from a background thread, with an atomic rename so a preempted job never leaves a partial checkpoint.
+"""
+
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+
+def snapshot(state):
+    """
+    Copies every tensor in a nested structure of dicts, lists and tuples to new CPU tensors, so training can continue
+    to update the originals while the copy is written
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {key: snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(value) for value in state)
+    return state
+
+
+def save_atomic(state, filename):
+    """
+    Saves with torch.save to a temporary file in the same directory, then renames it over filename
+    """
+    tmp_filename = f"{filename}.tmp{os.getpid()}"
+    with open(tmp_filename, "wb") as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def rng_state():
+    """
+    The state of the python, numpy and torch random number generators, made of tensors and python types only so
+    checkpoints load with torch.load(weights_only=True)
+    """
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    state = {"python": random.getstate(), "numpy": (name, keys.tolist(), pos, has_gauss, cached_gaussian),
+             "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    name, keys, pos, has_gauss, cached_gaussian = state["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints from a background thread. save copies the state to the CPU and returns, and the write happens
+    while training continues. At most max_pending snapshots wait to be written, after which save blocks, which bounds
+    the memory held by snapshots when checkpoints are requested faster than the disk can take them. An error in the
+    writer thread is raised from the next call to save or wait.
+
+    Args:
+        max_pending: maximum number of snapshots waiting to be written
+    """
+
+    def __init__(self, max_pending=1):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def save(self, state, filenames):
+        """
+        Args:
+            state: nested dict of tensors and python objects to save
+            filenames: filename or list of filenames to write the state to
+        """
+        self._raise_error()
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        self.queue.put((snapshot(state), list(filenames)))
+
+    def wait(self):
+        """
+        Blocks until every queued checkpoint is written
+        """
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        self.wait()
+        self.queue.put(None)
+        self.thread.join()
+
+    def _write(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            state, filenames = item
+            try:
+                for filename in filenames:
+                    save_atomic(state, filename)
+            except Exception as error:
+                self.error = error
+            self.queue.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("Writing a checkpoint failed") from error
@@ -0,0 +1,146 @@
+"""
+Writing Q-Chem input files for Geometries, Trajectories and Molecules, e.g. for the single points of geometries
+picked by active learning. Inputs are rendered from string.Template templates, and many single points can be packed
+into one multi-job input file, with the jobs separated by @@@ lines, so that a cluster job pays the scheduler and
+Q-Chem startup costs once for all of them.
+"""
+
+import os
+from string import Template
+
+# The level of theory of the existing datasets, with forces for force training
+DEFAULT_REM = {"jobtype": "force", "method": "wb97x-d", "basis": "6-311g**"}
+
+# Templates are filled with molecule and rem, the rendered sections, along with name, charge, multiplicity,
+# coordinates and any extra fields given, so a custom template can add e.g. a $comment or basis set section
+MOLECULE_TEMPLATE = Template("$$molecule\n$charge $multiplicity\n$coordinates\n$$end\n")
+REM_TEMPLATE = Template("$$rem\n$variables\n$$end\n")
+INPUT_TEMPLATE = Template("$molecule\n$rem")
+JOB_SEPARATOR = "\n@@@\n\n"
+
+
+def coordinates_block(geometry):
+    return "\n".join(f"{symbol:<3} {xyz[0]:15.10f} {xyz[1]:15.10f} {xyz[2]:15.10f}"
+                     for symbol, xyz in zip(geometry.at_symbs, geometry.xyz.tolist()))
+
+
+def molecule_section(geometry, charge=0, multiplicity=1):
+    return MOLECULE_TEMPLATE.substitute(charge=charge, multiplicity=multiplicity,
+                                        coordinates=coordinates_block(geometry))
+
+
+def rem_section(rem=None):
+    rem = DEFAULT_REM if rem is None else rem
+    width = max(len(key) for key in rem)
+    return REM_TEMPLATE.substitute(variables="\n".join(f"   {key:<{width}}  {value}" for key, value in rem.items()))
+
+
+def render_input(geometry, rem=None, charge=0, multiplicity=1, template=None, name="", **fields):
+    """
+    Renders the Q-Chem input of one job for a Geometry
+
+    Args:
+        geometry: the Geometry
+        rem: dict of $rem variables, DEFAULT_REM when None
+        charge: molecular charge
+        multiplicity: spin multiplicity
+        template: optional string.Template or template string, INPUT_TEMPLATE when None
+        name: name of the job, available to the template
+        fields: further template fields
+
+    Returns:
+        text: the input
+    """
+    template = INPUT_TEMPLATE if template is None else template
+    template = template if isinstance(template, Template) else Template(template)
+    return template.substitute(fields, molecule=molecule_section(geometry, charge, multiplicity), rem=rem_section(rem),
+                               name=name, charge=charge, multiplicity=multiplicity,
+                               coordinates=coordinates_block(geometry))
+
+
+def render_jobs(geometries, rem=None, charge=0, multiplicity=1, template=None, names=None, read_guess=False,
+                **fields):
+    """
+    Renders a multi-job Q-Chem input with one single point job for each geometry
+
+    Args:
+        geometries: list of Geometries
+        names: optional list of job names, available to the template
+        read_guess: start the SCF of every job after the first from the orbitals of the job before, which saves SCF
+            cycles for neighbouring frames of a trajectory and needs all geometries to be of the same molecule
+        further arguments as for render_input
+
+    Returns:
+        text: the input
+    """
+    rem = DEFAULT_REM if rem is None else rem
+    names = [""] * len(geometries) if names is None else names
+    jobs = []
+    for i, (geometry, name) in enumerate(zip(geometries, names)):
+        job_rem = dict(rem, scf_guess="read") if read_guess and i > 0 else rem
+        jobs.append(render_input(geometry, job_rem, charge, multiplicity, template, name, **fields))
+    return JOB_SEPARATOR.join(jobs)
+
+
+def write_input(geometry, filename, rem=None, charge=0, multiplicity=1, template=None, **fields):
+    """
+    Writes a Q-Chem input file for a Geometry
+
+    Args:
+        geometry: the Geometry
+        filename: input file to write
+        rem: dict of $rem variables, DEFAULT_REM when None
+        charge: molecular charge
+        multiplicity: spin multiplicity
+        template: optional string.Template or template string, INPUT_TEMPLATE when None
+        fields: further template fields
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    with open(filename, "w") as f:
+        f.write(render_input(geometry, rem, charge, multiplicity, template, name, **fields))
+
+
+def write_inputs(geometries, out_path, prefix, rem=None, charge=0, multiplicity=1, jobs_per_file=1, template=None,
+                 read_guess=False, **fields):
+    """
+    Writes Q-Chem inputs for a list of geometries to out_path, packing jobs_per_file single points into each file.
+    Files are named {prefix}_{i}.in after the index of their first geometry, and jobs {prefix}_{j} after theirs.
+
+    Args:
+        geometries: list of Geometries
+        out_path: directory to write the inputs to
+        prefix: name of the inputs, e.g. the molecule
+        jobs_per_file: number of jobs in each multi-job input, 1 for one input per geometry
+        further arguments as for render_jobs
+
+    Returns:
+        filenames: list of the inputs written
+    """
+    os.makedirs(out_path, exist_ok=True)
+    filenames = []
+    for start in range(0, len(geometries), jobs_per_file):
+        batch = geometries[start:start + jobs_per_file]
+        names = [f"{prefix}_{i}" for i in range(start, start + len(batch))]
+        filenames.append(os.path.join(out_path, f"{names[0]}.in"))
+        with open(filenames[-1], "w") as f:
+            f.write(render_jobs(batch, rem, charge, multiplicity, template, names, read_guess, **fields))
+    return filenames
+
+
+def write_trajectory_inputs(trajectory, out_path, prefix, **kwargs):
+    """
+    Writes Q-Chem inputs for the geometries of a Trajectory, with arguments as for write_inputs
+    """
+    return write_inputs(trajectory.geometries, out_path, prefix, **kwargs)
+
+
+def write_molecule_inputs(molecule, out_path, prefix=None, charge=None, **kwargs):
+    """
+    Writes Q-Chem inputs for the geometries of all trajectories of a Molecule, with the charge of the molecule and
+    named after its mset file or else its atoms, with further arguments as for write_inputs
+    """
+    if prefix is None:
+        prefix = os.path.splitext(molecule.filename)[0] if molecule.filename else "".join(molecule.at_symbs)
+    if charge is None:
+        charge = molecule.charge or 0
+    return write_inputs(molecule.geometries, out_path, prefix, charge=charge, **kwargs)
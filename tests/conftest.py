@@ -0,0 +1,28 @@
+import pytest
+import torch
+
+from tensorchem.dataset.dataset import MixedDataset
+
+
+@pytest.fixture
+def water_dataset():
+    """
+    Builds small datasets of randomly distorted waters with energy and force labels
+    """
+    def make_dataset(n_samples=8):
+        dataset = MixedDataset()
+        for i in range(n_samples):
+            coords = torch.tensor([[0.0, 0.0, 0.1177], [0.0, 0.7549, -0.4709], [0.0, -0.7549, -0.4709]])
+            coords = coords + 0.05 * torch.randn(3, 3)
+            dataset.samples.append({"atomic_numbers": [8, 1, 1], "coordinates": coords.tolist(),
+                                    "energy": -76.4 + 0.01 * i, "forces": (0.1 * torch.randn(3, 3)).tolist()})
+        return dataset
+    return make_dataset
+
+
+@pytest.fixture
+def hyper_params():
+    return {"learning_rate": 1e-3, "betas": (0.9, 0.999), "weight_decay": 0.0, "elements": [1, 8],
+            "layers": [16, 16], "sym_func_params": {"r_nought": torch.linspace(0.5, 5.0, 8).tolist(),
+                                                    "eta": 4.0, "rad_cut": 5.0},
+            "energy_key": "energy", "batch_size": 4, "validation_split": 0.25}
@@ -0,0 +1,62 @@
+import torch
+
+from tensorchem.molecules import Geometry
+from tensorchem.networks.active_learning import committee_disagreement, select_candidates, diverse_top_k, \
+    write_selection, mset_candidates
+from tensorchem.networks.ensemble import TensorChemEnsemble
+from tensorchem.networks.tensormol import TensorChemTrainer
+
+water = torch.tensor([8, 1, 1], dtype=torch.uint8)
+generator = torch.Generator().manual_seed(0)
+base = torch.tensor([[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]])
+geometries = [Geometry(water, base + 0.3 * torch.randn(3, 3, generator=generator)) for _ in range(30)]
+# Odd candidates are hydroxide-like anions, to check that charges reach the inputs
+candidates = [(f"water_{i}", geometry, -(i % 2)) for i, geometry in enumerate(geometries)]
+
+
+def save_checkpoints(tmp_path, water_dataset, hyper_params):
+    filenames = []
+    for seed in range(3):
+        torch.manual_seed(seed)
+        filenames.append(str(tmp_path / f"model_{seed}.pt"))
+        TensorChemTrainer(water_dataset(), hyper_params).save_checkpoint(filenames[-1])
+    return filenames
+
+
+def test_committee_disagreement(tmp_path, water_dataset, hyper_params):
+    ensemble, params = TensorChemEnsemble.from_checkpoints(save_checkpoints(tmp_path, water_dataset, hyper_params))
+    params = {key: torch.as_tensor(value) for key, value in params["sym_func_params"].items()}
+    for metric in ["force", "energy"]:
+        scores = committee_disagreement(ensemble, params, geometries[:5], metric, batch_size=2)
+        assert scores.shape == (5,) and torch.all(scores > 0.0)
+        assert torch.allclose(scores[3:4], committee_disagreement(ensemble, params, geometries[3:4], metric))
+
+
+def test_select_candidates(tmp_path, water_dataset, hyper_params):
+    checkpoints = save_checkpoints(tmp_path, water_dataset, hyper_params)
+    serial, n_scored = select_candidates(checkpoints, candidates, 5, min_rmsd=0.0, chunk_size=7, n_workers=1)
+    parallel, _ = select_candidates(checkpoints, iter(candidates), 5, min_rmsd=0.0, chunk_size=4, n_workers=2,
+                                    max_pending=2)
+    assert n_scored == 30 and [name for _, name, _, _ in serial] == [name for _, name, _, _ in parallel]
+    ensemble, params = TensorChemEnsemble.from_checkpoints(checkpoints)
+    params = {key: torch.as_tensor(value) for key, value in params["sym_func_params"].items()}
+    scores = committee_disagreement(ensemble, params, geometries)
+    assert [name for _, name, _, _ in serial] == [f"water_{i}" for i in torch.argsort(scores, descending=True)[:5]]
+    assert {charge for _, _, _, charge in serial} == {0, -1}
+    filenames = write_selection(serial, str(tmp_path / "qchem"))
+    for (_, _, _, charge), filename in zip(serial, filenames):
+        with open(filename) as f:
+            text = f.read()
+        assert f"$molecule\n{charge} 1\nO" in text and "jobtype" in text
+
+
+def test_mset_candidates():
+    name, geometry, charge = next(mset_candidates(["tests/data/h2o.mset"]))
+    assert name == "h2o_0" and geometry.n_atoms == 3 and charge == 0
+
+
+def test_diverse_top_k():
+    duplicate = Geometry(water, geometries[0].xyz @ torch.tensor([[0.0, 1.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]))
+    ranked = [(3.0, "a", geometries[0], 0), (2.0, "b", duplicate, 0), (1.0, "c", geometries[1], 0)]
+    assert [name for _, name, _, _ in diverse_top_k(ranked, 2, 0.05)] == ["a", "c"]
+    assert [name for _, name, _, _ in diverse_top_k(ranked, 2, 0.0)] == ["a", "b"]
@@ -0,0 +1,27 @@
+import pytest
+import torch
+
+from tensorchem.util.benchmark import random_molecules, compare_to_baseline, time_function, peak_rss_mb
+
+
+def test_random_molecules():
+    at_nums, coords = random_molecules(20, 10, torch.tensor([1, 6, 8]), generator=torch.Generator().manual_seed(0))
+    assert at_nums.shape == (10, 20) and coords.shape == (10, 20, 3)
+    dist = torch.cdist(coords, coords) + torch.eye(20) * 10.0
+    assert dist.min() > 0.5
+
+
+def test_compare_to_baseline():
+    baseline = [{"case": "a", "n_atoms": 3, "batch_size": 1, "threads": 1, "geometries_per_sec": 100.0},
+                {"case": "b", "n_atoms": 3, "batch_size": 1, "threads": 1, "geometries_per_sec": 100.0}]
+    results = [dict(baseline[0], geometries_per_sec=95.0), dict(baseline[1], geometries_per_sec=50.0)]
+    comparisons = compare_to_baseline(results, baseline, tolerance=0.1)
+    assert [c["regression"] for c in comparisons] == [False, True]
+    float64 = [dict(result, precision="float64", geometries_per_sec=10.0) for result in results]
+    comparisons = compare_to_baseline(float64 + results, baseline + float64, tolerance=0.1)
+    assert [c["regression"] for c in comparisons] == [False, False, False, True]
+
+
+def test_time_function():
+    assert time_function(lambda: None, n_repeats=3) >= 0.0
+    assert peak_rss_mb() > 0.0
@@ -0,0 +1,48 @@
+import os
+import random
+
+import numpy as np
+import pytest
+import torch
+
+from tensorchem.util.checkpoint import snapshot, save_atomic, rng_state, set_rng_state, AsyncCheckpointer
+
+
+def test_snapshot():
+    weight = torch.ones(3, requires_grad=True)
+    state = {"model": {"weight": weight}, "steps": [torch.zeros(2), 5], "name": "model"}
+    copy = snapshot(state)
+    with torch.no_grad():
+        weight.add_(1.0)
+    assert torch.equal(copy["model"]["weight"], torch.ones(3)) and not copy["model"]["weight"].requires_grad
+    assert copy["steps"][1] == 5 and copy["name"] == "model"
+
+
+def test_save_atomic(tmp_path):
+    filename = str(tmp_path / "state.pt")
+    save_atomic({"x": torch.arange(3)}, filename)
+    save_atomic({"x": torch.arange(4)}, filename)
+    assert torch.equal(torch.load(filename)["x"], torch.arange(4))
+    assert os.listdir(str(tmp_path)) == ["state.pt"]
+
+
+def test_rng_state():
+    state = rng_state()
+    expected = (random.random(), np.random.rand(), torch.rand(1))
+    set_rng_state(state)
+    assert (random.random(), np.random.rand()) == expected[:2] and torch.equal(torch.rand(1), expected[2])
+
+
+def test_AsyncCheckpointer(tmp_path):
+    checkpointer = AsyncCheckpointer()
+    weight = torch.zeros(4)
+    for i in range(3):
+        weight += 1.0
+        checkpointer.save({"weight": weight}, [str(tmp_path / "a.pt"), str(tmp_path / "b.pt")])
+    checkpointer.wait()
+    for name in ["a.pt", "b.pt"]:
+        assert torch.equal(torch.load(str(tmp_path / name))["weight"], torch.full((4,), 3.0))
+    checkpointer.save({"weight": weight}, str(tmp_path / "missing" / "c.pt"))
+    with pytest.raises(RuntimeError):
+        checkpointer.wait()
+    checkpointer.close()
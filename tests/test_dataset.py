@@ -1,8 +1,9 @@
 import tensorchem
 import pytest
+import torch
 
-from tensorchem.dataset.dataset import MixedDataset
-from tensorchem.molecules import Molecule
+from tensorchem.dataset.dataset import MixedDataset, MemoryBudgetBatchSampler, ResumableBatchSampler, batch_memory
+from tensorchem.molecules import Molecule, Geometry, Trajectory
 
 
 def test_len_MixedDataset():
@@ -14,7 +15,8 @@ def test_len_MixedDataset():
 def test_getitem_MixedDataset():
     mixed_data = MixedDataset()
     mixed_data.load('tests/data/h2o.dset')
-    assert list(mixed_data.__getitem__(0).keys()) == ["atomic_numbers", "coordinates", "wb97x-d.6-311gss.mulliken_charge"]
+    assert list(mixed_data.__getitem__(0).keys()) == ["atomic_numbers", "coordinates", "wb97x-d.6-311gss.mulliken_charge",
+                                                      "wb97x-d.6-311gss.energy"]
 
 
 def test_save_nofile_MixedDataset():
@@ -24,7 +26,47 @@ def test_save_nofile_MixedDataset():
         mixed_data.save()
 
 
-#def test_MixedDataset_from_mset():
-#    mset = Molecule()
-#    mset.load('h2o.mset', './tests/data')
-#    assert type(MixedDataset.from_mset(mset)) == tensorchem.dataset.dataset.MixedDataset
+def test_MemoryBudgetBatchSampler():
+    counts = [3, 50, 3, 10, 50, 3, 10, 200]
+    sampler = MemoryBudgetBatchSampler(counts, 10000, 10, 1)
+    batches = list(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(8))
+    for batch in batches:
+        n_atoms = max(counts[i] for i in batch)
+        assert len(batch) == 1 or batch_memory(len(batch), n_atoms, 10, 1) <= 10000
+    assert [7] in batches and len(sampler) == len(batches)
+    sampler.set_epoch(1)
+    assert sorted(map(sorted, sampler)) == sorted(map(sorted, batches))
+    shards = [list(MemoryBudgetBatchSampler(counts, 10000, 10, 1, num_replicas=3, rank=rank)) for rank in range(3)]
+    assert len(set(len(shard) for shard in shards)) == 1
+    assert batch_memory(4, 100, 10, 1, pair_chunk=1) < batch_memory(4, 100, 10, 1)
+
+
+def test_ResumableBatchSampler():
+    sampler = ResumableBatchSampler(MemoryBudgetBatchSampler([3, 50, 3, 10, 50, 3, 10, 200], 10000, 10, 1))
+    batches = list(sampler)
+    sampler.skip(2)
+    assert len(sampler) == len(batches) - 2
+    assert list(sampler) == batches[2:]
+    assert len(sampler) == len(batches)
+    sampler.skip(len(batches) + 1)
+    assert len(sampler) == 0 and list(sampler) == []
+
+
+def test_MixedDataset_from_mset():
+    mset = Molecule()
+    mset.load('h2o.mset', './tests/data')
+    dataset = MixedDataset.from_mset(mset)
+    assert type(dataset) == tensorchem.dataset.dataset.MixedDataset and len(dataset) == len(mset)
+    assert dataset[0]["atomic_numbers"].tolist() == [8, 1, 1] and dataset[0]["coordinates"].shape == (3, 3)
+
+
+def test_MixedDataset_from_mset_subsample():
+    trajectory = Trajectory()
+    trajectory.geometries = [Geometry(torch.tensor([8, 1, 1], dtype=torch.uint8), torch.randn(3, 3),
+                                      {"energy": torch.tensor(float(i))}) for i in range(20)]
+    mset = Molecule(torch.tensor([8, 1, 1], dtype=torch.uint8), 0, trajectories=[trajectory])
+    assert len(MixedDataset.from_mset(mset, subsample="stride", stride=4)) == 5
+    assert len(MixedDataset.from_mset(mset, subsample="farthest_point", fraction=0.25)) == 5
+    dataset = MixedDataset.from_mset(mset, subsample="energy", energy_key="energy", n_select=5, n_bins=5)
+    assert sorted(int(dataset[i]["energy"]) // 4 for i in range(5)) == [0, 1, 2, 3, 4]
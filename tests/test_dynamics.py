@@ -0,0 +1,61 @@
+import torch
+
+from tensorchem.molecules import Molecule, MDTrajectory
+from tensorchem.molecules.dynamics import MolecularDynamics, KB
+from tensorchem.networks.export import TensorChemPipeline
+from tensorchem.networks.tensormol import TensorChem
+
+at_nums = torch.tensor([[8, 1, 1, 0], [6, 1, 1, 1]])
+coords = torch.randn(2, 4, 3, generator=torch.Generator().manual_seed(0))
+stiffness = 0.05
+
+
+def harmonic(at_nums, coords):
+    mask = torch.ne(at_nums, 0).unsqueeze(-1)
+    return 0.5 * stiffness * torch.square(coords * mask).sum((-1, -2)), -stiffness * coords * mask
+
+
+def test_nve_MolecularDynamics():
+    md = MolecularDynamics(harmonic, at_nums, coords, timestep=0.5, temperature=300.0,
+                           generator=torch.Generator().manual_seed(1))
+    start = md.energies + md.kinetic_energy()
+    trajectories = md.run(200, stride=20, buffer_size=3)
+    assert torch.allclose(md.energies + md.kinetic_energy(), start, rtol=2e-3)
+    assert [len(trajectory.geometries) for trajectory in trajectories] == [10, 10]
+    assert trajectories[0].geometries[0].n_atoms == 3 and trajectories[1].geometries[-1].n_atoms == 4
+    assert torch.allclose(trajectories[1].geometries[-1].xyz, md.coords[1].float())
+    assert torch.all(md.coords[0, 3] == coords[0, 3].double())
+
+
+def test_labels_MolecularDynamics():
+    md = MolecularDynamics(harmonic, at_nums, coords, generator=torch.Generator().manual_seed(1))
+    trajectories = md.run(20, stride=2, buffer_size=3)
+    for trajectory in trajectories:
+        assert len(trajectory.geometries) == 10
+        for geometry in trajectory.geometries:
+            energy, _ = harmonic(geometry.atoms.unsqueeze(0), geometry.xyz.unsqueeze(0))
+            assert torch.allclose(geometry.labels["potential energy"].float(), energy[0], rtol=1e-4)
+    assert torch.allclose(trajectories[1].geometries[-1].labels["kinetic energy"], md.kinetic_energy()[1])
+
+
+def test_langevin_MolecularDynamics():
+    md = MolecularDynamics(harmonic, at_nums.repeat(50, 1), coords.repeat(50, 1, 1), timestep=1.0,
+                           temperature=500.0, friction=0.05, velocities=torch.zeros(100, 4, 3),
+                           generator=torch.Generator().manual_seed(2))
+    md.run(300, stride=300)
+    kinetic_temperature = 2.0 * md.kinetic_energy().mean() / (3.5 * 3 * KB)
+    assert abs(kinetic_temperature.item() / 500.0 - 1.0) < 0.15
+
+
+def test_model_MolecularDynamics(tmp_path):
+    model = TensorChem([1, 6, 8], [8], 24)
+    pipeline = TensorChemPipeline(model, {"r_nought": torch.linspace(0.5, 5.0, 8).tolist(), "eta": 4.0,
+                                          "rad_cut": 5.0})
+    md = MolecularDynamics(pipeline, at_nums, coords, timestep=0.1)
+    trajectories = md.run(4, stride=2)
+    assert isinstance(trajectories[0], MDTrajectory) and trajectories[0].frame_interval == 0.2
+    molecule = Molecule(at_nums[0, :3].to(torch.uint8), 0, trajectories=[trajectories[0]])
+    molecule.save("md.mset", str(tmp_path))
+    molecule.load("md.mset", str(tmp_path))
+    assert isinstance(molecule.trajectories[0], MDTrajectory) and len(molecule) == 2
+    assert "potential energy" in molecule[0].labels
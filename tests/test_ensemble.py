@@ -0,0 +1,57 @@
+import pytest
+import torch
+
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+from tensorchem.networks.ensemble import TensorChemEnsemble, evaluate_committee
+from tensorchem.networks.tensormol import TensorChem, TensorChemTrainer
+
+torch.manual_seed(0)
+sym_func_params = {"r_nought": torch.linspace(0.5, 5.0, 8), "eta": torch.tensor(4.0), "rad_cut": torch.tensor(5.0)}
+at_nums = torch.tensor([[8, 1, 1, 0], [8, 1, 1, 1]])
+coords = torch.rand(2, 4, 3) * 2.0
+
+
+def model_energies_and_forces(model):
+    positions = coords.clone().requires_grad_(True)
+    features = get_sym_funcs(sym_func_params, at_nums, positions, model.elements)
+    energies = model(at_nums, features.reshape(at_nums.shape + (-1,)))
+    return energies.detach(), -torch.autograd.grad(energies.sum(), positions)[0]
+
+
+def test_TensorChemEnsemble():
+    models = [TensorChem([1, 8], [16, 8], 16, stacked=i % 2 == 0) for i in range(3)]
+    ensemble = TensorChemEnsemble.from_models(models)
+    features = get_sym_funcs(sym_func_params, at_nums, coords, ensemble.elements).reshape(2, 4, -1)
+    expected = torch.stack([model(at_nums, features) for model in models])
+    assert torch.allclose(ensemble(at_nums, features), expected, atol=1e-6)
+    assert torch.allclose(ensemble.member(1)(at_nums, features), expected[1], atol=1e-6)
+    with pytest.raises(ValueError):
+        TensorChemEnsemble.from_models(models + [TensorChem([1, 8], [16], 16)])
+
+
+def test_evaluate_committee():
+    models = [TensorChem([1, 8], [16, 8], 16) for _ in range(3)]
+    committee = evaluate_committee(TensorChemEnsemble.from_models(models), sym_func_params, at_nums, coords)
+    for i, model in enumerate(models):
+        energies, forces = model_energies_and_forces(model)
+        assert torch.allclose(committee["energies"][i], energies, atol=1e-6)
+        assert torch.allclose(committee["forces"][i], forces, atol=1e-6)
+    assert torch.allclose(committee["energy_std"], committee["energies"].std(0))
+    assert committee["force_mean"].shape == (2, 4, 3)
+    energy_only = evaluate_committee(TensorChemEnsemble.from_models(models), sym_func_params, at_nums, coords, False)
+    assert "forces" not in energy_only and torch.allclose(energy_only["energy_mean"], committee["energy_mean"])
+    with pytest.raises(ValueError):
+        evaluate_committee(TensorChemEnsemble.from_models(models[:1]), sym_func_params, at_nums, coords)
+
+
+def test_from_checkpoints(tmp_path, water_dataset, hyper_params):
+    filenames = []
+    for seed in range(2):
+        torch.manual_seed(seed)
+        filenames.append(str(tmp_path / f"model_{seed}.pt"))
+        TensorChemTrainer(water_dataset(), hyper_params).save_checkpoint(filenames[-1])
+    ensemble, params = TensorChemEnsemble.from_checkpoints(filenames)
+    assert ensemble.n_members == 2 and params["layers"] == hyper_params["layers"]
+    params = {key: torch.as_tensor(value) for key, value in params["sym_func_params"].items()}
+    committee = evaluate_committee(ensemble, params, at_nums, coords, forces=False)
+    assert torch.all(committee["energy_std"] > 0.0)
@@ -0,0 +1,48 @@
+import torch
+
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+from tensorchem.networks.export import TensorChemPipeline, script_pipeline, export_pipeline, load_pipeline
+from tensorchem.networks.tensormol import TensorChem
+
+torch.manual_seed(0)
+sym_func_params = {"r_nought": torch.linspace(0.5, 5.0, 8), "eta": 4.0, "rad_cut": 5.0}
+at_nums = torch.tensor([[8, 1, 1, 0], [8, 1, 1, 1]])
+coords = torch.rand(2, 4, 3) * 2.0
+
+
+def eager_energies_and_forces(model):
+    positions = coords.clone().requires_grad_(True)
+    features = get_sym_funcs(sym_func_params, at_nums, positions, model.elements)
+    energies = model(at_nums, features.reshape(at_nums.shape + (-1,)))
+    return energies.detach(), -torch.autograd.grad(energies.sum(), positions)[0]
+
+
+def test_TensorChemPipeline():
+    model = TensorChem([1, 8], [16], 16)
+    energies, forces = TensorChemPipeline(model, sym_func_params)(at_nums, coords)
+    expected_energies, expected_forces = eager_energies_and_forces(model)
+    assert torch.allclose(energies, expected_energies, atol=1e-5)
+    assert torch.allclose(forces, expected_forces, atol=1e-5)
+    assert torch.all(forces[0, 3] == 0.0)
+
+
+def test_script_pipeline():
+    for stacked in [False, True]:
+        model = TensorChem([1, 8], [16, 8], 16, stacked=stacked)
+        energies, forces = script_pipeline(model, sym_func_params)(at_nums, coords)
+        assert model.training and all(param.requires_grad for param in model.parameters())
+        expected_energies, expected_forces = eager_energies_and_forces(model)
+        assert torch.allclose(energies, expected_energies, atol=1e-5)
+        assert torch.allclose(forces, expected_forces, atol=1e-5)
+
+
+def test_export_pipeline(tmp_path):
+    model = TensorChem([1, 8], [16], 16)
+    expected_energies, expected_forces = eager_energies_and_forces(model)
+    export_pipeline(model, sym_func_params, str(tmp_path / "forces.pt"))
+    energies, forces = load_pipeline(str(tmp_path / "forces.pt"))(at_nums, coords)
+    assert torch.allclose(energies, expected_energies, atol=1e-5)
+    assert torch.allclose(forces, expected_forces, atol=1e-5)
+    export_pipeline(model, sym_func_params, str(tmp_path / "energy.pt"), compute_forces=False)
+    energies, forces = load_pipeline(str(tmp_path / "energy.pt"))(at_nums, coords)
+    assert torch.allclose(energies, expected_energies, atol=1e-5) and forces.numel() == 0
@@ -0,0 +1,60 @@
+import pytest
+import torch
+
+from tensorchem.featurizers.cache import FeatureCache, geometry_hash
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+
+params = {'r_nought': torch.linspace(0.5, 5.0, 8), 'eta': torch.tensor(4.0), 'rad_cut': 5.0}
+elements = torch.tensor([1, 8])
+at_nums = torch.tensor([8, 1, 1])
+coords = torch.tensor([[0.0, 0.0, 0.1177], [0.0, 0.7549, -0.4709], [0.0, -0.7549, -0.4709]])
+
+
+def test_geometry_hash():
+    key = geometry_hash(at_nums, coords, params, elements)
+    assert key == geometry_hash(at_nums, coords.clone(), dict(params), elements)
+    assert key != geometry_hash(at_nums, coords + 0.01, params, elements)
+    assert key != geometry_hash(at_nums, coords, dict(params, rad_cut=4.0), elements)
+    assert key != geometry_hash(at_nums, coords, params, elements, "sym_funcs/2")
+    assert geometry_hash(at_nums, coords, params, elements, "sym_funcs/1") != \
+        geometry_hash(at_nums, coords, params, elements, "sym_funcs/2")
+
+
+def test_cached_sym_funcs():
+    cache = FeatureCache()
+    features = get_sym_funcs(params, at_nums, coords, elements, cache=cache)
+    cached = get_sym_funcs(params, at_nums, coords, elements, cache=cache)
+    assert cache.hits == 1 and cache.misses == 1
+    assert torch.equal(features, cached)
+    cached.zero_()
+    assert torch.equal(get_sym_funcs(params, at_nums, coords, elements, cache=cache), features)
+
+
+def test_lru_eviction_FeatureCache():
+    cache = FeatureCache(max_bytes=2 * 4 * 10)
+    for i in range(3):
+        cache.put(str(i), torch.zeros(10))
+    assert len(cache) == 2
+    assert cache.get("0") is None
+    assert cache.get("1") is not None
+    cache.put("3", torch.zeros(10))
+    assert "1" in cache and "2" not in cache
+
+
+def test_copies_FeatureCache():
+    cache = FeatureCache()
+    computed = cache.get_or_compute("0", lambda: torch.zeros(10))
+    computed += 1.0
+    hit = cache.get_or_compute("0", lambda: torch.ones(10))
+    assert torch.equal(hit, torch.zeros(10))
+    hit += 1.0
+    assert torch.equal(cache.get("0"), torch.zeros(10))
+
+
+def test_mmap_FeatureCache(tmp_path):
+    cache = FeatureCache(cache_dir=str(tmp_path))
+    features = get_sym_funcs(params, at_nums, coords, elements, cache=cache)
+    reloaded = FeatureCache(cache_dir=str(tmp_path))
+    assert len(reloaded) == 1
+    assert torch.allclose(get_sym_funcs(params, at_nums, coords, elements, cache=reloaded), features)
+    assert reloaded.hits == 1
@@ -0,0 +1,54 @@
+import pytest
+import torch
+
+from tensorchem.featurizers.neighbors import *
+from tensorchem.featurizers.neighbors import _image_pairs
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs, get_sym_funcs_pbc
+
+torch.manual_seed(0)
+params = {'r_nought': torch.linspace(0.5, 4.0, 8), 'eta': torch.tensor(4.0), 'rad_cut': 4.0}
+elements = torch.tensor([1, 6, 8])
+
+
+def pair_set(coords, idx_i, idx_j, shifts):
+    dist = torch.norm(pair_vectors(coords, idx_i, idx_j, shifts), dim=-1)
+    return sorted(zip(idx_i.tolist(), idx_j.tolist(), [round(d, 4) for d in dist.tolist()]))
+
+
+def test_neighbor_list_isolated():
+    coords = torch.rand(200, 3, dtype=torch.float64) * 15.0
+    idx_i, idx_j, shifts = neighbor_list(coords, 4.0)
+    dist = torch.cdist(coords, coords)
+    dense_i, dense_j = torch.nonzero((dist < 4.0) & ~torch.eye(200, dtype=torch.bool), as_tuple=True)
+    assert pair_set(coords, idx_i, idx_j, shifts) == pair_set(coords, dense_i, dense_j, None)
+
+
+def test_neighbor_list_periodic():
+    cell = torch.tensor([[14.0, 0.0, 0.0], [2.0, 13.0, 0.0], [1.0, -1.5, 15.0]], dtype=torch.float64)
+    coords = torch.rand(150, 3, dtype=torch.float64) @ cell + 3.0
+    cell_list = pair_set(coords, *neighbor_list(coords, 4.0, cell))
+    assert cell_list == pair_set(coords, *_image_pairs(coords, 4.0, cell))
+
+
+def test_neighbor_list_small_cell():
+    cell = torch.eye(3, dtype=torch.float64) * 2.0
+    coords = torch.zeros(1, 3, dtype=torch.float64)
+    idx_i, idx_j, shifts = neighbor_list(coords, 2.5, cell)
+    # 6 images at 2.0 and 12 images at 2.83 Angstrom, only the first shell is inside the cutoff
+    assert idx_i.shape[0] == 6
+
+
+def test_dist_matrix_pbc():
+    cell = torch.eye(3) * 10.0
+    coords = torch.tensor([[0.5, 0.5, 0.5], [9.5, 0.5, 0.5]])
+    assert torch.allclose(dist_matrix_pbc(coords, cell)[0, 1], torch.tensor(1.0))
+
+
+def test_get_sym_funcs_pbc():
+    at_nums = torch.tensor([8, 1, 1, 6, 1, 1, 1, 1])
+    coords = torch.rand(8, 3) * 5.0
+    dense = get_sym_funcs(params, at_nums, coords, elements)
+    assert torch.allclose(get_sym_funcs_pbc(params, at_nums, coords, elements), dense, atol=1e-6)
+    # In a cell much larger than the cutoff nothing interacts with its images
+    cell = torch.eye(3) * 20.0
+    assert torch.allclose(get_sym_funcs(params, at_nums, coords + 2.0, elements, cell=cell), dense, atol=1e-5)
@@ -0,0 +1,24 @@
+import pytest
+import torch
+
+from tensorchem.featurizers.symmetry_functions import get_sym_funcs
+
+params = {'r_nought': torch.linspace(0.5, 5.0, 8), 'eta': torch.tensor(4.0), 'rad_cut': 5.0}
+elements = torch.tensor([1, 8])
+at_nums = torch.tensor([8, 1, 1])
+coords = torch.tensor([[0.0, 0.0, 0.1177], [0.0, 0.7549, -0.4709], [0.0, -0.7549, -0.4709]], dtype=torch.float64)
+
+
+def test_shape_sym_funcs():
+    features = get_sym_funcs(params, at_nums, coords, elements)
+    assert features.shape == (3, 2, 8)
+    # Oxygen only has hydrogen neighbors
+    assert torch.all(features[0, 1] == 0.0)
+
+
+def test_precision_sym_funcs():
+    reference = get_sym_funcs(params, at_nums, coords, elements, precision="float64")
+    for precision in ["float16", "bfloat16"]:
+        features = get_sym_funcs(params, at_nums, coords, elements, precision=precision)
+        assert features.dtype == getattr(torch, precision)
+        assert torch.allclose(features.double(), reference, atol=0.05, rtol=0.02)
@@ -16,3 +16,26 @@ def test_cos_angle():
     assert torch.allclose(angles, torch.tensor([0.00000, 0.61548, 0.61548, 0.95532, 0.00000, 2.18628],
                                                dtype=torch.float32))
 
+
+def test_element_index():
+    elem_idx = element_index(torch.tensor([[8, 1, 6, 0]]), torch.tensor([1, 8, 6]))
+    assert elem_idx.tolist() == [[1, 0, 2, -1]]
+
+
+def test_scatter_element_channels():
+    at_nums = torch.tensor([[8, 1, 1, 0], [6, 1, 8, 1]])
+    elements = torch.tensor([1, 6, 8])
+    pair_embed = torch.rand(2, 4, 4, 5)
+    channels = scatter_element_channels(pair_embed, element_index(at_nums, elements), 3)
+    real = torch.ne(at_nums, 0)
+    one_hot = torch.eq(at_nums.unsqueeze(-1), elements) & real.unsqueeze(-1)
+    pair_mask = (real.unsqueeze(-1) & real.unsqueeze(-2) & ~torch.eye(4, dtype=torch.bool)).float()
+    expected = torch.einsum('bij,bijf,bje->bief', pair_mask, pair_embed, one_hot.float())
+    assert channels.shape == (2, 4, 3, 5)
+    assert torch.allclose(channels, expected)
+
+
+def test_precision_policy():
+    assert precision_policy("bfloat16") == (torch.float32, torch.bfloat16)
+    with pytest.raises(ValueError):
+        precision_policy("int8")
@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+from tensorchem.molecules import Geometry
+from tensorchem.molecules.filters import bond_matrix, plausibility_mask
+from tensorchem.molecules.sampling import sample_plausible_normal_modes
+
+atoms = torch.tensor([6, 1, 1, 1, 1], dtype=torch.uint8)
+methane = torch.tensor([[0.0, 0.0, 0.0], [0.63, 0.63, 0.63], [-0.63, -0.63, 0.63], [-0.63, 0.63, -0.63],
+                        [0.63, -0.63, -0.63]])
+
+
+def test_bond_matrix():
+    bonds = bond_matrix(atoms, methane)
+    assert bonds[0, 1:].all() and bonds[1:, 0].all()
+    assert not bonds[1:, 1:].any()
+
+
+def test_plausibility_mask():
+    collapsed, stretched = methane.clone(), methane.clone()
+    collapsed[2] = collapsed[1] + 0.1
+    stretched[1] *= 2.5
+    keep, report = plausibility_mask(atoms, torch.stack([methane, collapsed, stretched]), reference=methane,
+                                     chunk_size=2)
+    assert keep.tolist() == [True, False, False]
+    assert report["n_too_close"] == 1 and report["n_accepted"] == 1 and abs(report["rejection_rate"] - 2 / 3) < 1e-6
+    # Bonds are formed in the collapsed sample as well
+    assert report["n_topology_changed"] == 2
+    keep, report = plausibility_mask(atoms, torch.stack([methane, collapsed, stretched]))
+    assert keep.tolist() == [True, False, True] and report["n_topology_changed"] == 0
+
+
+def test_sample_plausible_normal_modes():
+    modes = torch.linalg.qr(torch.randn(15, 9, generator=torch.Generator().manual_seed(0)))[0]
+    conformer = Geometry(atoms, methane, {'normal modes': modes.t().reshape(-1, 5, 3),
+                                          'force constants': torch.full((9,), 0.5)})
+    trajectory, report = sample_plausible_normal_modes(conformer, 200, 3000.0,
+                                                       generator=torch.Generator().manual_seed(0))
+    assert len(trajectory.geometries) == 200 and report["n_accepted"] >= 200
+    assert report["n_samples"] > 200 and report["rejection_rate"] > 0.0
+    coords = torch.stack([geom.xyz for geom in trajectory.geometries])
+    assert plausibility_mask(atoms, coords, reference=methane)[0].all()
+
+
+def test_sample_plausible_normal_modes_rejected():
+    modes = torch.linalg.qr(torch.randn(15, 9, generator=torch.Generator().manual_seed(0)))[0]
+    conformer = Geometry(atoms, methane, {'normal modes': modes.t().reshape(-1, 5, 3),
+                                          'force constants': torch.full((9,), 0.5)})
+    # No sample is plausible when every atom pair must be 10x its covalent distance apart
+    with pytest.warns(UserWarning, match="kept 0 of 50"):
+        trajectory, report = sample_plausible_normal_modes(conformer, 50, 300.0, max_draw=40, min_scale=10.0,
+                                                           generator=torch.Generator().manual_seed(0))
+    assert len(trajectory.geometries) == 0 and report["n_samples"] == 40 and report["n_accepted"] == 0
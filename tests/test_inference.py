@@ -0,0 +1,50 @@
+import pytest
+import torch
+
+from tensorchem.molecules import Geometry
+from tensorchem.networks.inference import InferenceEngine
+from tensorchem.networks.tensormol import TensorChem, TensorChemTrainer
+
+torch.manual_seed(0)
+sym_func_params = {"r_nought": torch.linspace(0.5, 5.0, 8).tolist(), "eta": 4.0, "rad_cut": 5.0}
+water = torch.tensor([[0.0, 0.0, 0.1177], [0.0, 0.7549, -0.4709], [0.0, -0.7549, -0.4709]])
+geometries = [Geometry(torch.tensor([8, 1, 1], dtype=torch.uint8), water + 0.05 * torch.randn(3, 3))
+              for _ in range(5)]
+geometries.append(Geometry(torch.tensor([8, 1, 1, 8, 1, 1], dtype=torch.uint8),
+                           torch.cat([water, water + torch.tensor([2.8, 0.0, 0.0])])))
+
+
+def test_batches_InferenceEngine():
+    model = TensorChem([1, 8], [8], 16)
+    engine = InferenceEngine(model, sym_func_params, batch_size=2)
+    assert model.training and all(param.requires_grad for param in model.parameters())
+    batches = engine.batches(geometries)
+    assert sorted(i for batch in batches for i in batch) == list(range(6))
+    assert all(len(batch) <= 2 for batch in batches) and batches[-1][-1] == 5
+    engine.max_batch_atoms = 9
+    assert engine.batches(geometries)[-1] == [5]
+
+
+def test_evaluate_InferenceEngine(tmp_path, water_dataset, hyper_params):
+    trainer = TensorChemTrainer(water_dataset(), dict(hyper_params, checkpoint_path=str(tmp_path / "model.pt")))
+    trainer.fit(1)
+    engine = InferenceEngine.from_checkpoint(str(tmp_path / "model.pt"), batch_size=4)
+    energies, forces = engine.evaluate(geometries)
+    for geom, energy, force in zip(geometries, energies, forces):
+        at_nums, coords = geom.atoms.long().unsqueeze(0), geom.xyz.unsqueeze(0).requires_grad_(True)
+        expected = trainer.model(at_nums, trainer.featurize(at_nums, coords))
+        grad = torch.autograd.grad(expected.sum(), coords)[0]
+        assert torch.allclose(energy, expected.detach()[0], atol=1e-5)
+        assert torch.allclose(force, -grad[0], atol=1e-5)
+    energies_only, no_forces = engine.evaluate(geometries, forces=False)
+    assert no_forces is None and torch.allclose(energies_only, energies)
+    assert set(engine.report().keys()) == {2, 4}
+
+
+def test_submit_InferenceEngine():
+    engine = InferenceEngine(TensorChem([1, 8], [8], 16), sym_func_params, n_threads=2)
+    futures = [engine.submit(geometries[:i + 1]) for i in range(4)]
+    results = [future.result() for future in futures]
+    assert [len(energies) for energies, _ in results] == [1, 2, 3, 4]
+    assert torch.allclose(results[0][0], results[3][0][:1])
+    engine.close()
@@ -0,0 +1,59 @@
+import pytest
+import torch
+
+from tensorchem.molecules import Geometry, Molecule, OptTrajectory
+from tensorchem.molecules.optimization import BatchOptimizer, FIRE, LBFGS, optimize_geometries
+from tensorchem.networks.export import TensorChemPipeline
+from tensorchem.networks.tensormol import TensorChem
+
+at_nums = torch.tensor([[8, 1, 1, 0], [6, 1, 1, 1], [1, 1, 0, 0]])
+coords = torch.randn(3, 4, 3, generator=torch.Generator().manual_seed(0))
+
+
+def springs(at_nums, coords):
+    """
+    Harmonic springs of rest length 1 between every pair of atoms, with the minimum at unit pair distances
+    """
+    mask = torch.ne(at_nums, 0)
+    with torch.enable_grad():
+        coords = coords.detach().requires_grad_(True)
+        dist = torch.norm(coords.unsqueeze(-2) - coords.unsqueeze(-3) + torch.eye(coords.shape[1]).unsqueeze(-1),
+                          dim=-1)
+        pairs = (mask.unsqueeze(-1) & mask.unsqueeze(-2)).float().triu(1)
+        energies = (0.1 * torch.square(dist - 1.0) * pairs).sum((-1, -2))
+        forces = -torch.autograd.grad(energies.sum(), coords)[0]
+    return energies.detach(), forces
+
+
+@pytest.mark.parametrize("optimizer", [FIRE, LBFGS])
+def test_BatchOptimizer(optimizer):
+    opt = optimizer(springs, at_nums, coords, fmax=1e-4)
+    start_energies = opt.energies.clone()
+    trajectories = opt.run(1000, record_every=5)
+    assert bool(opt.converged.all()) and torch.all(opt.energies < start_energies)
+    assert torch.all(opt.max_forces() < 1e-4)
+    # The two atoms of H2 relax to the rest length of the spring, and padding never moves
+    assert abs(torch.norm(opt.coords[2, 0] - opt.coords[2, 1]).item() - 1.0) < 1e-3
+    assert torch.equal(opt.coords[:, 3][0], coords[0, 3].double())
+    assert all(isinstance(trajectory, OptTrajectory) and trajectory.opt_algo == optimizer.algorithm
+               for trajectory in trajectories)
+    assert torch.allclose(trajectories[1].geometries[-1].xyz, opt.coords[1].float())
+    assert trajectories[2].geometries[-1].labels["max force"] < 1e-4
+
+
+def test_abstract_BatchOptimizer():
+    with pytest.raises(TypeError):
+        BatchOptimizer(springs, at_nums, coords)
+
+
+def test_optimize_geometries(tmp_path):
+    model = TensorChem([1, 6, 8], [8], 24)
+    pipeline = TensorChemPipeline(model, {"r_nought": torch.linspace(0.5, 5.0, 8).tolist(), "eta": 4.0,
+                                          "rad_cut": 5.0})
+    geometries = [Geometry(at_nums[i, :n].to(torch.uint8), coords[i, :n]) for i, n in enumerate([3, 4, 2])]
+    trajectories, converged = optimize_geometries(pipeline, geometries, "fire", max_steps=3)
+    assert converged.shape == (3,) and [len(t.geometries) for t in trajectories] == [4, 4, 4]
+    molecule = Molecule(geometries[0].atoms, 0, trajectories=[trajectories[0]])
+    molecule.save("opt.mset", str(tmp_path))
+    molecule.load("opt.mset", str(tmp_path))
+    assert isinstance(molecule.trajectories[0], OptTrajectory) and molecule.trajectories[0].opt_algo == "fire"
@@ -0,0 +1,40 @@
+import torch
+
+from tensorchem.molecules import Geometry, Molecule, Trajectory
+from tensorchem.util.qchem import DEFAULT_REM, render_input, render_jobs, write_input, write_inputs, \
+    write_molecule_inputs, write_trajectory_inputs
+
+water = torch.tensor([8, 1, 1], dtype=torch.uint8)
+base = torch.tensor([[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]])
+geometries = [Geometry(water, base + 0.01 * i) for i in range(5)]
+
+
+def test_render_input(tmp_path):
+    text = render_input(geometries[0], charge=-1, multiplicity=2)
+    assert text.startswith("$molecule\n-1 2\nO ") and text.endswith("$end\n")
+    assert "   method   wb97x-d" in text and text.count("$end") == 2
+    custom = render_input(geometries[0], template="$$comment\n$name $tag\n$$end\n\n$molecule\n$rem", name="w0",
+                          tag="sp")
+    assert custom.startswith("$comment\nw0 sp\n$end\n") and custom.endswith(render_input(geometries[0]))
+    write_input(geometries[0], str(tmp_path / "water.in"))
+    assert (tmp_path / "water.in").read_text() == render_input(geometries[0])
+
+
+def test_render_jobs():
+    text = render_jobs(geometries[:3], read_guess=True)
+    jobs = text.split("\n@@@\n\n")
+    assert len(jobs) == 3 and jobs[0] == render_input(geometries[0])
+    assert "scf_guess" not in jobs[0] and all("scf_guess  read" in job for job in jobs[1:])
+    assert jobs[2] == render_input(geometries[2], dict(DEFAULT_REM, scf_guess="read"))
+
+
+def test_write_inputs(tmp_path):
+    filenames = write_inputs(geometries, str(tmp_path), "water", jobs_per_file=2)
+    assert [name.split("/")[-1] for name in filenames] == ["water_0.in", "water_2.in", "water_4.in"]
+    assert [open(name).read().count("$molecule") for name in filenames] == [2, 2, 1]
+    trajectory = Trajectory()
+    trajectory.geometries = geometries
+    assert len(write_trajectory_inputs(trajectory, str(tmp_path / "traj"), "frame")) == 5
+    molecule = Molecule(water, charge=1, trajectories=[trajectory], filename="water.mset")
+    filenames = write_molecule_inputs(molecule, str(tmp_path / "mol"), jobs_per_file=10)
+    assert filenames[0].endswith("water_0.in") and open(filenames[0]).read().count("1 1\n") == 5
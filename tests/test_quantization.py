@@ -0,0 +1,50 @@
+import pytest
+import torch
+
+from tensorchem.molecules import Geometry
+from tensorchem.networks.inference import InferenceEngine
+from tensorchem.networks.quantization import quantize_model, calibration_batches, dequantize_model, \
+    quantization_report
+from tensorchem.networks.tensormol import TensorChem
+
+torch.manual_seed(0)
+sym_func_params = {"r_nought": torch.linspace(0.5, 5.0, 8), "eta": 4.0, "rad_cut": 5.0}
+water = torch.tensor([[0.0, 0.0, 0.1177], [0.0, 0.7549, -0.4709], [0.0, -0.7549, -0.4709]])
+geometries = [Geometry(torch.tensor([8, 1, 1], dtype=torch.uint8), water + 0.05 * torch.randn(3, 3))
+              for _ in range(16)]
+
+
+def test_quantize_model():
+    model = TensorChem([1, 8], [32, 16], 16, stacked=True)
+    model.set_atomic_energies(torch.tensor([-0.5, -75.0]))
+    engine = InferenceEngine(model, sym_func_params, batch_size=8)
+    at_nums, features = next(calibration_batches(engine, geometries))
+    expected = model(at_nums, features).detach()
+    for mode in ["dynamic", "static"]:
+        quantized = quantize_model(model, mode, calibration_batches(engine, geometries))
+        assert not quantized.stacked
+        assert torch.allclose(quantized(at_nums, features), expected, atol=1e-2)
+    with pytest.raises(ValueError):
+        quantize_model(model, "static")
+    with pytest.raises(ValueError):
+        quantize_model(model, "float16")
+
+
+def test_dequantize_model():
+    model = TensorChem([1, 8], [32], 16)
+    quantized = quantize_model(model)
+    dequantized = dequantize_model(quantized, model)
+    weight = dequantized.subnets[0].layers[0].weight
+    assert torch.equal(weight, quantized.subnets[0].layers[0].weight().dequantize())
+    assert not torch.equal(weight, model.subnets[0].layers[0].weight)
+    assert torch.equal(dequantized.subnets[0].output.weight, model.subnets[0].output.weight)
+
+
+def test_quantization_report():
+    model = TensorChem([1, 8], [32], 16)
+    energies = InferenceEngine(model, sym_func_params).evaluate(geometries, forces=False)[0]
+    report = quantization_report(model, quantize_model(model), sym_func_params, geometries, energies, n_repeats=1)
+    assert report["float32_energy_mae"] < 1e-6
+    assert model.training and all(param.requires_grad for param in model.parameters())
+    assert report["energy_mae"] < 1e-2 and report["force_mae"] < 1e-2
+    assert report["int8_geometries_per_sec"] > 0.0 and report["network_speedup"] > 0.0
@@ -0,0 +1,60 @@
+import json
+import os
+
+import torch
+
+from tensorchem.molecules import Geometry, Molecule, NMSTrajectory, Trajectory
+from tensorchem.molecules.sampling import sample_normal_modes, sample_msets, KB
+
+n_atoms = 5
+modes = torch.linalg.qr(torch.randn(3 * n_atoms, 3 * n_atoms - 6, generator=torch.Generator().manual_seed(0)))[0]
+conformer = Geometry(torch.tensor([6, 1, 1, 1, 1], dtype=torch.uint8), torch.randn(n_atoms, 3),
+                     {'normal modes': modes.t().reshape(-1, n_atoms, 3),
+                      'force constants': torch.linspace(0.5, 8.0, 9)})
+
+
+def test_sample_normal_modes():
+    trajectory = sample_normal_modes(conformer, 1000, 300.0, generator=torch.Generator().manual_seed(0))
+    assert isinstance(trajectory, NMSTrajectory) and trajectory.nms_temp == 300.0
+    assert len(trajectory.geometries) == 1000
+    coords = torch.stack([geom.xyz for geom in trajectory.geometries])
+    mode_displacements = (coords - conformer.xyz).reshape(1000, -1).double() @ modes.double()
+    # The harmonic energy of each sample is a random fraction of 3/2 Na kB T
+    energies = 0.5 * (conformer.labels['force constants'].double() * mode_displacements ** 2).sum(-1)
+    assert torch.all(energies <= 1.5 * n_atoms * KB * 300.0 * (1.0 + 1e-4))
+    assert abs(energies.mean().item() / (0.75 * n_atoms * KB * 300.0) - 1.0) < 0.1
+
+
+def test_sample_normal_modes_generator():
+    first = sample_normal_modes(conformer, 10, 300.0, generator=torch.Generator().manual_seed(1))
+    second = sample_normal_modes(conformer, 10, 300.0, generator=torch.Generator().manual_seed(1))
+    assert all(torch.equal(a.xyz, b.xyz) for a, b in zip(first.geometries, second.geometries))
+    hot = sample_normal_modes(conformer, 10, 1200.0, generator=torch.Generator().manual_seed(1))
+    assert torch.allclose(hot.geometries[0].xyz - conformer.xyz, 2.0 * (first.geometries[0].xyz - conformer.xyz),
+                          atol=1e-5)
+
+
+def write_msets(path, n_msets):
+    filenames = []
+    for i in range(n_msets):
+        trajectory = Trajectory()
+        trajectory.geometries = [conformer, Geometry(conformer.atoms, conformer.xyz + 0.1, dict(conformer.labels))]
+        molecule = Molecule(conformer.atoms, 0, trajectories=[trajectory])
+        molecule.save(f"mol{i}.mset", str(path))
+        filenames.append(os.path.join(str(path), f"mol{i}.mset"))
+    return filenames
+
+
+def test_sample_msets(tmp_path):
+    filenames = write_msets(tmp_path, 3)
+    serial = list(sample_msets(filenames, str(tmp_path / "serial"), 4, 300.0, seed=5, n_workers=1))
+    parallel = list(sample_msets(filenames[::-1], str(tmp_path / "parallel"), 4, 300.0, seed=5, n_workers=2))
+    assert sorted(serial) == sorted(parallel) == [(f"mol{i}.mset", 2, 8, 0) for i in range(3)]
+    for i in range(3):
+        with open(tmp_path / "serial" / f"mol{i}.mset") as f, open(tmp_path / "parallel" / f"mol{i}.mset") as g:
+            assert json.load(f)["trajectories"] == json.load(g)["trajectories"]
+    molecule = Molecule()
+    molecule.load("mol0.mset", str(tmp_path / "serial"))
+    assert [type(traj) for traj in molecule.trajectories] == [Trajectory, NMSTrajectory, NMSTrajectory]
+    assert molecule.trajectories[1].nms_temp == 300.0 and len(molecule) == 10
+    assert torch.equal(molecule.trajectories[2].conformer.xyz, molecule.trajectories[0].geometries[1].xyz)
@@ -0,0 +1,53 @@
+import torch
+
+from tensorchem.molecules import Geometry, Trajectory
+from tensorchem.molecules.selection import aligned_rmsd, pairwise_aligned_rmsd, deduplicate, subsample, \
+    farthest_point_indices, energy_stratified_indices
+from tensorchem.molecules.transformations import random_rotations, apply_transformation, align, rmsd
+
+generator = torch.Generator().manual_seed(0)
+base = torch.randn(4, 6, 3, generator=generator) * 2.0
+# Five rotated and translated copies with small noise around each of four distinct geometries
+frames = base.repeat_interleave(5, 0) + 0.01 * torch.randn(20, 6, 3, generator=generator)
+frames = apply_transformation(frames, random_rotations(20, generator), torch.randn(20, 3, generator=generator))
+
+
+def test_aligned_rmsd():
+    expected = rmsd(align(frames, base[0].expand_as(frames))[0], base[0].expand_as(frames))
+    assert torch.allclose(aligned_rmsd(frames, base[0]), expected, atol=1e-4)
+    pairwise = pairwise_aligned_rmsd(frames, chunk_size=7)
+    assert pairwise.shape == (20, 20) and torch.allclose(pairwise, pairwise.t(), atol=1e-5)
+    assert torch.allclose(pairwise[:, 0], aligned_rmsd(frames, frames[0]), atol=1e-5)
+    assert torch.allclose(torch.diagonal(pairwise), torch.zeros(20), atol=1e-3)
+
+
+def test_deduplicate():
+    for mode in ["leader", "cluster"]:
+        for chunk_size in [3, 1024]:
+            keep = deduplicate(frames, 0.2, mode, chunk_size)
+            assert len(keep) == 4 and sorted(i // 5 for i in keep) == [0, 1, 2, 3]
+    assert deduplicate(frames, 0.2, "leader", 3) == [0, 5, 10, 15]
+    assert deduplicate(frames, 0.0) == list(range(20))
+
+
+def test_deduplicate_Trajectory():
+    trajectory = Trajectory()
+    trajectory.geometries = [Geometry(torch.tensor([6, 1, 1, 1, 1, 8], dtype=torch.uint8), xyz) for xyz in frames]
+    deduplicated = trajectory.deduplicate(0.2)
+    assert len(deduplicated.geometries) == 4 and len(trajectory.geometries) == 20
+    assert deduplicated.geometries[1] is trajectory.geometries[5]
+
+
+def test_subsample():
+    assert subsample(frames, "stride", stride=3) == list(range(0, 20, 3))
+    # One frame from each group of near duplicates covers the four geometries
+    keep = subsample(frames, "farthest_point", n_select=4)
+    assert len(keep) == 4 and sorted(i // 5 for i in keep) == [0, 1, 2, 3]
+    assert farthest_point_indices(torch.tensor([[0.0], [1.0], [10.0], [4.0]]), 3) == [0, 2, 3]
+    assert farthest_point_indices(torch.ones(5, 3), 3) == [0, 1, 2]
+    assert farthest_point_indices(torch.tensor([[0.0], [0.0], [5.0], [5.0]]), 4) == [0, 1, 2, 3]
+    energies = torch.cat([torch.zeros(16), torch.tensor([5.0, 9.0, 9.5, 10.0])])
+    keep = subsample(frames, "energy", fraction=0.2, energies=energies, n_bins=4, generator=torch.Generator())
+    # Three of the four bins have frames, and the bin of the 16 low energies gets the remaining quota
+    assert len(keep) == 4 and 16 in keep and len([i for i in keep if i < 16]) == 2
+    assert len(energy_stratified_indices(torch.zeros(20), 7)) == 7
@@ -0,0 +1,195 @@
+import os
+import math
+import socket
+
+import pytest
+import torch
+
+from tensorchem.dataset.dataset import pad_collate
+
+from tensorchem.networks.tensormol import TensorChem, TensorChemTrainer, SubNet, StackedSubNet, group_by_element
+
+torch.manual_seed(0)
+elements = [1, 6, 8]
+at_nums = torch.tensor([[8, 1, 1, 0], [6, 1, 8, 1]])
+features = torch.rand(2, 4, 12)
+
+
+def test_SubNet():
+    subnet = SubNet(1, 12, [16, 8])
+    assert subnet(torch.rand(5, 12)).shape == (5,)
+    assert len(list(subnet.parameters())) == 6
+
+
+def test_forward_TensorChem():
+    model = TensorChem(elements, [16, 8], 12)
+    energies = model(at_nums, features)
+    expected = torch.zeros(2)
+    for b in range(2):
+        for i in range(4):
+            if at_nums[b, i] != 0:
+                subnet = model.subnets[elements.index(at_nums[b, i].item())]
+                expected[b] += subnet(features[b, i].unsqueeze(0))[0]
+    assert torch.allclose(energies, expected, atol=1e-6)
+
+
+def test_flat_forward_TensorChem():
+    model = TensorChem(elements, [16, 8], 12)
+    real = at_nums != 0
+    mol_idx = torch.arange(2).unsqueeze(-1).expand(2, 4)[real]
+    assert torch.allclose(model(at_nums[real], features[real], mol_idx), model(at_nums, features), atol=1e-6)
+
+
+def test_gradients_TensorChem():
+    model = TensorChem(elements, [16, 8], 12)
+    inputs = features.clone().requires_grad_(True)
+    model(at_nums[:1], inputs[:1]).sum().backward()
+    # Carbon is missing from the batch but its subnet is still in the graph
+    assert all(param.grad is not None for param in model.parameters())
+    assert torch.all(inputs.grad[0, 3] == 0.0)
+
+
+def test_stacked_TensorChem():
+    model = TensorChem(elements, [16, 8], 12)
+    stacked = model.to_stacked()
+    assert stacked.stacked and isinstance(stacked.subnets, StackedSubNet)
+    assert torch.allclose(stacked(at_nums, features), model(at_nums, features), atol=1e-6)
+    grouped = stacked.to_grouped()
+    assert torch.allclose(grouped(at_nums, features), model(at_nums, features), atol=1e-6)
+    assert [subnet.atomic_num for subnet in grouped.subnets] == [subnet.atomic_num for subnet in model.subnets]
+    # Converting to the same layout still returns a copy, never the model itself
+    assert stacked.to_stacked() is not stacked and model.to_grouped() is not model
+
+
+def test_group_by_element():
+    table, valid = group_by_element(torch.tensor([1, -1, 0, 1, 1]), 3)
+    assert table.tolist() == [[2, 5, 5], [0, 3, 4], [5, 5, 5]]
+    assert valid.sum() == 4
+
+
+def test_fit_TensorChemTrainer(tmp_path, water_dataset, hyper_params):
+    trainer = TensorChemTrainer(water_dataset(), dict(hyper_params, checkpoint_path=str(tmp_path / "model.pt")))
+    history = trainer.fit(2)
+    assert len(history) == 2 and history[-1]["valid"] is not None
+    assert history[-1]["train"]["atoms"] == 18
+    assert (tmp_path / "model.pt").exists()
+    trainer.load_checkpoint(str(tmp_path / "model.pt"))
+    assert trainer.epoch == 2
+
+
+def test_forces_TensorChemTrainer(water_dataset, hyper_params):
+    trainer = TensorChemTrainer(water_dataset(), dict(hyper_params, forces_key="forces"))
+    stats = trainer.run_epoch(trainer.train_loader, train=True)
+    assert math.isfinite(stats["loss"]) and stats["backward"] > 0.0
+    assert all(torch.isfinite(param).all() for param in trainer.model.parameters())
+
+
+def test_random_rotations_TensorChemTrainer(water_dataset, hyper_params):
+    trainer = TensorChemTrainer(water_dataset(), dict(hyper_params, forces_key="forces", random_rotations=True))
+    batch = next(iter(trainer.train_loader))
+    rotated = trainer.augment(batch)
+    assert not torch.allclose(rotated["coordinates"], batch["coordinates"])
+    assert torch.allclose(rotated["forces"].norm(dim=-1), batch["forces"].norm(dim=-1), atol=1e-5)
+    stats = trainer.run_epoch(trainer.train_loader, train=True)
+    assert math.isfinite(stats["loss"])
+
+
+def test_checkpointing_TensorChemTrainer(water_dataset, hyper_params):
+    grads = []
+    for checkpointing in [False, True]:
+        torch.manual_seed(0)
+        trainer = TensorChemTrainer(water_dataset(), dict(hyper_params, forces_key="forces",
+                                                          checkpoint_featurizer=checkpointing,
+                                                          checkpoint_chunk_size=3, checkpoint_subnets=checkpointing))
+        trainer.optimizer = torch.optim.SGD(trainer.model.parameters(), lr=0.0)
+        loss, _ = trainer.step(pad_collate([trainer.dataset[i] for i in range(4)]), train=True)
+        grads.append((loss, [param.grad.clone() for param in trainer.model.parameters()]))
+    assert grads[0][0] == pytest.approx(grads[1][0], rel=1e-5)
+    assert all(torch.allclose(g0, g1, atol=1e-5) for g0, g1 in zip(grads[0][1], grads[1][1]))
+
+
+def test_memory_budget_TensorChemTrainer(water_dataset, hyper_params):
+    trainer = TensorChemTrainer(water_dataset(), dict(hyper_params, memory_budget_mb=1.0, bytes_per_atom=2 ** 17,
+                                                      bytes_per_pair=0))
+    assert trainer.memory_coefficients() == (2 ** 17, 0)
+    assert [len(batch) for batch in trainer.train_loader.batch_sampler] == [2, 2, 2]
+    history = trainer.fit(1)
+    assert history[-1]["train"]["samples"] == 6
+
+
+def test_feature_cache_TensorChemTrainer(water_dataset, hyper_params):
+    dataset = water_dataset()
+    torch.manual_seed(0)
+    reference = TensorChemTrainer(dataset, hyper_params)
+    reference.fit(2)
+    torch.manual_seed(0)
+    cached = TensorChemTrainer(dataset, dict(hyper_params, feature_cache_mb=1.0))
+    cached.fit(2)
+    assert cached.feature_cache.misses == len(dataset) and cached.feature_cache.hits == len(dataset)
+    assert all(torch.allclose(p0, p1) for p0, p1 in zip(reference.model.parameters(), cached.model.parameters()))
+    assert TensorChemTrainer(dataset, dict(hyper_params, feature_cache_mb=1.0, random_rotations=True)).feature_cache \
+        is None
+
+
+def test_save_checkpoint_TensorChemTrainer(tmp_path, water_dataset, hyper_params):
+    trainer = TensorChemTrainer(water_dataset(), hyper_params)
+    trainer.save_checkpoint(str(tmp_path / "model.pt"), best=True)
+    assert sorted(os.listdir(tmp_path)) == ["model.pt", "model.pt.best"]
+    with pytest.raises(ValueError):
+        TensorChemTrainer(water_dataset(), dict(hyper_params, checkpoint_every=1))
+
+
+def test_resume_TensorChemTrainer(tmp_path, water_dataset, hyper_params):
+    params = dict(hyper_params, checkpoint_path=str(tmp_path / "model.pt"), checkpoint_every=1, lr_decay=0.5,
+                  validation_split=0.0)
+    dataset = water_dataset()
+    torch.manual_seed(0)
+    reference = TensorChemTrainer(dataset, params)
+    reference.fit(2)
+    torch.manual_seed(0)
+    interrupted = TensorChemTrainer(dataset, params)
+    step, n_steps = interrupted.step, []
+
+    def preempted_step(batch, train=True):
+        if len(n_steps) == 3:
+            raise KeyboardInterrupt
+        n_steps.append(1)
+        return step(batch, train)
+    interrupted.step = preempted_step
+    with pytest.raises(KeyboardInterrupt):
+        interrupted.fit(2)
+    assert interrupted.checkpointer is None
+    resumed = TensorChemTrainer(dataset, dict(params, resume=True))
+    assert (resumed.epoch, resumed.batches_done) == (1, 1)
+    history = resumed.fit(2)
+    assert history[-1]["train"]["samples"] == 4
+    assert resumed.scheduler.get_last_lr() == reference.scheduler.get_last_lr()
+    assert all(torch.equal(p0, p1) for p0, p1 in zip(reference.model.parameters(), resumed.model.parameters()))
+
+
+def distributed_worker(rank, world_size, port, tmp_path, dataset, hyper_params, extra_params):
+    os.environ.update({"MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port), "RANK": str(rank),
+                       "WORLD_SIZE": str(world_size)})
+    torch.manual_seed(rank)
+    trainer = TensorChemTrainer(dataset, dict(hyper_params, distributed=True, forces_key="forces",
+                                              validation_split=0.0, checkpoint_path=os.path.join(tmp_path, "model.pt"),
+                                              **extra_params))
+    history = trainer.fit(1)
+    torch.save({"params": [p.detach() for p in trainer.model.parameters()], "history": history},
+               os.path.join(tmp_path, f"rank{rank}.pt"))
+    torch.distributed.destroy_process_group()
+
+
+@pytest.mark.parametrize("extra_params", [{}, {"checkpoint_featurizer": True, "checkpoint_chunk_size": 2,
+                                               "memory_budget_mb": 1.0, "bytes_per_atom": 2 ** 17}])
+def test_distributed_TensorChemTrainer(tmp_path, extra_params, water_dataset, hyper_params):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    args = (2, port, str(tmp_path), water_dataset(), hyper_params, extra_params)
+    torch.multiprocessing.spawn(distributed_worker, args=args, nprocs=2)
+    rank0, rank1 = [torch.load(str(tmp_path / f"rank{rank}.pt")) for rank in range(2)]
+    assert all(torch.allclose(p0, p1) for p0, p1 in zip(rank0["params"], rank1["params"]))
+    # Each rank saw half of the 8 samples, the stats are summed over ranks
+    assert rank0["history"][0]["train"]["samples"] == 8
+    assert (tmp_path / "model.pt").exists()
@@ -0,0 +1,55 @@
+import torch
+
+from tensorchem.dataset.dataset import pad_collate
+from tensorchem.featurizers.util import dist_matrix_dense
+from tensorchem.molecules.transformations import random_rotations, center, apply_transformation, rotate_vectors, \
+    kabsch, align, rmsd, RandomRigidTransform
+
+generator = torch.Generator().manual_seed(0)
+coords = torch.randn(6, 5, 3, generator=generator)
+mask = torch.ones(6, 5, dtype=torch.bool)
+mask[:3, 4] = False
+coords[~mask] = 0.0
+
+
+def test_random_rotations():
+    rotations = random_rotations(100, generator=torch.Generator().manual_seed(1))
+    identity = torch.eye(3).expand(100, 3, 3)
+    assert torch.allclose(torch.bmm(rotations, rotations.transpose(-1, -2)), identity, atol=1e-5)
+    assert torch.allclose(torch.linalg.det(rotations), torch.ones(100), atol=1e-5)
+
+
+def test_apply_transformation():
+    rotations = random_rotations(6, generator=torch.Generator().manual_seed(2))
+    centered, centroids = center(coords, mask)
+    assert torch.allclose(centered[mask].reshape(-1, 3)[:4].mean(0), torch.zeros(3), atol=1e-6)
+    moved = apply_transformation(centered, rotations, torch.ones(6, 3), mask)
+    assert torch.all(moved[~mask] == 0.0)
+    assert torch.allclose(dist_matrix_dense(moved[3:]), dist_matrix_dense(coords[3:]), atol=1e-5)
+    dipoles = torch.randn(6, 3)
+    assert torch.allclose(rotate_vectors(dipoles, rotations), torch.bmm(rotations, dipoles.unsqueeze(-1)).squeeze(-1))
+
+
+def test_kabsch_align():
+    rotations = random_rotations(6, generator=torch.Generator().manual_seed(3))
+    moved = apply_transformation(coords, rotations, torch.randn(6, 3), mask)
+    assert torch.allclose(torch.bmm(kabsch(moved, coords, mask), rotations), torch.eye(3).expand(6, 3, 3), atol=1e-4)
+    aligned, _ = align(moved, coords, mask)
+    assert torch.all(rmsd(aligned, coords, mask) < 1e-4)
+    # A mirror image is aligned with a proper rotation, never a reflection
+    _, mirror_rotations = align(coords * torch.tensor([-1.0, 1.0, 1.0]), coords, mask)
+    assert torch.allclose(torch.linalg.det(mirror_rotations), torch.ones(6), atol=1e-5)
+
+
+def test_RandomRigidTransform():
+    transform = RandomRigidTransform(vector_keys=["forces"], generator=torch.Generator().manual_seed(4))
+    items = [{"atomic_numbers": torch.tensor([8.0, 1.0, 1.0]), "coordinates": torch.randn(3, 3),
+              "forces": torch.randn(3, 3), "energy": torch.tensor([-76.0])} for _ in range(2)]
+    item = transform(items[0])
+    assert torch.allclose(dist_matrix_dense(item["coordinates"]), dist_matrix_dense(items[0]["coordinates"]),
+                          atol=1e-5)
+    assert torch.allclose(item["coordinates"].mean(0), items[0]["coordinates"].mean(0), atol=1e-5)
+    assert torch.equal(item["energy"], items[0]["energy"]) and item["energy"].shape == (1,)
+    batch = transform(pad_collate(items[:1] + [dict(items[1], atomic_numbers=torch.tensor([8.0, 1.0, 0.0]))]))
+    assert torch.all(batch["coordinates"][1, 2] == 0.0)
+    assert torch.allclose(batch["forces"].norm(dim=-1), pad_collate(items)["forces"].norm(dim=-1), atol=1e-5)